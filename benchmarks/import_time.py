@@ -0,0 +1,92 @@
+"""
+Import time of the entry point and evaluation modules.
+
+Every module is imported in a fresh interpreter (so nothing is cached from earlier
+imports) and the heavy optional dependencies it pulled in are listed. Only the plotting
+modules should load matplotlib or seaborn, and scipy should only be loaded once a
+metric is computed.
+
+Usage (from the repository root):
+    python benchmarks/import_time.py [--repeat 5] [--check]
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+PACKAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "research_case_agent_modeling")
+EVALUATIONS_DIR = os.path.join(PACKAGE_DIR, "Evaluations")
+
+HEAVY_DEPENDENCIES = ["matplotlib", "seaborn", "scipy", "statsmodels"]
+
+# Module -> heavy dependencies it is allowed to load at import time
+MODULES = {
+    "cli": [],
+    "main": [],
+    "llms_tuning.generation_engine": [],
+    "llms_tuning.llm_workflow": [],
+    "response_parser": [],
+    "response_store": [],
+    "group_runner": [],
+    "metric_engine": [],
+    "eval_main": [],
+    "stats_eval": [],
+    "sub_obj_eval": [],
+    "model_comparison": [],
+    "bootstrap": [],
+    "streaming_eval": [],
+    "error_analysis": [],
+    "eval_plots": [],
+    "plot_pipeline": ["matplotlib"],
+}
+
+PROBE = """
+import sys, time, json
+sys.path[:0] = {paths!r}
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps([elapsed, [name for name in {heavy!r} if name in sys.modules]]))
+"""
+
+
+def time_import(module, repeat):
+    """
+    Median import time in seconds and the heavy dependencies loaded by the import.
+    """
+    code = PROBE.format(paths=[PACKAGE_DIR, EVALUATIONS_DIR], module=module, heavy=HEAVY_DEPENDENCIES)
+    timings = []
+    loaded = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        elapsed, loaded = json.loads(result.stdout.strip().splitlines()[-1])
+        timings.append(elapsed)
+    return statistics.median(timings), loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per module")
+    parser.add_argument("--check", action="store_true",
+                        help="Exit with an error if a module loads a heavy dependency it should not")
+    args = parser.parse_args()
+
+    failures = []
+    print(f"{'module':32} {'import (ms)':>12}  heavy dependencies")
+    for module, allowed in MODULES.items():
+        elapsed, loaded = time_import(module, args.repeat)
+        unexpected = [name for name in loaded if name not in allowed]
+        if unexpected:
+            failures.append(f"{module} imports {', '.join(unexpected)}")
+        print(f"{module:32} {elapsed * 1000:12.1f}  {', '.join(loaded) or '-'}")
+
+    if failures:
+        print("\n" + "\n".join(failures))
+        if args.check:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
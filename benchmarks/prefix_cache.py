@@ -0,0 +1,116 @@
+"""
+Prefix cache reuse of the generation order against local stub servers.
+
+Generates answers for the persona prompts of data/2_personas with synthetic questions
+against stub endpoints (llms_tuning/stub_server.py) that simulate a prefix (KV) cache:
+prompt tokens that are not in the cache cost `--prefill-delay` seconds each. For every
+setup the share of prompt tokens found in the cache and the wall time are reported:
+    run order      all questions of run 1, then of run 2, ... (the previous order)
+    prefix order   all runs of question 1, then of question 2, ...
+With several endpoints, the prefix order also keeps each persona on one endpoint.
+
+Usage (from the repository root):
+    python benchmarks/prefix_cache.py [--personas 3] [--questions 20] [--runs 10] [--endpoints 2]
+"""
+import os
+import io
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import contextlib
+
+REPOSITORY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(os.path.join(REPOSITORY_DIR, "src", "research_case_agent_modeling"))
+
+from llms_tuning.llm_workflow import CustomLLM
+from llms_tuning.generation_engine import GenerationEngine
+from llms_tuning.endpoint_scheduler import EndpointScheduler, build_endpoints
+from llms_tuning.stub_server import start_stub_server
+
+PERSONAS_FILE = os.path.join(REPOSITORY_DIR, "data", "2_personas", "LLM_persona_prompts.json")
+
+WORDS = ("people government trust economy country future family community society rights "
+         "security climate freedom work education health media election policy neighbours").split()
+LABELS = ["Agree completely", "Agree to some extent", "Neither agree nor disagree", "Disagree to some extent",
+          "Disagree completely", "Don't know"]
+
+
+def write_questions(path, count, rng):
+    """
+    A questions CSV in the format of `prepare_prompt_data` with survey-like question lengths.
+    """
+    with open(path, "w") as f:
+        f.write("Custom_variable_name,Text,Characteristic,Value_labels\n")
+        for i in range(count):
+            text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 40)))
+            f.write(f'F1A{i + 1}_1,How much do you agree: {text}?,"1,2,3,4,5,6","{",".join(LABELS)}"\n')
+
+
+def run_setup(personas, questions_file, runs, endpoint_count, prefix_order, args):
+    servers = [start_stub_server(delay=args.delay, prefill_delay=args.prefill_delay, cache_slots=args.cache_slots)
+               for _ in range(endpoint_count)]
+    urls = [f"http://127.0.0.1:{server.server_port}/api/generate" for server in servers]
+    llm = CustomLLM(model="stub", api_url=urls[0], pool_size=args.concurrency + 1)
+    llm.load_prompt_data(questions_file)
+
+    scheduler = None
+    if endpoint_count > 1:
+        scheduler = EndpointScheduler(build_endpoints(llm, [{"url": url, "max_concurrency": args.concurrency}
+                                                            for url in urls]),
+                                      affinity_slack=1.0 if prefix_order else None)
+    engine = GenerationEngine(llm, max_in_flight=args.concurrency, fsync=False, scheduler=scheduler,
+                              prefix_order=prefix_order)
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            engine.run(personas, runs, output_dir + "/")
+        elapsed = time.perf_counter() - start
+    if scheduler is not None:
+        scheduler.close()
+
+    handlers = [server.RequestHandlerClass for server in servers]
+    prompt_tokens = sum(handler.prompt_tokens for handler in handlers)
+    cached_tokens = sum(handler.cached_tokens for handler in handlers)
+    requests = sum(handler.requests_served for handler in handlers)
+    for server in servers:
+        server.shutdown()
+    return elapsed, cached_tokens / prompt_tokens, (prompt_tokens - cached_tokens) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--personas", type=int, default=3)
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--endpoints", type=int, default=2, help="Endpoints of the multi-endpoint setups")
+    parser.add_argument("--concurrency", type=int, default=4, help="Requests in flight per endpoint")
+    parser.add_argument("--cache-slots", type=int, default=4, help="Prompts kept in each server's prefix cache")
+    parser.add_argument("--delay", type=float, default=0.005, help="Seconds per request")
+    parser.add_argument("--prefill-delay", type=float, default=0.0005, help="Seconds per uncached prompt token")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    with open(PERSONAS_FILE, "r") as f:
+        personas = json.load(f)[:args.personas]
+
+    with tempfile.TemporaryDirectory() as directory:
+        questions_file = os.path.join(directory, "questions.csv")
+        write_questions(questions_file, args.questions, rng)
+
+        print(f"{args.personas} personas x {args.runs} runs x {args.questions} questions, "
+              f"{args.concurrency} requests in flight per endpoint\n")
+        print(f"{'setup':28} {'time (s)':>9} {'cached tokens':>14} {'evaluated per request':>22}")
+        for endpoint_count in sorted({1, args.endpoints}):
+            for prefix_order in (False, True):
+                elapsed, hit_rate, evaluated = run_setup(personas, questions_file, args.runs, endpoint_count,
+                                                         prefix_order, args)
+                setup = f"{'prefix' if prefix_order else 'run'} order, {endpoint_count} endpoint(s)"
+                print(f"{setup:28} {elapsed:9.2f} {hit_rate:14.1%} {evaluated:22.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+Timings of the response parsing, the evaluations and the plots on synthetic data.
+
+Every case runs on a dataset of `synthetic_data.py` at the selected scale and is
+compared with the timing recorded in baselines.json for that scale. A case is a
+regression if its median is more than `--threshold` (a share, 0.25 = 25%) slower than
+its baseline. Baselines depend on the machine, so record them on the machine that
+runs the checks.
+
+Usage (from the repository root):
+    python benchmarks/run_benchmarks.py [--scale small] [--cases parse_responses sta_eval] [--repeat 3]
+    python benchmarks/run_benchmarks.py --record     # store the timings as the new baselines
+    python benchmarks/run_benchmarks.py --check      # exit with an error on a regression
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+EVALUATIONS_DIR = os.path.join(BENCHMARKS_DIR, "..", "src", "research_case_agent_modeling", "Evaluations")
+BASELINES_FILE = os.path.join(BENCHMARKS_DIR, "baselines.json")
+sys.path.append(EVALUATIONS_DIR)
+
+from synthetic_data import generate_dataset
+
+# Dataset sizes; "medium" is about the size of the real survey and model outputs
+SCALES = {
+    "small": {"respondents": 1000, "groups": 5, "runs": 20, "questions": 40},
+    "medium": {"respondents": 3000, "groups": 30, "runs": 50, "questions": 130},
+    "large": {"respondents": 20000, "groups": 120, "runs": 100, "questions": 260},
+}
+
+
+def load_raw_responses(dataset):
+    """
+    Raw answers of all groups as one questions x (group, run) frame.
+    """
+    import pandas as pd
+    from response_store import response_file_path
+
+    frames = []
+    for group in dataset["group_conditions"]:
+        with open(response_file_path(dataset["model_dir"], group, dataset["num_runs"]), 'r') as f:
+            frames.append(pd.DataFrame(json.load(f)))
+    return pd.concat(frames, axis=1, keys=list(dataset["group_conditions"]))
+
+
+def bench_extract(dataset, max_workers):
+    """
+    `extract_numerical_value` applied to every answer, as in the original evaluation loop.
+    """
+    from eval_main import extract_numerical_value
+
+    raw = load_raw_responses(dataset)
+    return lambda: raw.map(extract_numerical_value)
+
+
+def bench_parse(dataset, max_workers):
+    """
+    The vectorized parser used by the response store.
+    """
+    from response_parser import parse_responses
+
+    raw = load_raw_responses(dataset)
+    return lambda: parse_responses(raw)
+
+
+def bench_ingest(dataset, max_workers):
+    """
+    First ingestion of all response files into the parsed store.
+    """
+    from response_store import load_model_store, CACHE_DIR, _loaded_stores
+
+    def run():
+        shutil.rmtree(CACHE_DIR, ignore_errors=True)
+        _loaded_stores.clear()
+        load_model_store(dataset["model_dir"])
+    return run
+
+
+def bench_sta_eval(dataset, max_workers):
+    """
+    Chi-Square, JS divergence and Spearman correlation of all groups (`stats_eval.sta_eval`).
+    """
+    from stats_eval import sta_eval
+    from response_store import load_model_store
+
+    load_model_store(dataset["model_dir"])
+    return lambda: sta_eval(dataset["survey_file"], dataset["group_conditions"], [], model_dir=dataset["model_dir"],
+                            max_workers=max_workers, output_file="all_evals.csv", incremental=False,
+                            num_runs=dataset["num_runs"])
+
+
+def bench_evaluate_responses(dataset, max_workers):
+    """
+    Accuracy, weighted alignment and rank correlation of all groups (`sub_obj_eval.evaluate_responses`).
+    """
+    from sub_obj_eval import evaluate_responses
+    from response_store import load_model_store
+
+    load_model_store(dataset["model_dir"])
+    return lambda: evaluate_responses(model_dir=dataset["model_dir"], max_workers=max_workers, incremental=False,
+                                      survey_file=dataset["survey_file"], group_conditions=dataset["group_conditions"],
+                                      excluded_questions=[], output_file="all_metrics.csv",
+                                      num_runs=dataset["num_runs"])
+
+
+def bench_plots(dataset, max_workers):
+    """
+    Standard deviation, box and combined box plots of all groups (`plot_pipeline.render_all`).
+    """
+    from plot_pipeline import render_all
+    from response_store import load_model_store
+
+    load_model_store(dataset["model_dir"])
+    return lambda: render_all(["std_model", "box_model", "combined"], dataset["group_conditions"],
+                              num_runs=dataset["num_runs"], model_dir=dataset["model_dir"], specific_questions=[],
+                              max_workers=max_workers, survey_file=dataset["survey_file"], excluded_questions=[])
+
+
+# Case name -> function that prepares the case and returns the callable to time
+CASES = {
+    "extract_numerical_value": bench_extract,
+    "parse_responses": bench_parse,
+    "ingest": bench_ingest,
+    "sta_eval": bench_sta_eval,
+    "evaluate_responses": bench_evaluate_responses,
+    "plots": bench_plots,
+}
+
+
+def time_case(run, repeat):
+    """
+    Median wall time in seconds of `repeat` calls.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def machine_description():
+    return f"{platform.platform()}, {platform.processor() or platform.machine()}, {os.cpu_count()} CPUs, Python {platform.python_version()}"
+
+
+def load_baselines():
+    if not os.path.exists(BASELINES_FILE):
+        return {}
+    with open(BASELINES_FILE, 'r') as f:
+        return json.load(f)
+
+
+def run_benchmarks(scale="small", cases=None, repeat=3, max_workers=1, data_dir=None, seed=0):
+    """
+    Times the selected cases on a synthetic dataset of the given scale.
+
+    Args:
+        scale (str): Key of SCALES.
+        cases (list, optional): Keys of CASES; all if None.
+        repeat (int): Calls per case; the median is reported.
+        max_workers (int): Processes of the group evaluations and plots.
+        data_dir (str, optional): Directory in which the dataset is generated and kept; a
+            temporary directory (removed afterwards) if None.
+
+    Returns:
+        dict: Median seconds per case.
+    """
+    cases = list(CASES) if cases is None else list(cases)
+    unknown = [case for case in cases if case not in CASES]
+    if unknown:
+        raise ValueError(f"Unknown cases {unknown}, choose from {list(CASES)}")
+
+    temporary = data_dir is None
+    data_dir = tempfile.mkdtemp(prefix="rcam-bench-") if temporary else os.path.abspath(data_dir)
+    cwd = os.getcwd()
+    try:
+        start = time.perf_counter()
+        dataset = generate_dataset(data_dir, **SCALES[scale], seed=seed)
+        print(f"Generated the {scale} dataset {SCALES[scale]} in {time.perf_counter() - start:.1f}s")
+
+        # The evaluation modules resolve ../Research_Case_Agent_Modeling/data/... from here
+        os.chdir(dataset["project_dir"])
+        results = {}
+        for case in cases:
+            run = CASES[case](dataset, max_workers)
+            results[case] = time_case(run, repeat)
+        return results
+    finally:
+        os.chdir(cwd)
+        if temporary:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scale", choices=list(SCALES), default="small")
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), help="Cases to run; all by default")
+    parser.add_argument("--repeat", type=int, default=3, help="Calls per case; the median is reported")
+    parser.add_argument("--max-workers", type=int, default=1, help="Processes of the evaluations and plots")
+    parser.add_argument("--data-dir", help="Keep the synthetic dataset in this directory")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Allowed slowdown against the baseline as a share (default 0.25 = 25%%)")
+    parser.add_argument("--record", action="store_true", help="Store the timings in baselines.json")
+    parser.add_argument("--check", action="store_true", help="Exit with an error if a case regressed")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.scale, args.cases, args.repeat, args.max_workers, args.data_dir)
+
+    baselines = load_baselines()
+    recorded = baselines.get(args.scale, {}).get("cases", {})
+    regressions = []
+    print(f"\n{'case':24} {'median (s)':>11} {'baseline (s)':>13} {'change':>8}")
+    for case, seconds in results.items():
+        baseline = recorded.get(case)
+        if baseline is None:
+            print(f"{case:24} {seconds:11.3f} {'-':>13} {'-':>8}")
+            continue
+        change = seconds / baseline - 1
+        flag = ""
+        if change > args.threshold:
+            regressions.append(f"{case} is {change:.0%} slower than its baseline ({seconds:.3f}s vs {baseline:.3f}s)")
+            flag = "  REGRESSION"
+        print(f"{case:24} {seconds:11.3f} {baseline:13.3f} {change:+8.0%}{flag}")
+
+    if args.record:
+        entry = baselines.setdefault(args.scale, {})
+        entry.update({"dataset": SCALES[args.scale], "machine": machine_description(),
+                      "max_workers": args.max_workers, "repeat": args.repeat})
+        entry.setdefault("cases", {}).update({case: round(seconds, 4) for case, seconds in results.items()})
+        with open(BASELINES_FILE, 'w') as f:
+            json.dump(baselines, f, indent=4)
+            f.write("\n")
+        print(f"\nRecorded the {args.scale} baselines in {BASELINES_FILE}")
+
+    if regressions:
+        print("\n" + "\n".join(regressions))
+        if args.check:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
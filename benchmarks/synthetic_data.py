@@ -0,0 +1,184 @@
+"""
+Synthetic survey and model response data at a configurable scale.
+
+Writes the same layout as the real data below a project directory:
+    Research_Case_Agent_Modeling/data/1_combined_preprocess/9_processed_data_for_personas_Format_1.csv
+    Research_Case_Agent_Modeling/data/3_responces/<model_dir>/{group}_{runs}_LLM_Output.json
+
+The evaluation modules resolve their paths as ../Research_Case_Agent_Modeling/data/...,
+so they run on the synthetic data with the project directory as working directory.
+
+Usage (from the repository root):
+    python benchmarks/synthetic_data.py OUTPUT_DIR [--respondents 3000] [--groups 30] [--runs 50] [--questions 130]
+"""
+import os
+import sys
+import json
+import argparse
+import itertools
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "research_case_agent_modeling", "Evaluations"))
+
+from group_index import GROUP_DEFINITIONS
+
+PROJECT_NAME = "Research_Case_Agent_Modeling"
+SURVEY_FILE = "data/1_combined_preprocess/9_processed_data_for_personas_Format_1.csv"
+RESPONSES_DIR = "data/3_responces"
+MODEL_DIR = "3_responses_synthetic"
+
+# Attribute columns of the group definitions and the values respondents are drawn from
+ATTRIBUTE_VALUES = {
+    "F7lA1": [1, 2, 3, 4, 5, 6],
+    "F7n": [1, 2, 3, 4, 5, 8],
+    "F6mA1_1": list(range(1, 12)),
+    "einkommen": [1, 2, 3, 4, 5, 6],
+    "F7g": list(range(1, 9)),
+    "F7h": list(range(1, 8)),
+}
+
+# Answer formats seen in the model outputs; together they reach every rule of
+# `extract_numerical_value`. {n} is the chosen option, {m} another option.
+RESPONSE_TEMPLATES = [
+    "{n}: {label}",
+    "I would choose:\n\n{n}: {label}",
+    "{n}",
+    "Category {n}",
+    "Option {n}",
+    "As a member of my community I would say {n} out of {k}.",
+    "{n}: {label} or maybe {m}: Other",
+    "I am not able to answer this question.",
+]
+TEMPLATE_WEIGHTS = [0.45, 0.2, 0.12, 0.05, 0.05, 0.06, 0.04, 0.03]
+
+
+def question_names(count):
+    """
+    Survey-like question ids: F1A1_1, F1A2_1, ...
+    """
+    return [f"F1A{i}_1" for i in range(1, count + 1)]
+
+
+def synthetic_groups(count):
+    """
+    `count` group conditions: the real groups first, then generated ones.
+
+    Generated groups combine religion, ethnicity and political view like the real
+    three-attribute groups, e.g. Synthetic_31 = {"F7lA1": 1, "F7n": 1, "F6mA1_1": 1}.
+    """
+    groups = dict(itertools.islice(GROUP_DEFINITIONS.items(), count))
+    combinations = itertools.product(ATTRIBUTE_VALUES["F7lA1"], ATTRIBUTE_VALUES["F7n"], ATTRIBUTE_VALUES["F6mA1_1"])
+    for religion, ethnicity, view in combinations:
+        if len(groups) >= count:
+            break
+        groups[f"Synthetic_{len(groups) + 1}"] = {"F7lA1": religion, "F7n": ethnicity, "F6mA1_1": view}
+    if len(groups) < count:
+        raise ValueError(f"At most {len(groups)} synthetic groups are supported")
+    return groups
+
+
+def survey_frame(respondents, questions, option_counts, group_conditions, rng):
+    """
+    Survey answers (1 to the option count of each question, about 5% missing) and attributes.
+
+    Every group gets a block of respondents that match its condition, so that no group is
+    empty even when its attribute combination is rare.
+    """
+    answers = rng.integers(1, option_counts + 1, size=(respondents, len(questions))).astype(float)
+    answers[rng.random(answers.shape) < 0.05] = np.nan
+    survey = pd.DataFrame(answers, columns=questions)
+
+    for column, values in ATTRIBUTE_VALUES.items():
+        survey[column] = rng.choice(values, size=respondents)
+
+    block = max(1, respondents // (2 * max(1, len(group_conditions))))
+    for i, condition in enumerate(group_conditions.values()):
+        rows = slice(i * block, (i + 1) * block)
+        for column, value in condition.items():
+            survey.loc[rows, column] = value[0] if isinstance(value, list) else value
+    return survey
+
+
+def model_responses(runs, questions, option_counts, rng):
+    """
+    Raw answers of one group as {"Run_1": {question: text}, ...}.
+
+    Each question has a preferred option that most runs pick, like the low spread of
+    the real model answers.
+    """
+    preferred = rng.integers(1, option_counts + 1)
+    templates = rng.choice(len(RESPONSE_TEMPLATES), p=TEMPLATE_WEIGHTS, size=(runs, len(questions)))
+    jitter = rng.integers(-1, 2, size=(runs, len(questions)))
+    options = np.clip(preferred + jitter * (rng.random((runs, len(questions))) < 0.3), 1, option_counts)
+    others = rng.integers(1, option_counts + 1, size=(runs, len(questions)))
+
+    output = {}
+    for run in range(runs):
+        output[f"Run_{run + 1}"] = {
+            question: RESPONSE_TEMPLATES[templates[run, q]].format(
+                n=options[run, q], m=others[run, q], k=option_counts[q], label="Agree to some extent")
+            for q, question in enumerate(questions)
+        }
+    return output
+
+
+def generate_dataset(output_dir, respondents=3000, groups=30, runs=50, questions=130, model_dir=MODEL_DIR, seed=0):
+    """
+    Writes a survey CSV and one response file per group below `output_dir`.
+
+    Args:
+        output_dir (str): Directory that receives the Research_Case_Agent_Modeling project.
+        respondents (int): Rows of the survey.
+        groups (int): Number of groups (see `synthetic_groups`).
+        runs (int): Runs per group in the response files.
+        questions (int): Questions in the survey and the response files.
+        model_dir (str): Model directory below data/3_responces.
+        seed (int): Seed of the random generator; the same arguments give the same files.
+
+    Returns:
+        dict: "project_dir" (working directory for the evaluations), "survey_file" (relative
+        to it), "model_dir", "num_runs" and "group_conditions".
+    """
+    rng = np.random.default_rng(seed)
+    project_dir = os.path.join(output_dir, PROJECT_NAME)
+    names = question_names(questions)
+    option_counts = rng.integers(4, 12, size=questions)
+    group_conditions = synthetic_groups(groups)
+
+    survey_path = os.path.join(project_dir, SURVEY_FILE)
+    os.makedirs(os.path.dirname(survey_path), exist_ok=True)
+    survey_frame(respondents, names, option_counts, group_conditions, rng).to_csv(survey_path, index=False)
+
+    responses_path = os.path.join(project_dir, RESPONSES_DIR, model_dir)
+    os.makedirs(responses_path, exist_ok=True)
+    # The personas are also asked for their attributes, so the models answer every survey column
+    columns = names + list(ATTRIBUTE_VALUES)
+    column_options = np.concatenate([option_counts, [max(values) for values in ATTRIBUTE_VALUES.values()]])
+    for group in group_conditions:
+        with open(os.path.join(responses_path, f"{group}_{runs}_LLM_Output.json"), 'w') as f:
+            json.dump(model_responses(runs, columns, column_options, rng), f)
+
+    return {
+        "project_dir": project_dir,
+        "survey_file": f"../{PROJECT_NAME}/{SURVEY_FILE}",
+        "model_dir": model_dir,
+        "num_runs": runs,
+        "group_conditions": group_conditions,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("output_dir")
+    parser.add_argument("--respondents", type=int, default=3000)
+    parser.add_argument("--groups", type=int, default=30)
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--questions", type=int, default=130)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    dataset = generate_dataset(args.output_dir, args.respondents, args.groups, args.runs, args.questions,
+                               seed=args.seed)
+    print(f"Wrote {args.respondents} respondents and {args.groups} groups x {args.runs} runs x "
+          f"{args.questions} questions below {dataset['project_dir']}")
@@ -0,0 +1,166 @@
+import zlib
+import warnings
+import numpy as np
+import pandas as pd
+from response_store import load_model_store, RESPONSES_DIR, CACHE_DIR
+from metric_engine import (
+    normalize_rows, js_divergence_rows, chi_square_rows, row_means, spearman_rows, kendall_tau_b_rows
+)
+from group_index import GROUP_DEFINITIONS, EXCLUDED_QUESTIONS, select_group
+from group_runner import run_groups, load_group_inputs
+
+survey_file = "../Research_Case_Agent_Modeling/data/1_combined_preprocess/9_processed_data_for_personas_Format_1.csv"
+output_file = "../Research_Case_Agent_Modeling/data/4_stats/bootstrap_ci.csv"
+
+RESULT_COLUMNS = ["Group", "Question", "Metric", "Estimate", "CI Low", "CI High"]
+
+
+def one_hot_counts(units, questions, columns, n_units, n_questions, n_categories, weights=None):
+    """
+    Units x (questions * categories) table with a 1 (or the answer's weight) for every
+    answer a unit gave.
+
+    The count matrices of a bootstrap replicate are the product of its resampling weights
+    (how often each run or respondent was drawn) with this table.
+    """
+    table = np.zeros((n_units, n_questions, n_categories), dtype=np.float32)
+    np.add.at(table, (units, questions, columns), 1 if weights is None else weights)
+    return table.reshape(n_units, -1)
+
+
+def replicate_metrics(llm_counts, survey_counts, categories, survey_columns, common_questions):
+    """
+    Metrics for a stack of count matrices of shape (replicates, questions, categories).
+
+    The definitions follow `metric_engine.group_metrics` (chi-square, JS divergence,
+    Spearman) and `sub_obj_eval.calculate_rank_correlation` (Kendall's tau-b), except
+    that the Kendall mean skips questions whose tau is undefined.
+
+    Returns:
+        tuple: chi-square (replicates, questions), JS divergence (replicates, questions),
+        Spearman (replicates,) and Kendall (replicates,).
+    """
+    llm_counts = llm_counts.astype(float)
+    survey_counts = survey_counts.astype(float)
+
+    observed = normalize_rows(llm_counts)
+    expected = normalize_rows(survey_counts)
+    chi_stat, _ = chi_square_rows(observed, expected)
+    js = js_divergence_rows(llm_counts[..., survey_columns], expected[..., survey_columns])
+
+    llm_means = np.nan_to_num(row_means(llm_counts, categories))[..., common_questions]
+    survey_means = np.nan_to_num(row_means(survey_counts, categories))[..., common_questions]
+    spearman = spearman_rows(llm_means, survey_means)
+
+    # Kendall's tau-b only depends on the order of the frequencies, so the counts can be
+    # used instead of their ranks
+    shared = (survey_counts > 0) & (llm_counts > 0)
+    tau = np.where(shared.any(axis=-1), kendall_tau_b_rows(survey_counts, llm_counts, shared), np.nan)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        kendall = np.nanmean(tau, axis=-1)
+
+    return chi_stat, js, spearman, kendall
+
+
+def bootstrap_group(group, condition, survey_df, excluded_questions, model_dir, num_runs=50,
+                    n_boot=1000, confidence=0.95, seed=0, chunk_size=50, responses_dir=RESPONSES_DIR, cache_dir=CACHE_DIR):
+    """
+    Bootstrap confidence intervals of the metrics of one group.
+
+    Model runs and survey respondents are resampled with replacement. Every replicate is
+    a row of multinomial weights, so its count matrices are one matrix product with the
+    precomputed one-hot tables; replicates are processed in chunks of `chunk_size`.
+    Scored distributions have no runs to resample, so their intervals only reflect the
+    survey respondents.
+
+    Returns:
+        pd.DataFrame: Columns Group, Question (empty for group level metrics), Metric,
+        Estimate, CI Low and CI High.
+    """
+    llm_long, _, matching_questions = load_group_inputs(group, condition, survey_df, excluded_questions, model_dir,
+                                                        num_runs, responses_dir, cache_dir)
+    survey_wide = select_group(survey_df, condition, list(matching_questions))
+    survey_long = survey_wide.reset_index(drop=True).rename_axis("Respondent").reset_index().melt(
+        id_vars="Respondent", var_name="Question", value_name="Survey_Response").dropna()
+
+    # Questions and categories as in metric_engine.group_metrics
+    questions = pd.Index(sorted(survey_long["Question"].unique()))
+    survey_categories = pd.Index(sorted(survey_long["Survey_Response"].astype(float).unique()))
+    llm_long = llm_long[llm_long["Question"].isin(questions)]
+    categories = survey_categories.union(pd.Index(llm_long["Response"].astype(float).unique()))
+    survey_columns = categories.get_indexer(survey_categories)
+
+    runs, run_codes = np.unique(llm_long["Run"].astype(str), return_inverse=True)
+    llm_table = one_hot_counts(run_codes, questions.get_indexer(llm_long["Question"]),
+                               categories.get_indexer(llm_long["Response"].astype(float)),
+                               len(runs), len(questions), len(categories),
+                               llm_long["Weight"].to_numpy() if "Weight" in llm_long else None)
+    respondents = len(survey_wide)
+    survey_table = one_hot_counts(survey_long["Respondent"].to_numpy(), questions.get_indexer(survey_long["Question"]),
+                                  categories.get_indexer(survey_long["Survey_Response"].astype(float)),
+                                  respondents, len(questions), len(categories))
+    shape = (len(questions), len(categories))
+
+    # Spearman uses the questions the model answered, like the point estimate
+    common_questions = llm_table.reshape(len(runs), *shape).sum(axis=(0, 2)) > 0
+
+    def metrics(llm_weights, survey_weights):
+        llm_counts = (llm_weights @ llm_table).reshape(-1, *shape)
+        survey_counts = (survey_weights @ survey_table).reshape(-1, *shape)
+        return replicate_metrics(llm_counts, survey_counts, categories, survey_columns, common_questions)
+
+    estimate = metrics(np.ones((1, len(runs)), dtype=np.float32), np.ones((1, respondents), dtype=np.float32))
+
+    # The seed of a group does not depend on which other groups are evaluated
+    rng = np.random.default_rng([seed, zlib.crc32(group.encode("utf-8"))])
+    replicates = [[] for _ in estimate]
+    for start in range(0, n_boot, chunk_size):
+        size = min(chunk_size, n_boot - start)
+        llm_weights = rng.multinomial(len(runs), np.full(len(runs), 1 / len(runs)), size=size).astype(np.float32)
+        survey_weights = rng.multinomial(respondents, np.full(respondents, 1 / respondents), size=size).astype(np.float32)
+        for collected, values in zip(replicates, metrics(llm_weights, survey_weights)):
+            collected.append(values)
+    replicates = [np.concatenate(values) for values in replicates]
+
+    alpha = (1 - confidence) / 2
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        bounds = [np.nanquantile(values, [alpha, 1 - alpha], axis=0) for values in replicates]
+
+    # Per-question metrics only for questions the model answered, like all_evals_2.csv
+    rows = []
+    for metric, point, (low, high) in zip(["Chi-Square", "JS Divergence"], estimate[:2], bounds[:2]):
+        answered = common_questions
+        rows.append(pd.DataFrame({"Group": group, "Question": questions[answered], "Metric": metric,
+                                  "Estimate": point[0][answered], "CI Low": low[answered], "CI High": high[answered]}))
+    for metric, point, (low, high) in zip(["Spearman Correlation", "kendall tau Rank Correlation"], estimate[2:], bounds[2:]):
+        rows.append(pd.DataFrame({"Group": group, "Question": [None], "Metric": metric,
+                                  "Estimate": point, "CI Low": [low], "CI High": [high]}))
+    return pd.concat(rows, ignore_index=True)[RESULT_COLUMNS]
+
+
+def bootstrap_groups(survey_file=survey_file, group_conditions=GROUP_DEFINITIONS, excluded_questions=EXCLUDED_QUESTIONS,
+                     model_dir="3_responses_llama_3-1_8b", num_runs=50, n_boot=1000, confidence=0.95, seed=0,
+                     output_file=output_file, max_workers=None, responses_dir=RESPONSES_DIR, cache_dir=CACHE_DIR):
+    """
+    Bootstrap confidence intervals for all groups, written to `output_file`.
+
+    The responses are read from `responses_dir` through the parsed store in `cache_dir`.
+    """
+    survey_df = pd.read_csv(survey_file)
+    load_model_store(model_dir, responses_dir, cache_dir)
+    results = run_groups(bootstrap_group, group_conditions, max_workers,
+                         survey_df=survey_df, excluded_questions=excluded_questions, model_dir=model_dir,
+                         num_runs=num_runs, n_boot=n_boot, confidence=confidence, seed=seed,
+                         responses_dir=responses_dir, cache_dir=cache_dir)
+
+    results_df = pd.concat(results, ignore_index=True)
+    if output_file:
+        results_df.to_csv(output_file, index=False, float_format="%.6f")
+        print(f"Bootstrap confidence intervals saved to {output_file}")
+    return results_df
+
+
+if __name__ == "__main__":
+    bootstrap_groups()
@@ -1,22 +1,33 @@
 import pandas as pd
-import matplotlib.pyplot as plt
 import os
+from figures import reuse_figure, show_figure
+from eval_main import std_model_csv_path, std_survey_csv_path, STATS_DIR, PLOTS_DIR
 
-def error_analysis_and_plot(groups: list, mean: False):
+def error_analysis_and_plot(groups: list, mean: False, model_dir="3_responses_llama_3-1_8b", num_runs=50,
+                            stats_dir=STATS_DIR, plots_dir=PLOTS_DIR):
     """
     Perform error analysis by calculating the difference in standard deviations and mean between the survey file
     and comparison files for each column and plot the results.
 
+    The files are the ones written by `std_plot_survey` and by `std_plot_model` for `model_dir`
+    and `num_runs`; only the questions present in both are compared.
+
     Parameters:
         groups (list): List of group names to analyze.
+        model_dir (str): Directory of the model responses below data/3_responces.
+        num_runs (int): Number of runs of the model responses.
+        stats_dir (str): Directory of the standard deviation files.
+        plots_dir (str): Directory for the plots.
 
     Returns:
-        None
+        list: Paths of the written plots.
     """
+    import matplotlib.pyplot as plt
 
+    written = []
     for group in groups:
-        reference_file_path = f'../Research_Case_Agent_Modeling/data/4_stats/std_survey/standard_deviation_and_mean_{group}_survey.csv'
-        comparison_file_path = f'../Research_Case_Agent_Modeling/data/4_stats/std_3.1_8b_model/standard_deviation_mean_{group}_model_50.csv'
+        reference_file_path = std_survey_csv_path(group, stats_dir)
+        comparison_file_path = std_model_csv_path(group, num_runs, model_dir, stats_dir)
 
         if not os.path.exists(reference_file_path):
             print(f"Error: Missing reference file: {reference_file_path}")
@@ -25,11 +36,16 @@ def error_analysis_and_plot(groups: list, mean: False):
             print(f"Error: Missing comparison file: {comparison_file_path}")
             continue
 
+        # The survey also has attribute columns the model was not asked; compare the shared
+        # questions in survey order
         reference_data = pd.read_csv(reference_file_path)
         comparison_data = pd.read_csv(comparison_file_path)
-
-        if not reference_data['Variable'].equals(comparison_data['Variable']):
-            raise ValueError(f"Variable names do not match between reference and comparison files for {group}.")
+        comparison_data = comparison_data.set_index('Variable').reindex(reference_data['Variable']).reset_index()
+        shared = comparison_data['Standard_Deviation'].notna().to_numpy()
+        if not shared.any():
+            raise ValueError(f"No shared questions between reference and comparison files for {group}.")
+        reference_data = reference_data[shared].reset_index(drop=True)
+        comparison_data = comparison_data[shared].reset_index(drop=True)
 
         std_differences = pd.DataFrame({'Variable': reference_data['Variable']})
         mean_differences = pd.DataFrame({'Variable': reference_data['Variable']})
@@ -39,9 +55,9 @@ def error_analysis_and_plot(groups: list, mean: False):
 
 
         if mean:
-            output_plot_path = f'../Research_Case_Agent_Modeling/docs/plots/std_mean_diff/standard_deviation_and_mean_differences_{group}.png'
+            output_plot_path = os.path.join(plots_dir, 'std_mean_diff', f'standard_deviation_and_mean_differences_{group}.png')
         # Plot differences
-            plt.figure(figsize=(20, 6))
+            reuse_figure('error_analysis', (20, 6))
             for col in std_differences.columns[1:]:
                 plt.plot(std_differences['Variable'], std_differences[col], linestyle='-', marker='o', label=f'Std Diff - {col}')
 
@@ -55,12 +71,13 @@ def error_analysis_and_plot(groups: list, mean: False):
             plt.legend()
             plt.tight_layout()
             plt.savefig(output_plot_path)
-            plt.show()
+            show_figure()
+            written.append(output_plot_path)
 
         else: 
-            output_plot_path = f'../Research_Case_Agent_Modeling/docs/plots/std_diff/standard_deviation_differences_{group}.png'
+            output_plot_path = os.path.join(plots_dir, 'std_diff', f'standard_deviation_differences_{group}.png')
         # Plot differences
-            plt.figure(figsize=(20, 6))
+            reuse_figure('error_analysis', (20, 6))
             for col in std_differences.columns[1:]:
                 plt.plot(std_differences['Variable'], std_differences[col], linestyle='-', marker='o', label=f'Std Diff - {col}')
 
@@ -72,7 +89,10 @@ def error_analysis_and_plot(groups: list, mean: False):
             plt.legend()
             plt.tight_layout()
             plt.savefig(output_plot_path)
-            plt.show()
+            show_figure()
+            written.append(output_plot_path)
+
+    return written
 
 
 groups = [
@@ -83,4 +103,5 @@ groups = [
     "Orthodox_Christian_Hawaiian_Centrist", 'Christian_Catholic_Asian_Left', 'Jewish_White_50k_to_70k', 'Christian_Protestant_Asian_50k_to_70k', 'Christian_Protestant_Hawaiian_25k_to_49k', 'Orthodox_Christian_Hawaiian_25k_to_49k', 'Christian_Catholic_Asian_50k_to_70k', 'Christian_Protestant_Hispanic_Latino_50k_to_70k', 'Christian_Protestant_Hispanic_Latino_25k_to_49k', 'Jewish_White_with_Bachelor', 'Christian_Protestant_Asian_with_Bachelor', 'Christian_Protestant_Hawaiian_with_Upper_Secondary', 'Orthodox_Christian_Hawaiian_with_Upper_Secondary', 'Christian_Catholic_Asian_with_Bachelor', 'Christian_Protestant_Hispanic_Latino_with_Bachelor', 'Jewish_White_with_Full-Time_Job', 'Christian_Protestant_Hawaiian_Unemployed', 'Orthodox_Christian_Hawaiian_Unemployed'
 ]
 
-error_analysis_and_plot(groups, False)
+if __name__ == "__main__":
+    error_analysis_and_plot(groups, False)
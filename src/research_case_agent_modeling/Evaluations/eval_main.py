@@ -1,8 +1,14 @@
+import os
 import re
-import json
 import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
+from response_store import load_group_frame, RESPONSES_DIR, CACHE_DIR
+from group_index import select_group
+from eval_manifest import EvalManifest
+from figures import reuse_figure, show_figure
+
+# Output defaults, see response_store.RESPONSES_DIR
+STATS_DIR = '../Research_Case_Agent_Modeling/data/4_stats'
+PLOTS_DIR = '../Research_Case_Agent_Modeling/docs/plots'
 
 def extract_numerical_value(response):
     
@@ -37,10 +43,31 @@ def extract_numerical_value(response):
     return round(sum(numbers) / len(numbers)) if numbers else 0
 
 
+def std_model_csv_path(group_name, num_runs, model_dir, stats_dir=STATS_DIR):
+    """
+    Path of the standard deviation and mean of a group's model responses (see `std_plot_model`).
+    """
+    model = os.path.basename(os.path.normpath(model_dir))
+    return os.path.join(stats_dir, 'std_model', model, f'standard_deviation_mean_{group_name}_model_{num_runs}.csv')
+
+
+def std_survey_csv_path(group_name, stats_dir=STATS_DIR):
+    """
+    Path of the standard deviation and mean of a group's survey responses (see `std_plot_survey`).
+    """
+    return os.path.join(stats_dir, f"standard_deviation_and_mean_{group_name}_survey.csv")
+
+
 def std_plot_model(questions_file_path,
                    excluded_questions: None,
                    num_runs,
-                   groups
+                   groups,
+                   model_dir="3_responses_llama_3-1_8b",
+                   incremental=True,
+                   responses_dir=RESPONSES_DIR,
+                   cache_dir=CACHE_DIR,
+                   stats_dir=STATS_DIR,
+                   plots_dir=PLOTS_DIR
                    ):
     
     """
@@ -52,33 +79,51 @@ def std_plot_model(questions_file_path,
         excluded_questions (list): List of questions to exclude from the analysis.
         num_runs (int): Number of runs for the model (used for naming output files).
         group_name (str): Name of the group (used for naming output files).
+        model_dir (str): Directory of the model responses below data/3_responces.
+        incremental (bool): Skip groups whose outputs exist and whose inputs did not change.
+        responses_dir (str): Directory holding the model directories.
+        cache_dir (str): Directory of the parsed stores (see response_store).
+        stats_dir (str): Directory for the standard deviation files.
+        plots_dir (str): Directory for the plots, which go to std_model/<model> below it.
 
     Returns:
         pd.DataFrame: A DataFrame containing the numerical values extracted from the responses.
     """
+    import matplotlib.pyplot as plt
 
     questions_df = pd.read_csv(questions_file_path)
     all_questions = questions_df.columns.tolist()
+
+    # Outputs of each model go to their own directory, like the standard deviation files
+    model = os.path.basename(os.path.normpath(model_dir))
+    model_plots_dir = os.path.join(plots_dir, 'std_model', model)
+
+    if incremental:
+        manifest = EvalManifest(os.path.join(stats_dir, 'std_model', model, f'std_plot_model_{num_runs}.manifest.json'))
+        questions_hash = manifest.file_hash(questions_file_path)
+        fingerprints = {group_name: manifest.group_fingerprint(model_dir, group_name, condition, num_runs, responses_dir,
+                                                               questions=questions_hash,
+                                                               excluded_questions=sorted(set(excluded_questions or [])))
+                        for group_name, condition in groups.items()}
+        dirty = set(manifest.dirty_groups(fingerprints))
     
     for group_name,__ in groups.items():
 
-        model_responces_file_path = f'../Research_Case_Agent_Modeling/data/3_responces/3_responses_llama_3-1_8b/{group_name}_{num_runs}_LLM_Output.json'
+        csv_path = std_model_csv_path(group_name, num_runs, model_dir, stats_dir)
+        plot_path = os.path.join(model_plots_dir, f'standard_deviation_and_mean_{group_name}_model_{num_runs}.png')
+        if incremental and group_name not in dirty and os.path.exists(csv_path) and os.path.exists(plot_path):
+            continue
 
-        with open(model_responces_file_path, 'r') as f:
-                json_data = json.load(f)
+        # Questions asked in fewer runs (adaptive sampling, early stopping) only count their answered runs
+        df_numeric = load_group_frame(model_dir, group_name, num_runs, responses_dir=responses_dir, cache_dir=cache_dir,
+                                      skip_missing=True)
 
         if excluded_questions:
             included_questions = [q for q in all_questions if q not in excluded_questions]
 
-            data = pd.DataFrame(json_data)
-
-            data = data[data.index.isin(included_questions)]
-        else: 
-            data = pd.DataFrame(json_data)
-
-        df_numeric = data.map(extract_numerical_value)
+            df_numeric = df_numeric[df_numeric.index.isin(included_questions)]
 
-        df_numeric_cleaned = df_numeric.dropna()
+        df_numeric_cleaned = df_numeric.dropna(how="all")
 
         # Calculate the standard deviation and Mean
         std_dev = df_numeric_cleaned.std(axis=1)
@@ -92,11 +137,12 @@ def std_plot_model(questions_file_path,
         mean_dev_df.columns = ['Variable', 'Mean']
 
         combined_df = pd.merge(std_dev_df, mean_dev_df, on='Variable')
-        combined_df.to_csv(f'../Research_Case_Agent_Modeling/data/4_stats/standard_deviation_mean_{group_name}_model_{num_runs}.csv', index=False)
+        os.makedirs(os.path.dirname(csv_path), exist_ok=True)
+        combined_df.to_csv(csv_path, index=False)
 
 
         # Visualize the standard deviations and Mean
-        plt.figure(figsize=(20, 6))
+        reuse_figure('std_plot_model', (20, 6))
         plt.plot(combined_df['Variable'], combined_df['Standard_Deviation'], linestyle='-', marker='o', label='Standard Deviation')
         # plt.plot(combined_df['Variable'], combined_df['Mean'], linestyle='-', marker='x', label='Mean')
 
@@ -108,7 +154,11 @@ def std_plot_model(questions_file_path,
         plt.ylabel('Values')
         plt.tight_layout()
         plt.legend()
-        plt.savefig(f'../Research_Case_Agent_Modeling/docs/plots/standard_deviation_and_mean_{group_name}_model_{num_runs}.png')
+        os.makedirs(model_plots_dir, exist_ok=True)
+        plt.savefig(plot_path)
+
+    if incremental:
+        manifest.save(fingerprints)
 
 
 
@@ -136,7 +186,7 @@ def specific_question_data(df_numeric, specific_question):
         print(f"Question {specific_question} not found.")
 
 
-def std_plot_survey(file_path, excluded_questions=None, group_conditions=None):
+def std_plot_survey(file_path, excluded_questions=None, group_conditions=None, stats_dir=STATS_DIR, plots_dir=PLOTS_DIR):
     
     """
     Calculate and plot standard deviation for survey responses based on group conditions.
@@ -145,20 +195,23 @@ def std_plot_survey(file_path, excluded_questions=None, group_conditions=None):
         file_path (str): Path to the CSV file.
         excluded_questions (list): List of questions to exclude from the analysis.
         group_conditions (dict): Dictionary of group names and their filtering conditions.
-            Example: {"Group1": lambda data: (data['col1'] == value1) & (data['col2'] == value2)}
+            Example: {"Group1": {'col1': value1, 'col2': value2}} (see group_index.GROUP_DEFINITIONS)
+        stats_dir (str): Directory for the standard deviation files.
+        plots_dir (str): Directory for the plots.
     Returns:
         None
     """
+    import matplotlib.pyplot as plt
 
     data = pd.read_csv(file_path)
 
+    included_questions = None
     if excluded_questions:
         all_questions = data.columns.tolist()
         included_questions = [q for q in all_questions if q not in excluded_questions]
-        data = data[included_questions]
 
     for group_name, condition in group_conditions.items():
-        group_data = data[condition(data)]
+        group_data = select_group(data, condition, included_questions)
 
         group_numeric = group_data.apply(pd.to_numeric, errors='coerce')
 
@@ -174,10 +227,10 @@ def std_plot_survey(file_path, excluded_questions=None, group_conditions=None):
 
         # Merge standard deviation and mean
         combined_df = pd.merge(group_std_df, group_mean_df, on='Variable')
-        combined_df.to_csv(f"../Research_Case_Agent_Modeling/data/4_stats/standard_deviation_and_mean_{group_name}_survey.csv", index=False)
+        combined_df.to_csv(std_survey_csv_path(group_name, stats_dir), index=False)
 
         # Plot standard deviation and mean
-        plt.figure(figsize=(20, 6))
+        reuse_figure('std_plot_survey', (20, 6))
         plt.plot(combined_df['Variable'], combined_df['Standard_Deviation'], linestyle='-', marker='o', label='Standard Deviation')
         # plt.plot(combined_df['Variable'], combined_df['Mean'], linestyle='-', marker='x', label='Mean')
 
@@ -187,13 +240,17 @@ def std_plot_survey(file_path, excluded_questions=None, group_conditions=None):
         plt.ylabel('Values')
         plt.legend()
         plt.tight_layout()
-        plt.savefig(f"../Research_Case_Agent_Modeling/docs/plots/standard_deviation_{group_name}_survey_data.png")
-        plt.show()
+        plt.savefig(os.path.join(plots_dir, f"standard_deviation_{group_name}_survey_data.png"))
+        show_figure()
 
 def box_plot_model(questions_file_path,
                    excluded_questions: list = None,
                    num_runs: int = 1,
-                   groups: dict = {}):
+                   groups: dict = {},
+                   model_dir: str = "",
+                   responses_dir: str = RESPONSES_DIR,
+                   cache_dir: str = CACHE_DIR,
+                   plots_dir: str = PLOTS_DIR):
     """
     Calculate and plot the standard deviation of model responses for a specific group and number of runs,
     including a box plot of the questions' answers with a mean curve overlay.
@@ -203,27 +260,28 @@ def box_plot_model(questions_file_path,
         excluded_questions (list): List of questions to exclude from the analysis.
         num_runs (int): Number of runs for the model (used for naming output files).
         groups (dict): Dictionary mapping group names to relevant data.
+        model_dir (str): Directory of the model responses below data/3_responces.
+        responses_dir (str): Directory holding the model directories.
+        cache_dir (str): Directory of the parsed stores (see response_store).
+        plots_dir (str): Directory for the plots.
 
     Returns:
         None
     """
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
     questions_df = pd.read_csv(questions_file_path)
     all_questions = questions_df.columns.tolist()
     
     for group_name, _ in groups.items():
-        model_responses_file_path = f'../Research_Case_Agent_Modeling/data/3_responces/{group_name}_{num_runs}_LLM_Output.json'
-
-        with open(model_responses_file_path, 'r') as f:
-            json_data = json.load(f)
+        df_numeric = load_group_frame(model_dir, group_name, num_runs, responses_dir=responses_dir, cache_dir=cache_dir,
+                                      skip_missing=True)
 
         if excluded_questions:
             included_questions = [q for q in all_questions if q not in excluded_questions]
-            data = pd.DataFrame(json_data).loc[included_questions]
-        else:
-            data = pd.DataFrame(json_data)
-
-        df_numeric = data.applymap(extract_numerical_value)
-        df_numeric_cleaned = df_numeric.dropna()
+            df_numeric = df_numeric.loc[included_questions]
+        df_numeric_cleaned = df_numeric.dropna(how="all")
 
         std_dev = df_numeric_cleaned.std(axis=1)
         mean_dev = df_numeric_cleaned.mean(axis=1)
@@ -231,7 +289,7 @@ def box_plot_model(questions_file_path,
         combined_df = pd.DataFrame({'Variable': std_dev.index, 'Standard_Deviation': std_dev.values, 'Mean': mean_dev.values})
       
         # Box plot
-        plt.figure(figsize=(20, 6))
+        reuse_figure('box_plot_model', (20, 6))
         sns.boxplot(data=df_numeric_cleaned.T, whis=1.5)
         plt.plot(combined_df['Variable'], combined_df['Mean'], linestyle='-', marker='x', color='red', label='Mean')
         
@@ -241,10 +299,10 @@ def box_plot_model(questions_file_path,
         plt.ylabel('Response Values')
         plt.legend()
         plt.tight_layout()
-        plt.savefig(f'../Research_Case_Agent_Modeling/docs/plots/Box_plot_model/boxplot_mean_curve_{group_name}_model_{num_runs}.png')
-        plt.show()
+        plt.savefig(os.path.join(plots_dir, 'Box_plot_model', f'boxplot_mean_curve_{group_name}_model_{num_runs}.png'))
+        show_figure()
 
-def box_plot_survey(file_path, excluded_questions=None, group_conditions=None):
+def box_plot_survey(file_path, excluded_questions=None, group_conditions=None, plots_dir=PLOTS_DIR):
     """
     Calculate and plot a box plot for survey responses based on group conditions,
     with an overlaid mean curve.
@@ -253,19 +311,23 @@ def box_plot_survey(file_path, excluded_questions=None, group_conditions=None):
         file_path (str): Path to the CSV file.
         excluded_questions (list): List of questions to exclude from the analysis.
         group_conditions (dict): Dictionary of group names and their filtering conditions.
-            Example: {"Group1": lambda data: (data['col1'] == value1) & (data['col2'] == value2)}
+            Example: {"Group1": {'col1': value1, 'col2': value2}} (see group_index.GROUP_DEFINITIONS)
+        plots_dir (str): Directory for the plots.
     Returns:
         None
     """
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
     data = pd.read_csv(file_path)
 
+    included_questions = None
     if excluded_questions:
         all_questions = data.columns.tolist()
         included_questions = [q for q in all_questions if q not in excluded_questions]
-        data = data[included_questions]
 
     for group_name, condition in group_conditions.items():
-        group_data = data.loc[condition(data)]
+        group_data = select_group(data, condition, included_questions)
         group_numeric = group_data.apply(pd.to_numeric, errors='coerce')
         group_numeric_cleaned = group_numeric.dropna(axis=1, how='all')
 
@@ -275,7 +337,7 @@ def box_plot_survey(file_path, excluded_questions=None, group_conditions=None):
         combined_df = pd.DataFrame({'Variable': group_std.index, 'Standard_Deviation': group_std.values, 'Mean': group_mean.values})
 
         # Box plot with mean curve overlay
-        plt.figure(figsize=(20, 6))
+        reuse_figure('box_plot_survey', (20, 6))
         sns.boxplot(data=group_numeric_cleaned, whis=1.5)
         plt.plot(combined_df['Variable'], combined_df['Mean'], linestyle='-', marker='x', color='red', label='Mean')
 
@@ -285,11 +347,12 @@ def box_plot_survey(file_path, excluded_questions=None, group_conditions=None):
         plt.ylabel('Response Values')
         plt.legend()
         plt.tight_layout()
-        plt.savefig(f"../Research_Case_Agent_Modeling/docs/plots/Box_plot_survey/boxplot_mean_curve_{group_name}_survey_data.png")
-        plt.show()
+        plt.savefig(os.path.join(plots_dir, 'Box_plot_survey', f"boxplot_mean_curve_{group_name}_survey_data.png"))
+        show_figure()
 
 
-def combined_box_plot(questions_file_path, survey_file_path, excluded_questions=None, num_runs=50, group_conditions=None, specific_questions=None, mean=False, combined=False):
+def combined_box_plot(questions_file_path, survey_file_path, excluded_questions=None, num_runs=50, group_conditions=None, specific_questions=None, mean=False, combined=False, model_dir="",
+                      responses_dir=RESPONSES_DIR, cache_dir=CACHE_DIR, plots_dir=PLOTS_DIR):
     """
     Combines the model response and survey data into a single box plot with an overlaid mean curve.
     Also supports generating a box plot for specific questions.
@@ -302,10 +365,16 @@ def combined_box_plot(questions_file_path, survey_file_path, excluded_questions=
         num_runs (int): Number of runs for the model.
         group_conditions (dict): Dictionary mapping group names to filtering conditions for survey data.
         specific_questions (list): Specific questions to plot separately.
+        model_dir (str): Directory of the model responses below data/3_responces.
+        responses_dir (str): Directory holding the model directories.
+        cache_dir (str): Directory of the parsed stores (see response_store).
+        plots_dir (str): Directory for the plots.
 
     Returns:
         None
     """
+    import matplotlib.pyplot as plt
+    import seaborn as sns
 
     questions_df = pd.read_csv(questions_file_path)
     all_questions = questions_df.columns.tolist()
@@ -316,20 +385,16 @@ def combined_box_plot(questions_file_path, survey_file_path, excluded_questions=
         included_questions = all_questions
 
     survey_data = pd.read_csv(survey_file_path)
-    survey_data = survey_data[included_questions]
  
     for group_name, condition in group_conditions.items():
-        group_data = survey_data[condition(survey_data)]
+        group_data = select_group(survey_data, condition, included_questions)
         group_numeric = group_data.apply(pd.to_numeric, errors='coerce').dropna(axis=1, how='all')
 
-        model_responses_file_path = f'../Research_Case_Agent_Modeling/data/3_responces/{group_name}_{num_runs}_LLM_Output.json'
-        with open(model_responses_file_path, 'r') as f:
-            json_data = json.load(f)
-
-        model_data = pd.DataFrame(json_data).loc[included_questions].map(extract_numerical_value).dropna()
+        model_data = load_group_frame(model_dir, group_name, num_runs, responses_dir=responses_dir, cache_dir=cache_dir,
+                                      skip_missing=True).loc[included_questions].dropna(how="all")
 
         if combined:
-            plt.figure(figsize=(30, 20))
+            reuse_figure('combined_box_plot', (30, 20))
             
             sns.boxplot(data=group_numeric, whis=1.5, width=0.5, boxprops=dict(alpha=0.6), label=f'Survey {group_name}')
 
@@ -351,8 +416,8 @@ def combined_box_plot(questions_file_path, survey_file_path, excluded_questions=
                 plt.ylabel('Response Values')
                 plt.legend()
                 plt.tight_layout()
-                plt.savefig(f'../Research_Case_Agent_Modeling/docs/plots/combined_box_plot_mean/Combined_box_plot_with_mean_for_{group_name}.png')
-                plt.show()
+                plt.savefig(os.path.join(plots_dir, 'combined_box_plot_mean', f'Combined_box_plot_with_mean_for_{group_name}.png'))
+                show_figure()
             else:
 
                 plt.xticks(rotation=90)
@@ -361,14 +426,14 @@ def combined_box_plot(questions_file_path, survey_file_path, excluded_questions=
                 plt.ylabel('Response Values')
                 plt.legend()
                 plt.tight_layout()
-                plt.savefig(f'../Research_Case_Agent_Modeling/docs/plots/combined_box_plot/Combined_box_plot_for_{group_name}.png')
-                plt.show()
+                plt.savefig(os.path.join(plots_dir, 'combined_box_plot', f'Combined_box_plot_for_{group_name}.png'))
+                show_figure()
 
         if specific_questions:
             for question in specific_questions:
-                plt.figure(figsize=(20, 6))
+                reuse_figure('specific_question_box_plot', (20, 6))
 
-                if question in survey_data.columns:
+                if question in group_numeric.columns:
                     sns.boxplot(data=group_numeric[question], whis=1.5, width=0.5, boxprops=dict(alpha=0.6), color='purple', label=f'Survey ({group_name})')
 
                 if question in model_data.index:
@@ -379,5 +444,5 @@ def combined_box_plot(questions_file_path, survey_file_path, excluded_questions=
                 plt.ylabel('Values')
                 plt.legend()
                 plt.tight_layout()
-                plt.savefig(f'../Research_Case_Agent_Modeling/docs/plots/Box_plot_specific_questions/{group_name}_Specific_box_plot_{question}.png')
-                plt.show()
+                plt.savefig(os.path.join(plots_dir, 'Box_plot_specific_questions', f'{group_name}_Specific_box_plot_{question}.png'))
+                show_figure()
@@ -0,0 +1,168 @@
+import os
+import json
+import hashlib
+import tempfile
+import pandas as pd
+from response_store import group_source_path, RESPONSES_DIR
+
+
+def manifest_path_for(output_file):
+    """
+    Path of the manifest that belongs to an output file, e.g. all_evals_2.manifest.json.
+    """
+    return os.path.splitext(output_file)[0] + ".manifest.json"
+
+
+class EvalManifest:
+    """
+    Records which inputs every group of an evaluation output was computed from.
+
+    The manifest keeps one fingerprint per group (hash of its response file, the survey,
+    the excluded questions, its condition and the metric version) and the content hashes of
+    the input files. Hashes are only recomputed for files whose mtime or size changed.
+    """
+
+    def __init__(self, manifest_path):
+        self.manifest_path = manifest_path
+        self.files = {}
+        self.groups = {}
+        if os.path.exists(manifest_path):
+            try:
+                with open(manifest_path, 'r') as f:
+                    manifest = json.load(f)
+                self.files = manifest.get("files", {})
+                self.groups = manifest.get("groups", {})
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable manifest {manifest_path}: {e}")
+
+    def file_hash(self, file_path):
+        """
+        SHA-256 of a file's content, or None if the file does not exist.
+        """
+        if not os.path.exists(file_path):
+            return None
+        stat = os.stat(file_path)
+        signature = [stat.st_mtime_ns, stat.st_size]
+        cached = self.files.get(file_path)
+        if cached is not None and cached[:2] == signature:
+            return cached[2]
+
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        self.files[file_path] = signature + [digest.hexdigest()]
+        return digest.hexdigest()
+
+    def group_fingerprint(self, model_dir, group, condition, num_runs=50, responses_dir=RESPONSES_DIR, **inputs):
+        """
+        Fingerprint of everything a group's results depend on.
+
+        Args:
+            model_dir (str): Model directory of the responses.
+            group (str): Group name.
+            condition (dict or callable): Group definition. Lambda conditions cannot be
+                fingerprinted, so their groups are always recomputed (None is returned).
+            num_runs (int): Number of runs of the response file.
+            responses_dir (str): Directory holding the model directories.
+            **inputs: Further inputs, e.g. the survey hash or the excluded questions.
+        """
+        if callable(condition):
+            return None
+        parts = {
+            "responses": self.file_hash(group_source_path(model_dir, group, num_runs, responses_dir)),
+            "model_dir": model_dir,
+            "num_runs": num_runs,
+            "condition": condition,
+            **inputs,
+        }
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def dirty_groups(self, fingerprints):
+        """
+        Groups whose fingerprint is unknown or differs from the recorded one.
+        """
+        return [group for group, fingerprint in fingerprints.items()
+                if fingerprint is None or self.groups.get(group) != fingerprint]
+
+    def save(self, fingerprints):
+        """
+        Records the fingerprints of the groups in the current output and writes the manifest.
+        """
+        self.groups = {group: fingerprint for group, fingerprint in fingerprints.items() if fingerprint is not None}
+        directory = os.path.dirname(self.manifest_path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, 'w') as f:
+            json.dump({"files": self.files, "groups": self.groups}, f, indent=4)
+        os.replace(temp_path, self.manifest_path)
+
+
+def plan_incremental_run(output_file, group_conditions, model_dir, num_runs=50, input_files=(),
+                         responses_dir=RESPONSES_DIR, **inputs):
+    """
+    Works out which groups of an output have to be recomputed.
+
+    Args:
+        output_file (str): The evaluation output, e.g. all_evals_2.csv.
+        group_conditions (dict): Group names and their conditions.
+        model_dir (str): Model directory of the responses.
+        num_runs (int): Number of runs of the response files.
+        input_files (list): Files every group depends on, e.g. the survey CSV.
+        responses_dir (str): Directory holding the model directories.
+        **inputs: Other values the results depend on, e.g. the excluded questions.
+
+    Returns:
+        tuple: (manifest, fingerprints per group, previous rows or None, dirty groups).
+    """
+    manifest = EvalManifest(manifest_path_for(output_file))
+    inputs["input_files"] = {file_path: manifest.file_hash(file_path) for file_path in input_files}
+    fingerprints = {group: manifest.group_fingerprint(model_dir, group, condition, num_runs, responses_dir, **inputs)
+                    for group, condition in group_conditions.items()}
+    previous = read_previous_results(output_file, manifest)
+    dirty = list(group_conditions) if previous is None else manifest.dirty_groups(fingerprints)
+    return manifest, fingerprints, previous, dirty
+
+
+def read_previous_results(output_file, manifest, key_column="Group"):
+    """
+    Rows of an existing output file, or None if it has to be rebuilt completely.
+
+    The output is only trusted if the manifest knows all groups that are in it.
+    """
+    if not manifest.groups or not os.path.exists(output_file):
+        return None
+    try:
+        previous = pd.read_csv(output_file, float_precision="round_trip")
+    except (OSError, ValueError, pd.errors.EmptyDataError):
+        return None
+    if key_column not in previous.columns or not set(previous[key_column]).issubset(manifest.groups):
+        return None
+    return previous
+
+
+def splice_results(previous, fresh, recomputed, groups, key_column="Group"):
+    """
+    Replaces the rows of the recomputed groups in the previous results.
+
+    Args:
+        previous (pd.DataFrame or None): Rows of the existing output.
+        fresh (pd.DataFrame): Rows of the groups that were recomputed.
+        recomputed (list): Groups that were recomputed (they may have no rows at all).
+        groups (list): All groups of the output, in output order.
+
+    Returns:
+        pd.DataFrame: Rows of every group in `groups`, in that order.
+    """
+    parts = [fresh]
+    if previous is not None:
+        parts.insert(0, previous[~previous[key_column].isin(recomputed)])
+    non_empty = [part for part in parts if len(part)]
+    combined = pd.concat(non_empty, ignore_index=True) if non_empty else fresh
+    if key_column not in combined.columns:
+        return combined
+
+    order = {group: i for i, group in enumerate(groups)}
+    combined = combined[combined[key_column].isin(order)]
+    combined = combined.sort_values(key_column, key=lambda column: column.map(order), kind="stable")
+    return combined.reset_index(drop=True)
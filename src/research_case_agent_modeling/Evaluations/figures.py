@@ -0,0 +1,28 @@
+# matplotlib is imported on first use, so that importing the plotting modules stays cheap
+
+# Backends that render to files only; plt.show() has nothing to display with them
+NON_INTERACTIVE_BACKENDS = {"agg", "cairo", "pdf", "pgf", "ps", "svg", "template"}
+
+
+def reuse_figure(name, figsize):
+    """
+    Returns the figure `name` cleared for a new plot, creating it on first use.
+
+    Every group of a plot type is drawn into the same figure object instead of a new
+    figure per group, so rendering many groups does not pile up open figures.
+    """
+    import matplotlib.pyplot as plt
+
+    return plt.figure(num=name, figsize=figsize, clear=True)
+
+
+def show_figure():
+    """
+    Shows the current figure in interactive sessions; does nothing with a
+    non-interactive backend such as Agg (see plot_pipeline.py).
+    """
+    import matplotlib
+    import matplotlib.pyplot as plt
+
+    if matplotlib.get_backend().lower() not in NON_INTERACTIVE_BACKENDS:
+        plt.show()
@@ -0,0 +1,134 @@
+import numpy as np
+from collections import OrderedDict
+
+# Questions left out of every evaluation and plot
+EXCLUDED_QUESTIONS = ['F2', 'F7cA1', 'F7c', 'F7cA1', 'F7jA1', 'F7kA1', 'F7a', 'F6a_RepPartyA2', 'F6a_DemPartyA2', 'F6b_RepPartyA2', 'F6b_DemPartyA2','F6b_DemPartyA1', 'F6b_RepPartyA1', 'F7i', 'F3B1', 'F3B2', 'F3B3', 'F3_USA', 'F3_CHINA', 'F3_Deutschland', 'F3_Russland', 'F3_Ukraine', 'F3_EU', 'F3_NATO']
+
+# Survey groups as column -> value predicates. A value may also be a list of accepted values.
+#   F7lA1:     religion (1 Catholic, 2 Protestant, 3 Orthodox, 4 Jewish)
+#   F7n:       ethnicity (1 White, 2 Hispanic/Latino, 4 Asian, 8 Native Hawaiian)
+#   F6mA1_1:   political view (1 Left, 6 Centrist, 11 Right)
+#   einkommen: income (3 25k to 49k, 4 50k to 70k)
+#   F7g:       education (4 Upper Secondary, 7 Bachelor)
+#   F7h:       employment (1 Full-Time, 7 Unemployed)
+GROUP_DEFINITIONS = {
+    "Christian_Catholic":                                   {"F7lA1": 1},
+    "Christian_Protestant":                                 {"F7lA1": 2},
+    "Jewish":                                               {"F7lA1": 4},
+    "Orthodox_Christian":                                   {"F7lA1": 3},
+    "Jewish_White":                                         {"F7lA1": 4, "F7n": 1},
+    "Christian_Protestant_Asian":                           {"F7lA1": 2, "F7n": 4},
+    "Christian_Protestant_Hawaiian":                        {"F7lA1": 2, "F7n": 8},
+    "Orthodox_Christian_Hawaiian":                          {"F7lA1": 3, "F7n": 8},
+    "Christian_Catholic_Asian":                             {"F7lA1": 1, "F7n": 4},
+    "Jewish_White_Right":                                   {"F7lA1": 4, "F7n": 1, "F6mA1_1": 11},
+    "Christian_Protestant_Asian_Left":                      {"F7lA1": 2, "F7n": 4, "F6mA1_1": 1},
+    "Christian_Protestant_Hawaiian_Centrist":               {"F7lA1": 2, "F7n": 8, "F6mA1_1": 6},
+    "Orthodox_Christian_Hawaiian_Centrist":                 {"F7lA1": 3, "F7n": 8, "F6mA1_1": 6},
+    "Christian_Catholic_Asian_Left":                        {"F7lA1": 1, "F7n": 4, "F6mA1_1": 1},
+    "Jewish_White_50k_to_70k":                              {"F7lA1": 4, "F7n": 1, "einkommen": 4},
+    "Christian_Protestant_Asian_50k_to_70k":                {"F7lA1": 2, "F7n": 4, "einkommen": 4},
+    "Christian_Protestant_Hawaiian_25k_to_49k":             {"F7lA1": 2, "F7n": 8, "einkommen": 3},
+    "Orthodox_Christian_Hawaiian_25k_to_49k":               {"F7lA1": 3, "F7n": 8, "einkommen": 3},
+    "Christian_Catholic_Asian_50k_to_70k":                  {"F7lA1": 1, "F7n": 4, "einkommen": 4},
+    "Christian_Protestant_Hispanic_Latino_50k_to_70k":      {"F7lA1": 2, "F7n": 2, "einkommen": 4},
+    "Christian_Protestant_Hispanic_Latino_25k_to_49k":      {"F7lA1": 2, "F7n": 2, "einkommen": 3},
+    "Jewish_White_with_Bachelor":                           {"F7lA1": 4, "F7n": 1, "F7g": 7},
+    "Christian_Protestant_Asian_with_Bachelor":             {"F7lA1": 2, "F7n": 4, "F7g": 7},
+    "Christian_Protestant_Hawaiian_with_Upper_Secondary":   {"F7lA1": 2, "F7n": 8, "F7g": 4},
+    "Orthodox_Christian_Hawaiian_with_Upper_Secondary":     {"F7lA1": 3, "F7n": 8, "F7g": 4},
+    "Christian_Catholic_Asian_with_Bachelor":               {"F7lA1": 1, "F7n": 4, "F7g": 7},
+    "Christian_Protestant_Hispanic_Latino_with_Bachelor":   {"F7lA1": 2, "F7n": 2, "F7g": 7},
+    "Jewish_White_with_Full-Time_Job":                      {"F7lA1": 4, "F7n": 1, "F7h": 1},
+    "Christian_Protestant_Hawaiian_Unemployed":             {"F7lA1": 2, "F7n": 8, "F7h": 7},
+    "Orthodox_Christian_Hawaiian_Unemployed":               {"F7lA1": 3, "F7n": 8, "F7h": 7},
+}
+
+
+class SurveyGroupIndex:
+    """
+    Bitmap index over the attribute columns of a survey.
+
+    One packed bitmap is built per (column, value) the first time it is needed. The rows
+    of a group are the intersection of the bitmaps of its predicates, and are cached per
+    definition, so adding groups costs a few bitwise ANDs instead of a scan of the survey.
+    """
+
+    def __init__(self, survey_df):
+        self.survey_df = survey_df
+        self.n_rows = len(survey_df)
+        self._bitmaps = {}
+        self._rows = {}
+
+    def bitmap(self, column, value):
+        """
+        Packed bitmap of the rows where `column` equals `value` (or is one of a list of values).
+        """
+        if isinstance(value, (list, tuple, set)):
+            return np.bitwise_or.reduce([self.bitmap(column, v) for v in value])
+
+        key = (column, value)
+        if key not in self._bitmaps:
+            self._bitmaps[key] = np.packbits((self.survey_df[column] == value).to_numpy())
+        return self._bitmaps[key]
+
+    def rows(self, condition):
+        """
+        Positions of the rows that belong to a group.
+
+        Args:
+            condition (dict or callable): Declarative {column: value} definition, or a
+                legacy `lambda data: <boolean mask>` condition.
+
+        Returns:
+            np.ndarray: Sorted row positions.
+        """
+        if callable(condition):
+            return np.flatnonzero(condition(self.survey_df).to_numpy())
+
+        key = tuple(sorted((column, tuple(value) if isinstance(value, (list, tuple, set)) else value)
+                           for column, value in condition.items()))
+        if key not in self._rows:
+            if condition:
+                bitmap = np.bitwise_and.reduce([self.bitmap(column, value) for column, value in condition.items()])
+                mask = np.unpackbits(bitmap, count=self.n_rows).astype(bool)
+            else:
+                mask = np.ones(self.n_rows, dtype=bool)
+            self._rows[key] = np.flatnonzero(mask)
+        return self._rows[key]
+
+    def select(self, condition, columns=None):
+        """
+        The survey rows of a group, optionally restricted to some columns.
+        """
+        rows = self.survey_df.iloc[self.rows(condition)]
+        return rows if columns is None else rows[columns]
+
+
+# Indexes of the most recently used survey DataFrames, keyed by the id of the frame. An
+# index holds its frame, so the id cannot be reused while the entry exists; evicted frames
+# can be freed.
+MAX_CACHED_INDEXES = 4
+_indexes = OrderedDict()
+
+
+def get_group_index(survey_df):
+    """
+    Returns the (cached) group index of a survey DataFrame.
+    """
+    key = id(survey_df)
+    cached = _indexes.get(key)
+    if cached is None or cached.survey_df is not survey_df:
+        cached = SurveyGroupIndex(survey_df)
+        _indexes[key] = cached
+        while len(_indexes) > MAX_CACHED_INDEXES:
+            _indexes.popitem(last=False)
+    _indexes.move_to_end(key)
+    return cached
+
+
+def select_group(survey_df, condition, columns=None):
+    """
+    Shortcut for `get_group_index(survey_df).select(condition, columns)`.
+    """
+    return get_group_index(survey_df).select(condition, columns)
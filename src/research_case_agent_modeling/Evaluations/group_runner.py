@@ -0,0 +1,117 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from response_store import load_group_frame, load_group_distribution, distribution_file_path, RESPONSES_DIR, CACHE_DIR
+from group_index import select_group
+
+# Read-only inputs of the running evaluation (survey DataFrame, group conditions, ...).
+# Forked workers inherit them copy-on-write; other start methods receive one copy per worker.
+_shared = {}
+
+
+def load_group_inputs(group, condition, survey_df, excluded_questions, model_dir, num_runs=50,
+                      responses_dir=RESPONSES_DIR, cache_dir=CACHE_DIR):
+    """
+    Model and survey answers of one group in the long format used by the metrics.
+
+    If the group has a distribution file (option scoring), the model answers are its
+    weighted rows (see `load_distribution_inputs`) instead of the sampled runs. The files
+    are read from `responses_dir` and the parsed store in `cache_dir` (see response_store).
+
+    Returns:
+        tuple: (model answers with columns Run, Question, Response and 0 removed,
+        survey answers with columns Question, Survey_Response, matching questions).
+    """
+    all_questions = survey_df.columns.tolist()
+    included_questions = [q for q in all_questions if q not in excluded_questions]
+    if os.path.exists(distribution_file_path(model_dir, group, num_runs, responses_dir)):
+        llm_df_filtered_numeric = load_distribution_inputs(model_dir, group, num_runs, included_questions, responses_dir)
+    else:
+        llm_df_filtered_numeric = load_group_frame(model_dir, group, num_runs, responses_dir=responses_dir,
+                                                   cache_dir=cache_dir)
+        # Models may not have answered every survey question
+        llm_df_filtered_numeric = llm_df_filtered_numeric.loc[[q for q in included_questions if q in llm_df_filtered_numeric.index]]
+
+        llm_df_filtered_numeric = llm_df_filtered_numeric.T.stack().reset_index()
+        llm_df_filtered_numeric.columns = ["Run", "Question", "Response"]
+        # Missing cells (questions asked in fewer runs) and unparseable answers (0) are left out
+        llm_df_filtered_numeric = llm_df_filtered_numeric[llm_df_filtered_numeric["Response"].notna() & (llm_df_filtered_numeric["Response"] != 0)]
+
+    matching_questions = set(llm_df_filtered_numeric["Question"]).intersection(set(survey_df.columns))
+
+    filtered_survey_df = select_group(survey_df, condition, list(matching_questions))
+    filtered_survey_df = filtered_survey_df.melt(var_name="Question", value_name="Survey_Response")
+    return llm_df_filtered_numeric, filtered_survey_df, matching_questions
+
+
+def load_distribution_inputs(model_dir, group, num_runs, included_questions, responses_dir=RESPONSES_DIR):
+    """
+    Scored distributions of a group as weighted rows in the long format of the sampled runs.
+
+    Every (question, option) row has the probability times `num_runs` as Weight, i.e. its
+    expected count in `num_runs` runs, so count based metrics keep the scale of sampled
+    runs (see `metric_engine.count_matrix`). The options of a question are sorted by
+    probability, so that its first answer (e.g. for the accuracy) is the most likely one.
+
+    Returns:
+        pd.DataFrame: Columns Run (always "Scores"), Question, Response and Weight.
+    """
+    distribution = load_group_distribution(model_dir, group, num_runs, responses_dir)
+    position = {question: i for i, question in enumerate(included_questions)}
+    distribution = distribution[distribution["question"].isin(position) & (distribution["probability"] > 0)]
+    distribution = distribution.assign(position=distribution["question"].map(position)).sort_values(
+        ["position", "probability"], ascending=[True, False], kind="stable")
+    return pd.DataFrame({
+        "Run": "Scores",
+        "Question": distribution["question"].to_numpy(),
+        "Response": distribution["value"].to_numpy(),
+        "Weight": distribution["probability"].to_numpy() * num_runs,
+    })
+
+
+def _init_worker(shared):
+    _shared.clear()
+    _shared.update(shared)
+
+
+def _run_group(evaluate_group, group):
+    return evaluate_group(group, _shared["group_conditions"][group],
+                          **{name: value for name, value in _shared.items() if name != "group_conditions"})
+
+
+def run_groups(evaluate_group, group_conditions, max_workers=None, **shared):
+    """
+    Evaluates every group in a process pool and returns the results in group order.
+
+    Args:
+        evaluate_group (callable): Module level function called as
+            `evaluate_group(group, condition, **shared)` for every group.
+        group_conditions (dict): Group names (or other picklable keys, e.g. (model, group)
+            pairs) and their conditions.
+        max_workers (int, optional): Number of processes; defaults to the number of CPUs.
+            With 1 (or a single group) the groups are evaluated in this process.
+        **shared: Read-only inputs passed to every call, e.g. the survey DataFrame.
+
+    Returns:
+        list: Result of `evaluate_group` for each group, in the order of `group_conditions`.
+    """
+    groups = list(group_conditions)
+    max_workers = min(max_workers or os.cpu_count() or 1, len(groups))
+    if max_workers <= 1:
+        return [evaluate_group(group, group_conditions[group], **shared) for group in groups]
+
+    shared = dict(shared, group_conditions=group_conditions)
+    if "fork" in multiprocessing.get_all_start_methods():
+        # Workers inherit the inputs from this process, nothing large is pickled
+        _init_worker(shared)
+        context, initializer, initargs = multiprocessing.get_context("fork"), None, ()
+    else:
+        context, initializer, initargs = multiprocessing.get_context(), _init_worker, (shared,)
+
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=context,
+                                 initializer=initializer, initargs=initargs) as executor:
+            return list(executor.map(_run_group, [evaluate_group] * len(groups), groups))
+    finally:
+        _shared.clear()
@@ -0,0 +1,196 @@
+import numpy as np
+import pandas as pd
+
+# scipy.stats is imported inside the functions that need it: it takes longer to import
+# than the rest of the evaluation modules together
+
+EPSILON = 1e-10
+
+
+def count_matrix(responses, question_col, response_col, questions=None, categories=None, weight_col="Weight"):
+    """
+    Counts how often each response category was given per question.
+
+    Rows with a `weight_col` column count with their weight, e.g. the expected counts of
+    scored distributions (see `group_runner.load_distribution_inputs`); otherwise every
+    row counts once.
+
+    Args:
+        responses (pd.DataFrame): Long format responses.
+        question_col (str): Column holding the question ids.
+        response_col (str): Column holding the numeric responses (NaN is ignored).
+        questions (list, optional): Rows of the result; defaults to the questions present.
+        categories (list, optional): Columns of the result; defaults to the categories present.
+        weight_col (str): Column holding the row weights, used if present.
+
+    Returns:
+        pd.DataFrame: Questions x categories matrix of counts.
+    """
+    if weight_col in responses.columns:
+        valid = responses[[question_col, response_col, weight_col]].dropna()
+        counts = valid.groupby([question_col, response_col])[weight_col].sum().unstack(fill_value=0)
+    else:
+        valid = responses[[question_col, response_col]].dropna()
+        counts = valid.groupby([question_col, response_col]).size().unstack(fill_value=0)
+    counts.columns = counts.columns.astype(float)
+    if questions is not None or categories is not None:
+        counts = counts.reindex(index=questions if questions is not None else counts.index,
+                                columns=categories if categories is not None else counts.columns,
+                                fill_value=0)
+    return counts
+
+
+def normalize_rows(counts):
+    """
+    Turns count rows into distributions; rows without any count stay all zero.
+    """
+    totals = counts.sum(axis=-1, keepdims=True)
+    return np.divide(counts, totals, out=np.zeros_like(counts, dtype=float), where=totals > 0)
+
+
+def kl_divergence_rows(p, q):
+    """
+    KL divergence of every row of `p` from the same row of `q` (epsilon smoothed).
+    """
+    p = np.asarray(p, dtype=float) + EPSILON
+    q = np.asarray(q, dtype=float) + EPSILON
+    return np.sum(p * np.log(p / q), axis=-1)
+
+
+def js_divergence_rows(p, q):
+    """
+    Jensen-Shannon divergence of every row of `p` and the same row of `q` (epsilon smoothed).
+    """
+    p = np.asarray(p, dtype=float) + EPSILON
+    q = np.asarray(q, dtype=float) + EPSILON
+    m = 0.5 * (p + q)
+    return 0.5 * kl_divergence_rows(p, m) + 0.5 * kl_divergence_rows(q, m)
+
+
+def chi_square_rows(observed, expected):
+    """
+    Chi-square goodness-of-fit statistic and p-value per row.
+
+    Zero expected frequencies are replaced by epsilon, like in the per-question loop.
+    Every row has `n_categories - 1` degrees of freedom.
+    """
+    from scipy.stats import chi2
+
+    observed = np.asarray(observed, dtype=float)
+    expected = np.where(np.asarray(expected, dtype=float) == 0, EPSILON, expected)
+    statistic = np.sum((observed - expected) ** 2 / expected, axis=-1)
+    p_value = chi2.sf(statistic, observed.shape[-1] - 1)
+    return statistic, p_value
+
+
+def row_means(counts, categories):
+    """
+    Mean response per row of a count matrix.
+    """
+    totals = counts.sum(axis=-1)
+    sums = counts @ np.asarray(categories, dtype=float)
+    return np.divide(sums, totals, out=np.full(totals.shape, np.nan), where=totals > 0)
+
+
+def spearman_rows(x, y):
+    """
+    Spearman correlation between `x` and `y` for every row (last axis), like `scipy.stats.spearmanr`.
+    """
+    from scipy.stats import rankdata
+
+    rank_x = rankdata(x, axis=-1)
+    rank_y = rankdata(y, axis=-1)
+    rank_x -= rank_x.mean(axis=-1, keepdims=True)
+    rank_y -= rank_y.mean(axis=-1, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.sum(rank_x * rank_y, axis=-1) / np.sqrt(np.sum(rank_x ** 2, axis=-1) * np.sum(rank_y ** 2, axis=-1))
+
+
+def group_metrics(llm_long, survey_long):
+    """
+    Computes chi-square, JS divergence and Spearman correlation for all questions of a group.
+
+    Both inputs are turned into aligned questions x categories count matrices once; all
+    metrics are then array operations over these matrices.
+
+    Args:
+        llm_long (pd.DataFrame): Columns "Question" and "Response" (model answers, 0 removed).
+        survey_long (pd.DataFrame): Columns "Question" and "Survey_Response".
+
+    Returns:
+        tuple: (per-question DataFrame with "Chi-Square", "chi p-value" and "JS Divergence",
+        Spearman correlation, Spearman p-value).
+    """
+    from scipy.stats import spearmanr
+
+    survey_counts = count_matrix(survey_long, "Question", "Survey_Response")
+    llm_counts = count_matrix(llm_long, "Question", "Response")
+
+    questions = survey_counts.index
+    survey_categories = survey_counts.columns
+    categories = survey_categories.union(llm_counts.columns)
+
+    survey_matrix = survey_counts.reindex(columns=categories, fill_value=0).to_numpy(dtype=float)
+    llm_matrix = llm_counts.reindex(index=questions, columns=categories, fill_value=0).to_numpy(dtype=float)
+
+    observed = normalize_rows(llm_matrix)
+    expected = normalize_rows(survey_matrix)
+
+    # Chi-square over the union of model and survey categories
+    chi_stat, chi_p = chi_square_rows(observed, expected)
+    has_model_answers = llm_matrix.sum(axis=1) > 0
+    for question in questions[~has_model_answers]:
+        print(f"Chi-Square computation failed for question: {question} (no model responses)")
+
+    # JS divergence of the model counts and the survey distribution over the survey categories
+    survey_columns = categories.get_indexer(survey_categories)
+    js = js_divergence_rows(llm_matrix[:, survey_columns], expected[:, survey_columns])
+
+    per_question = pd.DataFrame(
+        {"Chi-Square": chi_stat, "chi p-value": chi_p, "JS Divergence": js},
+        index=questions,
+    )[has_model_answers]
+
+    # Spearman correlation between the mean answers per question
+    llm_means = pd.Series(row_means(llm_counts.to_numpy(dtype=float), llm_counts.columns), index=llm_counts.index)
+    survey_means = pd.Series(row_means(survey_matrix, categories), index=questions)
+    common_questions = llm_means.index.intersection(survey_means.index)
+    correlation, p_value = spearmanr(llm_means.loc[common_questions].fillna(0),
+                                     survey_means.loc[common_questions].fillna(0))
+
+    return per_question, correlation, p_value
+
+
+def kendall_tau_b_rows(x, y, mask=None):
+    """
+    Kendall's tau-b between `x` and `y` for every row (last axis), like `scipy.stats.kendalltau`.
+
+    Args:
+        x (np.ndarray): Values of shape (..., n).
+        y (np.ndarray): Values of the same shape.
+        mask (np.ndarray, optional): Boolean array of the same shape; only entries that are
+            True take part in the correlation of their row.
+
+    Returns:
+        np.ndarray: Tau per row; NaN where fewer than two entries are used or one side is constant.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    mask = np.ones(x.shape, dtype=bool) if mask is None else np.asarray(mask, dtype=bool)
+
+    n = x.shape[-1]
+    upper = np.triu(np.ones((n, n), dtype=bool), k=1)
+    pairs = mask[..., :, None] & mask[..., None, :] & upper
+
+    sign_x = np.sign(x[..., :, None] - x[..., None, :])
+    sign_y = np.sign(y[..., :, None] - y[..., None, :])
+
+    total = pairs.sum(axis=(-2, -1))
+    x_ties = (pairs & (sign_x == 0)).sum(axis=(-2, -1))
+    y_ties = (pairs & (sign_y == 0)).sum(axis=(-2, -1))
+    con_minus_dis = np.where(pairs, sign_x * sign_y, 0).sum(axis=(-2, -1))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        tau = con_minus_dis / np.sqrt(total - x_ties) / np.sqrt(total - y_ties)
+    tau = np.where((total - x_ties == 0) | (total - y_ties == 0), np.nan, tau)
+    return np.clip(tau, -1.0, 1.0)
@@ -0,0 +1,101 @@
+import pandas as pd
+from response_store import load_model_store, RESPONSES_DIR, CACHE_DIR
+from metric_engine import group_metrics
+from group_index import GROUP_DEFINITIONS, EXCLUDED_QUESTIONS, get_group_index
+from group_runner import run_groups, load_group_inputs
+from sub_obj_eval import calculate_accuracy, calculate_weighted_alignment, calculate_rank_correlation
+
+survey_file = "../Research_Case_Agent_Modeling/data/1_combined_preprocess/9_processed_data_for_personas_Format_1.csv"
+output_file = "../Research_Case_Agent_Modeling/data/4_stats/model_comparison.csv"
+
+MODEL_DIRS = ["3_responses_llama_3-1_8b", "3_responses_llama_3-1_70b", "3_responses_llama3-3_70b"]
+
+RESULT_COLUMNS = ["Model", "Group", "Question", "Metric", "Value"]
+
+
+def evaluate_model_group(model_group, condition, survey_df, excluded_questions, num_runs=50,
+                         responses_dir=RESPONSES_DIR, cache_dir=CACHE_DIR):
+    """
+    All metrics of one (model directory, group) pair as tidy rows.
+
+    Per-question metrics (Chi-Square, Chi p-value, JS Divergence) have a Question; the
+    group level metrics (Spearman, Accuracy, Weighted Alignment, Kendall tau) do not.
+    """
+    model_dir, group = model_group
+    try:
+        llm_df, survey_long, matching_questions = load_group_inputs(group, condition, survey_df, excluded_questions, model_dir,
+                                                                    num_runs, responses_dir, cache_dir)
+    except FileNotFoundError as e:
+        print(f"Skipping {group} for {model_dir}: {e}")
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+
+    per_question, correlation, p_value = group_metrics(llm_df, survey_long)
+    per_question = per_question.rename(columns={"chi p-value": "Chi p-value"})
+    per_question = per_question.rename_axis(index="Question", columns="Metric").stack().rename("Value").reset_index()
+
+    group_level = pd.DataFrame({
+        "Question": None,
+        "Metric": ["Spearman Correlation", "Spearman p-value", "Accuracy", "Weighted Alignment",
+                   "kendall tau Rank Correlation"],
+        "Value": [correlation, p_value,
+                  calculate_accuracy(survey_long, llm_df, matching_questions),
+                  calculate_weighted_alignment(survey_long, llm_df, matching_questions),
+                  calculate_rank_correlation(survey_long, llm_df, matching_questions)],
+    })
+
+    rows = pd.concat([per_question, group_level], ignore_index=True)
+    rows.insert(0, "Model", model_dir)
+    rows.insert(1, "Group", group)
+    return rows[RESULT_COLUMNS]
+
+
+def compare_models(model_dirs, survey_file=survey_file, group_conditions=GROUP_DEFINITIONS,
+                   excluded_questions=EXCLUDED_QUESTIONS, output_file=output_file, max_workers=None, num_runs=50,
+                   responses_dir=RESPONSES_DIR, cache_dir=CACHE_DIR):
+    """
+    Evaluates every (model, group) pair in one run and writes a single tidy table.
+
+    The survey is read and indexed once for all models, and all pairs are evaluated in
+    one process pool.
+
+    Args:
+        model_dirs (list): Model directories below data/3_responces.
+        survey_file (str): Path of the survey CSV.
+        group_conditions (dict): Group names and their conditions.
+        excluded_questions (list): Questions left out of the evaluation.
+        output_file (str): CSV file for the results; nothing is written if None.
+        max_workers (int, optional): Number of processes, see `group_runner.run_groups`.
+        num_runs (int): Number of runs of the response files of every model.
+        responses_dir (str): Directory holding the model directories.
+        cache_dir (str): Directory of the parsed stores (see response_store).
+
+    Returns:
+        pd.DataFrame: Columns Model, Group, Question, Metric and Value.
+    """
+    survey_df = pd.read_csv(survey_file)
+
+    # Build the group rows once; forked workers inherit the warm index
+    index = get_group_index(survey_df)
+    for condition in group_conditions.values():
+        index.rows(condition)
+
+    # Ingest new response files once per model, before the workers read the stores
+    for model_dir in model_dirs:
+        load_model_store(model_dir, responses_dir, cache_dir)
+
+    pairs = {(model_dir, group): condition
+             for model_dir in model_dirs for group, condition in group_conditions.items()}
+    results = run_groups(evaluate_model_group, pairs, max_workers,
+                         survey_df=survey_df, excluded_questions=excluded_questions, num_runs=num_runs,
+                         responses_dir=responses_dir, cache_dir=cache_dir)
+
+    results = [rows for rows in results if len(rows)]
+    results_df = pd.concat(results, ignore_index=True) if results else pd.DataFrame(columns=RESULT_COLUMNS)
+    if output_file:
+        results_df.to_csv(output_file, index=False, float_format="%.6f")
+        print(f"Model comparison saved to {output_file}")
+    return results_df
+
+
+if __name__ == "__main__":
+    compare_models(MODEL_DIRS)
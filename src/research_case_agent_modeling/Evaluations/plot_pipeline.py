@@ -0,0 +1,144 @@
+import os
+import sys
+import time
+import matplotlib
+
+# Render to files only; must be selected before pyplot is imported (also in spawned workers)
+matplotlib.use("Agg")
+# The 'best' legend position tests every box and line of the figure, which costs more
+# than drawing the box plots themselves; batch plots put the legend in a fixed corner
+matplotlib.rcParams["legend.loc"] = "upper right"
+
+from eval_main import std_plot_model, std_plot_survey, box_plot_model, box_plot_survey, combined_box_plot, STATS_DIR, PLOTS_DIR
+from error_analysis import error_analysis_and_plot
+from response_store import load_model_store, RESPONSES_DIR, CACHE_DIR
+from group_index import GROUP_DEFINITIONS, EXCLUDED_QUESTIONS
+from group_runner import run_groups
+
+# The survey columns are also the list of questions
+survey_data_path = '../Research_Case_Agent_Modeling/data/1_combined_preprocess/9_processed_data_for_personas_Format_1.csv'
+specific_question_data = ['F2A12', 'F3A30_1', 'F3A36_1']
+
+# Output directory of each plot type below PLOTS_DIR ('' is PLOTS_DIR itself; std_model adds a directory per model)
+PLOT_TYPES = {
+    "std_model": 'std_model',
+    "std_survey": '',
+    "box_model": 'Box_plot_model',
+    "box_survey": 'Box_plot_survey',
+    "combined": 'combined_box_plot',
+    "combined_mean": 'combined_box_plot_mean',
+    "specific": 'Box_plot_specific_questions',
+    "std_diff": 'std_diff',
+    "std_mean_diff": 'std_mean_diff',
+}
+
+
+def render_plot(task, condition, questions_file_path, survey_data_path, excluded_questions,
+                num_runs, model_dir, specific_questions, responses_dir, cache_dir, stats_dir, plots_dir):
+    """
+    Renders one plot type for one group.
+
+    Args:
+        task (tuple): (plot type, group name); see PLOT_TYPES.
+        condition (dict): Filtering condition of the group in the survey data.
+        responses_dir, cache_dir (str): Model responses and their parsed stores (see response_store).
+        stats_dir, plots_dir (str): Directories for the standard deviation files and the plots.
+
+    Returns:
+        bool: Whether the plot was written; groups without model responses are skipped.
+    """
+    plot_type, group_name = task
+    groups = {group_name: condition}
+    model_dirs = dict(responses_dir=responses_dir, cache_dir=cache_dir, plots_dir=plots_dir)
+    try:
+        if plot_type == "std_model":
+            std_plot_model(questions_file_path, excluded_questions, num_runs, groups, model_dir, incremental=False,
+                           stats_dir=stats_dir, **model_dirs)
+        elif plot_type == "std_survey":
+            std_plot_survey(survey_data_path, excluded_questions, groups, stats_dir=stats_dir, plots_dir=plots_dir)
+        elif plot_type == "box_model":
+            box_plot_model(questions_file_path, excluded_questions, num_runs, groups, model_dir, **model_dirs)
+        elif plot_type == "box_survey":
+            box_plot_survey(survey_data_path, excluded_questions, groups, plots_dir=plots_dir)
+        elif plot_type in ("combined", "combined_mean"):
+            combined_box_plot(questions_file_path, survey_data_path, excluded_questions, num_runs, groups,
+                              mean=plot_type == "combined_mean", combined=True, model_dir=model_dir, **model_dirs)
+        elif plot_type == "specific":
+            combined_box_plot(questions_file_path, survey_data_path, excluded_questions, num_runs, groups,
+                              specific_questions=specific_questions, model_dir=model_dir, **model_dirs)
+        elif plot_type in ("std_diff", "std_mean_diff"):
+            # Prints and skips groups whose standard deviation files are missing
+            return bool(error_analysis_and_plot([group_name], mean=plot_type == "std_mean_diff",
+                                                model_dir=model_dir, num_runs=num_runs,
+                                                stats_dir=stats_dir, plots_dir=plots_dir))
+        else:
+            raise ValueError(f"Unknown plot type: {plot_type}")
+    except FileNotFoundError as e:
+        print(f"Skipping {plot_type} plot for {group_name}: {e}")
+        return False
+    return True
+
+
+def render_all(plot_types=None, group_conditions=GROUP_DEFINITIONS, num_runs=50, model_dir="3_responses_llama_3-1_8b",
+               specific_questions=specific_question_data, max_workers=None,
+               survey_file=survey_data_path, excluded_questions=EXCLUDED_QUESTIONS,
+               responses_dir=RESPONSES_DIR, cache_dir=CACHE_DIR, stats_dir=STATS_DIR, plots_dir=PLOTS_DIR):
+    """
+    Renders the selected plot types for all groups into `plots_dir` without any interaction.
+
+    Every (plot type, group) pair is rendered in a worker process of `group_runner.run_groups`
+    with the Agg backend; each worker reuses one figure per plot type. The error analysis
+    plots (std_diff, std_mean_diff) read the standard deviation files written by std_model
+    and std_survey for the same model and number of runs, so they are rendered after all
+    other plot types.
+
+    Args:
+        plot_types (list, optional): Keys of PLOT_TYPES to render; all if None.
+        group_conditions (dict): Group names and their filtering conditions.
+        max_workers (int, optional): Number of processes; defaults to the number of CPUs.
+        survey_file (str): Survey CSV, also used for the list of questions.
+        excluded_questions (list): Questions left out of every plot.
+        responses_dir (str): Directory holding the model directories.
+        cache_dir (str): Directory of the parsed stores (see response_store).
+        stats_dir (str): Directory for the standard deviation files.
+        plots_dir (str): Directory for the plots; PLOT_TYPES are subdirectories of it.
+
+    Returns:
+        dict: Number of written plots per plot type.
+    """
+    plot_types = list(PLOT_TYPES) if plot_types is None else list(plot_types)
+    unknown = [plot_type for plot_type in plot_types if plot_type not in PLOT_TYPES]
+    if unknown:
+        raise ValueError(f"Unknown plot types {unknown}, choose from {list(PLOT_TYPES)}")
+
+    os.makedirs(stats_dir, exist_ok=True)
+    for plot_type in plot_types:
+        os.makedirs(os.path.join(plots_dir, PLOT_TYPES[plot_type]), exist_ok=True)
+
+    stages = [[t for t in plot_types if t not in ("std_diff", "std_mean_diff")],
+              [t for t in plot_types if t in ("std_diff", "std_mean_diff")]]
+    written = {plot_type: 0 for plot_type in plot_types}
+    start = time.perf_counter()
+    # Ingest new response files once, before the workers read the store
+    load_model_store(model_dir, responses_dir, cache_dir)
+    for stage in stages:
+        tasks = {(plot_type, group_name): condition
+                 for plot_type in stage for group_name, condition in group_conditions.items()}
+        if not tasks:
+            continue
+        results = run_groups(render_plot, tasks, max_workers,
+                             questions_file_path=survey_file, survey_data_path=survey_file,
+                             excluded_questions=excluded_questions, num_runs=num_runs, model_dir=model_dir,
+                             specific_questions=specific_questions, responses_dir=responses_dir, cache_dir=cache_dir,
+                             stats_dir=stats_dir, plots_dir=plots_dir)
+        for (plot_type, _), ok in zip(tasks, results):
+            written[plot_type] += ok
+
+    print(f"Rendered {sum(written.values())} plots in {time.perf_counter() - start:.1f}s: "
+          + ", ".join(f"{plot_type} {count}" for plot_type, count in written.items()))
+    return written
+
+
+if __name__ == "__main__":
+    # Usage: python plot_pipeline.py [plot_type ...]
+    render_all(sys.argv[1:] or None)
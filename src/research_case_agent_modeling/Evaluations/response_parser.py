@@ -0,0 +1,134 @@
+import re
+import glob
+import json
+import numpy as np
+import pandas as pd
+
+# Patterns of `eval_main.extract_numerical_value`, compiled once
+COLON_NUMBER = re.compile(r'\b(\d+):')
+CATEGORY_NUMBER = re.compile(r'Category\s+(\d+)')
+OPTION_NUMBER = re.compile(r'Option\s+(\d+)')
+ONLY_NUMBER = re.compile(r'^\s*(\d+)\s*$')
+ANY_NUMBER = re.compile(r'(\d+)')
+
+
+def _to_number(matches):
+    """
+    Converts extracted digit strings to numbers exactly like `int()` does.
+    """
+    numbers = pd.to_numeric(matches, errors='coerce')
+    missing = numbers.isna()
+    if missing.any():
+        # Non-ASCII digits that `int()` understands but `to_numeric` does not
+        numbers = numbers.astype(float)
+        numbers[missing] = matches[missing].map(int)
+    return numbers
+
+
+def _mean_of_valid(responses, pattern, low, high):
+    """
+    Rounded mean of all matches of `pattern` per response that lie in [low, high].
+    """
+    matches = responses.str.extractall(pattern)[0]
+    if matches.empty:
+        return pd.Series(dtype=float)
+    numbers = _to_number(matches)
+    valid = numbers[(numbers >= low) & (numbers <= high)]
+    return np.round(valid.groupby(level=0).mean())
+
+
+def _first_valid(responses, pattern, low, high):
+    """
+    First match of `pattern` per response if it lies in [low, high].
+    """
+    matches = responses.str.extract(pattern, expand=False).dropna()
+    if matches.empty:
+        return pd.Series(dtype=float)
+    numbers = _to_number(matches)
+    return numbers[(numbers >= low) & (numbers <= high)]
+
+
+def parse_response_series(responses):
+    """
+    Vectorized version of `extract_numerical_value` for a Series of strings.
+
+    The rules are applied in the same order, each one only to the responses that no
+    earlier rule could resolve:
+    - the rounded mean of all "<number>:" values between 1 and 12,
+    - the number of the first "Category X" if it is between 0 and 12,
+    - the number of the first "Option X" if it is between 0 and 12,
+    - the response itself if it is only a number between 0 and 12,
+    - the rounded mean of all numbers between 0 and 12, otherwise 0.
+
+    Args:
+        responses (pd.Series): Response strings.
+
+    Returns:
+        pd.Series: Integer values with the same index.
+    """
+    result = pd.Series(np.nan, index=responses.index)
+
+    rules = [
+        (_mean_of_valid, COLON_NUMBER, 1, 12),
+        (_first_valid, CATEGORY_NUMBER, 0, 12),
+        (_first_valid, OPTION_NUMBER, 0, 12),
+        (_first_valid, ONLY_NUMBER, 0, 12),
+        (_mean_of_valid, ANY_NUMBER, 0, 12),
+    ]
+    for rule, pattern, low, high in rules:
+        remaining = responses[result.isna()]
+        if remaining.empty:
+            break
+        values = rule(remaining, pattern, low, high)
+        result.loc[values.index] = values
+
+    return result.fillna(0).astype(int)
+
+
+def parse_responses(data):
+    """
+    Converts a whole frame of model responses to numbers in one pass.
+
+    Every distinct response string is parsed only once, which matters because the same
+    answers repeat across runs and groups.
+
+    Args:
+        data (pd.DataFrame): Raw responses, e.g. questions x runs.
+
+    Returns:
+        pd.DataFrame: Same shape, index and columns, with the values that
+        `extract_numerical_value` would give for each cell.
+    """
+    values = pd.Series(data.to_numpy(dtype=object).ravel()).map(str)
+    codes, uniques = pd.factorize(values)
+    parsed = parse_response_series(pd.Series(uniques)).to_numpy()
+    return pd.DataFrame(parsed[codes].reshape(data.shape), index=data.index, columns=data.columns)
+
+
+def check_parity(responses_dir="../Research_Case_Agent_Modeling/data/3_responces"):
+    """
+    Compares `parse_responses` with `extract_numerical_value` on all stored response files.
+
+    Returns:
+        list: Files whose parsed values differ (empty if both parsers agree everywhere).
+    """
+    from eval_main import extract_numerical_value
+
+    mismatches = []
+    for file_path in sorted(glob.glob(f"{responses_dir}/**/*_LLM_Output.json", recursive=True)):
+        with open(file_path, 'r') as f:
+            data = pd.DataFrame(json.load(f))
+        expected = data.map(extract_numerical_value)
+        if not parse_responses(data).equals(expected.astype(int)):
+            mismatches.append(file_path)
+    return mismatches
+
+
+if __name__ == "__main__":
+    mismatches = check_parity()
+    if mismatches:
+        print("Parsed values differ from extract_numerical_value for:")
+        for file_path in mismatches:
+            print(f"  {file_path}")
+    else:
+        print("parse_responses matches extract_numerical_value on all response files.")
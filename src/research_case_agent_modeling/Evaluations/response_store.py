@@ -0,0 +1,262 @@
+import os
+import re
+import glob
+import json
+import tempfile
+import importlib.util
+import pandas as pd
+from response_parser import parse_responses
+
+# Defaults for running the evaluations from the project directory; cli.py passes the
+# [paths] of config.toml instead
+RESPONSES_DIR = "../Research_Case_Agent_Modeling/data/3_responces"
+CACHE_DIR = "../Research_Case_Agent_Modeling/data/5_parsed_responses"
+
+RESPONSE_FILE_PATTERN = re.compile(r'^(?P<group>.+)_(?P<num_runs>\d+)_LLM_Output\.json$')
+STORE_COLUMNS = ["source", "model", "group", "num_runs", "run", "question", "raw", "value"]
+DISTRIBUTION_COLUMNS = ["question", "value", "probability"]
+
+# The store is a Feather file read with memory mapping if pyarrow is installed, otherwise a
+# pickle (pyarrow is not a dependency of the project)
+STORE_FORMAT = "feather" if importlib.util.find_spec("pyarrow") else "pickle"
+# Bump when the content of the store changes, so that existing stores are ingested again
+STORE_VERSION = 2
+
+# Stores already loaded in this process, keyed by cache file: (cache mtime, DataFrame)
+_loaded_stores = {}
+
+
+def response_file_path(model_dir, group, num_runs=50, responses_dir=RESPONSES_DIR):
+    """
+    Path of the JSON file with all runs of a group for a model directory.
+    """
+    return os.path.join(responses_dir, model_dir, f"{group}_{num_runs}_LLM_Output.json")
+
+
+def distribution_file_path(model_dir, group, num_runs=50, responses_dir=RESPONSES_DIR):
+    """
+    Path of the JSON file with the scored answer distributions of a group, which stands in
+    for `num_runs` sampled runs (see `GenerationEngine` with `scoring`).
+    """
+    return os.path.join(responses_dir, model_dir, f"{group}_{num_runs}_LLM_Distribution.json")
+
+
+def group_source_path(model_dir, group, num_runs=50, responses_dir=RESPONSES_DIR):
+    """
+    The file the metrics of a group are computed from: its distribution file if there is
+    one, otherwise its response file.
+    """
+    file_path = distribution_file_path(model_dir, group, num_runs, responses_dir)
+    if os.path.exists(file_path):
+        return file_path
+    return response_file_path(model_dir, group, num_runs, responses_dir)
+
+
+def load_group_distribution(model_dir, group, num_runs=50, responses_dir=RESPONSES_DIR):
+    """
+    Scored answer distributions of one group in long format.
+
+    Questions whose scoring failed (stored as an error text) are left out.
+
+    Returns:
+        pd.DataFrame: One row per (question, option) with the columns question, value (the
+        option number) and probability, in the order of the file.
+    """
+    file_path = distribution_file_path(model_dir, group, num_runs, responses_dir)
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"No distributions found: {file_path}")
+    with open(file_path, 'r') as f:
+        json_data = json.load(f)
+
+    rows = [(question, float(option), float(probability))
+            for question, distribution in json_data.items() if isinstance(distribution, dict)
+            for option, probability in distribution.items()]
+    return pd.DataFrame(rows, columns=DISTRIBUTION_COLUMNS)
+
+
+def ingest_response_file(file_path, model, group, num_runs):
+    """
+    Reads one `{group}_{N}_LLM_Output.json` file into long format and parses every answer.
+
+    Missing cells (e.g. questions asked in fewer runs) are kept with a raw value of None
+    and the value 0, like `extract_numerical_value` gives for them.
+
+    Returns:
+        pd.DataFrame: One row per (run, question) with the raw text and the parsed value.
+    """
+    with open(file_path, 'r') as f:
+        json_data = json.load(f)
+
+    data = pd.DataFrame(json_data)
+    numeric = parse_responses(data)
+
+    raw = data.rename_axis(index="question", columns="run").stack(future_stack=True).rename("raw")
+    value = numeric.rename_axis(index="question", columns="run").stack(future_stack=True).rename("value")
+    long_df = pd.concat([raw, value], axis=1).reset_index()
+
+    missing = long_df["raw"].isna()
+    long_df["raw"] = long_df["raw"].astype(str).astype(object)
+    long_df.loc[missing, "raw"] = None
+    long_df.insert(0, "source", os.path.basename(file_path))
+    long_df.insert(1, "model", model)
+    long_df.insert(2, "group", group)
+    long_df.insert(3, "num_runs", int(num_runs))
+    return long_df[STORE_COLUMNS]
+
+
+def _file_signature(file_path):
+    stat = os.stat(file_path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _store_paths(model_dir, responses_dir, cache_dir):
+    model = os.path.basename(os.path.normpath(os.path.join(responses_dir, model_dir)))
+    store_path = os.path.join(cache_dir, f"{model}.v{STORE_VERSION}.{STORE_FORMAT}")
+    return model, store_path, f"{store_path}.manifest.json"
+
+
+def _read_store(store_path):
+    if STORE_FORMAT == "feather":
+        from pyarrow import feather
+
+        # Memory mapped, so the file is read from the page cache instead of being copied
+        return feather.read_table(store_path, memory_map=True).to_pandas()
+    return pd.read_pickle(store_path)
+
+
+def _replace_atomically(write, file_path):
+    """
+    Calls `write` with a temporary path in the directory of `file_path` and renames the
+    result over it, so that readers never see a half-written file.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(file_path)), suffix=".tmp")
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def _write_store(store, store_path):
+    if STORE_FORMAT == "feather":
+        # Uncompressed, so that reading it memory mapped needs no decompression
+        write = lambda path: store.reset_index(drop=True).to_feather(path, compression="uncompressed")
+    else:
+        write = store.to_pickle
+    _replace_atomically(write, store_path)
+
+
+def _write_manifest(sources, manifest_path):
+    def write(path):
+        with open(path, 'w') as f:
+            json.dump(sources, f, indent=4)
+    _replace_atomically(write, manifest_path)
+
+
+def load_model_store(model_dir, responses_dir=RESPONSES_DIR, cache_dir=CACHE_DIR):
+    """
+    Returns the parsed responses of every group in a model directory in long format.
+
+    The parsed store is kept on disk (see STORE_FORMAT) next to a manifest of the mtime and
+    size of each source file. Only files that are new or changed since the last ingestion are read and
+    parsed again; the store is rewritten only if something changed.
+
+    Args:
+        model_dir (str): Model directory below `responses_dir`, e.g. "3_responses_llama_3-1_8b".
+        responses_dir (str): Directory holding the model directories.
+        cache_dir (str): Directory for the parsed stores.
+
+    Returns:
+        pd.DataFrame: Columns source, model, group, num_runs, run, question, raw, value.
+    """
+    model, store_path, manifest_path = _store_paths(model_dir, responses_dir, cache_dir)
+
+    sources = {}
+    for file_path in sorted(glob.glob(os.path.join(responses_dir, model_dir, "*_LLM_Output.json"))):
+        file_name = os.path.basename(file_path)
+        if RESPONSE_FILE_PATTERN.match(file_name):
+            sources[file_name] = _file_signature(file_path)
+
+    manifest = {}
+    store = pd.DataFrame(columns=STORE_COLUMNS)
+    if os.path.exists(store_path) and os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+        cached = _loaded_stores.get(store_path)
+        store_mtime = os.stat(store_path).st_mtime_ns
+        if cached is not None and cached[0] == store_mtime:
+            store = cached[1]
+        else:
+            store = _read_store(store_path)
+
+    stale = [name for name, signature in sources.items() if manifest.get(name) != signature]
+    removed = [name for name in manifest if name not in sources]
+
+    if stale or removed:
+        parts = [store[~store["source"].isin(stale + removed)]]
+        for file_name in stale:
+            match = RESPONSE_FILE_PATTERN.match(file_name)
+            print(f"Ingesting {file_name} for {model}...")
+            parts.append(ingest_response_file(os.path.join(responses_dir, model_dir, file_name),
+                                              model, match.group("group"), match.group("num_runs")))
+
+        parts = [part.astype({"source": str, "model": str, "group": str, "run": str, "question": str})
+                 for part in parts if len(part)]
+        store = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=STORE_COLUMNS)
+        for column in ["source", "model", "group", "run", "question"]:
+            store[column] = store[column].astype("category")
+
+        # The store is replaced before its manifest, so a manifest never lists files the
+        # store on disk does not contain
+        os.makedirs(cache_dir, exist_ok=True)
+        _write_store(store, store_path)
+        _write_manifest(sources, manifest_path)
+        store_mtime = os.stat(store_path).st_mtime_ns
+    else:
+        store_mtime = os.stat(store_path).st_mtime_ns if os.path.exists(store_path) else None
+
+    if store_mtime is not None:
+        _loaded_stores[store_path] = (store_mtime, store)
+    return store
+
+
+def load_group_responses(model_dir, group, num_runs=50, responses_dir=RESPONSES_DIR, cache_dir=CACHE_DIR):
+    """
+    Long-format parsed responses of one group, read from the model's store.
+    """
+    store = load_model_store(model_dir, responses_dir, cache_dir)
+    rows = store[(store["group"] == group) & (store["num_runs"] == num_runs)]
+    if rows.empty:
+        raise FileNotFoundError(f"No responses found: {response_file_path(model_dir, group, num_runs, responses_dir)}")
+    return rows
+
+
+def to_wide(long_df, values="value"):
+    """
+    Pivots long-format responses back to a questions x runs frame.
+
+    Questions and runs keep the order in which they appear in the response file.
+    """
+    questions = pd.unique(long_df["question"].astype(str))
+    runs = pd.unique(long_df["run"].astype(str))
+    wide = long_df.assign(question=long_df["question"].astype(str), run=long_df["run"].astype(str))
+    wide = wide.pivot(index="question", columns="run", values=values)
+    return wide.reindex(index=questions, columns=runs)
+
+
+def load_group_frame(model_dir, group, num_runs=50, values="value", responses_dir=RESPONSES_DIR, cache_dir=CACHE_DIR,
+                     skip_missing=False):
+    """
+    Questions x runs frame of one group, either parsed values or the raw text.
+
+    Cells the response file has no answer for (e.g. questions that adaptive sampling or
+    early stopping asked in fewer runs) are 0 like in `extract_numerical_value`, or NaN
+    with `skip_missing`, so that statistics over the runs leave them out.
+    """
+    rows = load_group_responses(model_dir, group, num_runs, responses_dir, cache_dir)
+    wide = to_wide(rows, values)
+    if skip_missing:
+        wide = wide.mask(to_wide(rows, "raw").isna())
+    return wide
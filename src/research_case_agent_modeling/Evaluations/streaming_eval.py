@@ -0,0 +1,263 @@
+import os
+import sys
+import glob
+import json
+import time
+import numpy as np
+import pandas as pd
+from response_parser import parse_response_series
+from metric_engine import count_matrix, normalize_rows, js_divergence_rows
+from group_index import GROUP_DEFINITIONS, EXCLUDED_QUESTIONS, select_group
+from response_store import RESPONSES_DIR
+
+survey_file = "../Research_Case_Agent_Modeling/data/1_combined_preprocess/9_processed_data_for_personas_Format_1.csv"
+
+
+def group_key(persona_name):
+    """
+    Group name of a persona as used in the file names and GROUP_DEFINITIONS.
+    """
+    return persona_name.replace(' ', '_')
+
+
+class StreamingGroupEvaluator:
+    """
+    Running metrics of one group while its answers are still being generated.
+
+    Answers are buffered and parsed in batches of `emit_every`. Per question the evaluator
+    keeps a histogram over the survey categories plus the count, sum and sum of squares of
+    all valid answers, so every update costs only the new answers. After each batch the
+    JS divergence between the answer distribution and the survey distribution is computed
+    for every question; the group has converged once the mean JS divergence moved less than
+    `tolerance` for `patience` batches in a row.
+    """
+
+    def __init__(self, group, survey_group_df, emit_every=500, tolerance=1e-3, patience=3,
+                 min_answers_per_question=10):
+        self.group = group
+        self.emit_every = emit_every
+        self.tolerance = tolerance
+        self.patience = patience
+        self.min_answers_per_question = min_answers_per_question
+
+        survey_long = survey_group_df.melt(var_name="Question", value_name="Survey_Response")
+        survey_counts = count_matrix(survey_long, "Question", "Survey_Response")
+        self.questions = survey_counts.index
+        self.categories = survey_counts.columns
+        self.survey_distribution = normalize_rows(survey_counts.to_numpy(dtype=float))
+
+        shape = (len(self.questions), len(self.categories))
+        self.histogram = np.zeros(shape)
+        self.n = np.zeros(len(self.questions))
+        self.sum = np.zeros(len(self.questions))
+        self.sum_squares = np.zeros(len(self.questions))
+
+        self.buffer = []
+        self.answers = 0
+        self.history = []
+        self.stable_batches = 0
+        self.converged = False
+
+    def add(self, question, response):
+        """
+        Adds one raw answer; returns a metrics snapshot whenever a batch is complete.
+        """
+        if question not in self.questions:
+            return None
+        self.buffer.append((question, response))
+        if len(self.buffer) >= self.emit_every:
+            return self.flush()
+        return None
+
+    def flush(self):
+        """
+        Parses the buffered answers, updates the running statistics and returns a snapshot.
+        """
+        if not self.buffer:
+            return self.snapshot()
+
+        questions, responses = zip(*self.buffer)
+        self.buffer = []
+        values = parse_response_series(pd.Series(responses, dtype=object).map(str)).to_numpy(dtype=float)
+        rows = self.questions.get_indexer(questions)
+
+        # 0 means the answer could not be parsed, like in the batch evaluation
+        valid = values != 0
+        rows, values = rows[valid], values[valid]
+        np.add.at(self.n, rows, 1)
+        np.add.at(self.sum, rows, values)
+        np.add.at(self.sum_squares, rows, values ** 2)
+
+        columns = self.categories.get_indexer(values)
+        in_survey = columns >= 0
+        np.add.at(self.histogram, (rows[in_survey], columns[in_survey]), 1)
+
+        self.answers += len(questions)
+        snapshot = self.snapshot()
+        self.update_convergence(snapshot)
+        return snapshot
+
+    def snapshot(self):
+        """
+        Per-question answer count, mean, standard deviation and JS divergence.
+        """
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = self.sum / self.n
+            variance = (self.sum_squares - self.n * mean ** 2) / (self.n - 1)
+        std = np.sqrt(np.clip(variance, 0, None))
+
+        js = js_divergence_rows(normalize_rows(self.histogram), self.survey_distribution)
+        enough = self.n >= self.min_answers_per_question
+        return pd.DataFrame({
+            "Answers": self.n.astype(int),
+            "Mean": mean,
+            "Standard_Deviation": np.where(self.n > 1, std, np.nan),
+            "JS Divergence": np.where(enough, js, np.nan),
+        }, index=self.questions.rename("Question"))
+
+    def update_convergence(self, snapshot):
+        js = snapshot["JS Divergence"]
+        if js.notna().sum() == 0:
+            return
+        mean_js = js.mean()
+        if self.history and abs(mean_js - self.history[-1]) < self.tolerance:
+            self.stable_batches += 1
+        else:
+            self.stable_batches = 0
+        self.history.append(mean_js)
+        self.converged = self.stable_batches >= self.patience
+
+
+class StreamingEvaluator:
+    """
+    Streaming evaluation of all groups against the survey.
+
+    Answers can be pushed in-process through `on_answer` (e.g. as the `on_answer` hook of
+    `GenerationEngine`, with `converged` as its `stop_persona` hook) or read from the JSONL
+    checkpoint logs of a running generation with `follow`.
+    """
+
+    def __init__(self, survey_df, group_conditions=GROUP_DEFINITIONS, excluded_questions=EXCLUDED_QUESTIONS,
+                 emit_every=500, tolerance=1e-3, patience=3, min_answers_per_question=10, on_emit=None):
+        self.survey_df = survey_df
+        self.group_conditions = group_conditions
+        self.questions = [q for q in survey_df.columns if q not in excluded_questions]
+        self.settings = dict(emit_every=emit_every, tolerance=tolerance, patience=patience,
+                             min_answers_per_question=min_answers_per_question)
+        self.on_emit = on_emit or self.print_summary
+        self.evaluators = {}
+
+    def evaluator(self, group):
+        """
+        The evaluator of a group, created on first use; None for unknown groups.
+        """
+        group = group_key(group)
+        if group not in self.evaluators:
+            if group not in self.group_conditions:
+                self.evaluators[group] = None
+            else:
+                survey_group_df = select_group(self.survey_df, self.group_conditions[group], self.questions)
+                self.evaluators[group] = StreamingGroupEvaluator(group, survey_group_df, **self.settings)
+        return self.evaluators[group]
+
+    def on_answer(self, group, run_key, variable_name, response):
+        evaluator = self.evaluator(group)
+        if evaluator is None:
+            return
+        snapshot = evaluator.add(variable_name, response)
+        if snapshot is not None:
+            self.on_emit(evaluator, snapshot)
+
+    def converged(self, group):
+        evaluator = self.evaluator(group)
+        return evaluator is not None and evaluator.converged
+
+    def flush(self):
+        """
+        Emits the metrics of all answers that are still buffered.
+        """
+        for evaluator in self.evaluators.values():
+            if evaluator is not None and evaluator.buffer:
+                self.on_emit(evaluator, evaluator.flush())
+
+    @staticmethod
+    def print_summary(evaluator, snapshot):
+        change = evaluator.history[-1] - evaluator.history[-2] if len(evaluator.history) > 1 else float("nan")
+        mean_js = evaluator.history[-1] if evaluator.history else float("nan")
+        status = "converged" if evaluator.converged else f"stable for {evaluator.stable_batches}/{evaluator.patience}"
+        print(f"[{evaluator.group}] {evaluator.answers} answers, "
+              f"mean std {snapshot['Standard_Deviation'].mean():.3f}, "
+              f"mean JS {mean_js:.4f} (change {change:+.4f}), {status}")
+
+    def follow(self, responses_dir, poll_interval=2.0, idle_timeout=None):
+        """
+        Tails all `*_LLM_Output.jsonl` logs in a directory and evaluates new answers.
+
+        Args:
+            responses_dir (str): Directory the generation writes to.
+            poll_interval (float): Seconds between two scans of the logs.
+            idle_timeout (float, optional): Stop after this many seconds without new answers;
+                runs until interrupted if None.
+        """
+        tailer = ResponseLogTailer(responses_dir)
+        last_answer = time.monotonic()
+        try:
+            while idle_timeout is None or time.monotonic() - last_answer < idle_timeout:
+                records = tailer.poll()
+                for record in records:
+                    self.on_answer(record["group"], record["run"], record["variable"], record["response"])
+                if records:
+                    last_answer = time.monotonic()
+                else:
+                    time.sleep(poll_interval)
+        except KeyboardInterrupt:
+            pass
+        self.flush()
+
+
+class ResponseLogTailer:
+    """
+    Reads the records appended to the JSONL checkpoint logs of a directory since the last poll.
+
+    Incomplete last lines are kept until their newline arrives. Logs that disappear (they
+    are removed once their persona is compacted) are forgotten.
+    """
+
+    def __init__(self, responses_dir):
+        self.responses_dir = responses_dir
+        self.offsets = {}
+        self.partial = {}
+
+    def poll(self):
+        records = []
+        log_files = set(glob.glob(os.path.join(self.responses_dir, "*_LLM_Output.jsonl")))
+        for log_file in set(self.offsets) - log_files:
+            self.offsets.pop(log_file, None)
+            self.partial.pop(log_file, None)
+
+        for log_file in sorted(log_files):
+            try:
+                with open(log_file, 'rb') as f:
+                    f.seek(self.offsets.get(log_file, 0))
+                    chunk = f.read()
+                    self.offsets[log_file] = f.tell()
+            except FileNotFoundError:
+                continue
+
+            lines = (self.partial.pop(log_file, b"") + chunk).split(b"\n")
+            if lines[-1]:
+                self.partial[log_file] = lines[-1]
+            for line in lines[:-1]:
+                if not line.strip():
+                    continue
+                try:
+                    records.append(json.loads(line.decode("utf-8")))
+                except ValueError:
+                    print(f"Skipping unreadable line in {log_file}")
+        return records
+
+
+if __name__ == "__main__":
+    # Usage: python streaming_eval.py [responses_dir]
+    responses_dir = sys.argv[1] if len(sys.argv) > 1 else RESPONSES_DIR
+    StreamingEvaluator(pd.read_csv(survey_file)).follow(responses_dir)
@@ -0,0 +1,191 @@
+import os
+import sys
+import argparse
+import tomllib
+
+# The evaluation modules import each other by module name
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "Evaluations"))
+
+DEFAULT_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "config.toml")
+
+# Output file of each evaluation below [paths] stats_dir
+METRIC_OUTPUTS = {
+    "stats": "all_evals_2.csv",
+    "sub_obj": "all_metrics_2.csv",
+    "bootstrap": "bootstrap_ci.csv",
+    "compare": "model_comparison.csv",
+}
+
+
+def load_config(config_path, overrides=()):
+    """
+    Reads the TOML config and applies `section.key=value` overrides.
+
+    Override values are parsed as TOML values (numbers, booleans, lists, quoted strings);
+    anything else is taken as a plain string.
+    """
+    with open(config_path, "rb") as f:
+        config = tomllib.load(f)
+
+    for override in overrides:
+        key, sep, value = override.partition("=")
+        section, dot, name = key.strip().partition(".")
+        if not sep or not dot:
+            raise ValueError(f"Overrides must look like section.key=value, got '{override}'")
+        try:
+            value = tomllib.loads(f"value = {value}")["value"]
+        except tomllib.TOMLDecodeError:
+            pass
+        config.setdefault(section, {})[name] = value
+    return config
+
+
+def parse_shard(text):
+    """
+    Parses `INDEX/COUNT` (e.g. `0/4`, the first of four shards) into a tuple.
+    """
+    try:
+        index, count = (int(part) for part in text.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Shards are given as INDEX/COUNT, got '{text}'")
+    if not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"Shard index must be between 0 and COUNT - 1, got '{text}'")
+    return index, count
+
+
+def shard_path(path, shard):
+    """
+    Output path of a shard, e.g. all_evals_2.shard-0-of-4.csv; the path itself without sharding.
+    """
+    if shard is None:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.shard-{shard[0]}-of-{shard[1]}{ext}"
+
+
+def select_groups(config, shard):
+    """
+    The group conditions to evaluate or plot, optionally restricted to one shard.
+    """
+    from group_index import GROUP_DEFINITIONS
+
+    include = config["groups"].get("include") or list(GROUP_DEFINITIONS)
+    unknown = [group for group in include if group not in GROUP_DEFINITIONS]
+    if unknown:
+        raise ValueError(f"Unknown groups in the config: {unknown}")
+    if shard is not None:
+        include = include[shard[0]::shard[1]]
+    return {group: GROUP_DEFINITIONS[group] for group in include}
+
+
+def run_generate(config, shard):
+    from main import generate
+
+    paths, settings = config["paths"], config["generate"]
+    generate(start_group=settings.get("start_group"), end_group=settings.get("end_group"), shard=shard,
+             model=settings["model"], api_url=settings["api_url"],
+             questions_file_path=paths["questions_file"], persona_file_path=paths["personas_file"],
+             response_cache_path=paths["response_cache"], responses_file_dir=paths["responses_dir"],
+             num_runs=settings["num_runs"], max_in_flight=settings["max_in_flight"],
+             batch_size=settings["batch_size"], prefix_order=settings.get("prefix_order", False),
+             max_tokens=settings.get("max_tokens") or None, stop_sequences=settings.get("stop", []),
+             stream=settings.get("stream", False),
+             adaptive_sampling=settings["adaptive_sampling"],
+             min_runs=settings["min_runs"], early_stopping=settings["early_stopping"],
+             score_options=settings.get("score_options", False),
+             survey_file_path=paths["survey_file"], endpoints=settings.get("endpoints", []),
+             metrics_file=settings.get("metrics_file", ""), metrics_interval=settings.get("metrics_interval", 15))
+
+
+def response_paths(config):
+    """
+    The response directories of the config as keyword arguments of the evaluation modules.
+    """
+    paths = config["paths"]
+    return {"responses_dir": paths["responses_dir"],
+            "cache_dir": paths.get("parsed_responses_dir", "data/5_parsed_responses")}
+
+
+def run_evaluate(config, shard):
+    paths, settings = config["paths"], config["evaluate"]
+    group_conditions = select_groups(config, shard)
+    excluded_questions = config["groups"]["excluded_questions"]
+    max_workers = settings.get("max_workers") or None
+    response_dirs = response_paths(config)
+
+    unknown = [metric for metric in settings["metrics"] if metric not in METRIC_OUTPUTS]
+    if unknown:
+        raise ValueError(f"Unknown metrics {unknown}, choose from {list(METRIC_OUTPUTS)}")
+    os.makedirs(paths["stats_dir"], exist_ok=True)
+
+    for metric in settings["metrics"]:
+        output_file = shard_path(os.path.join(paths["stats_dir"], METRIC_OUTPUTS[metric]), shard)
+        print(f"Running {metric} evaluation for {len(group_conditions)} groups into {output_file}")
+        if metric == "stats":
+            from stats_eval import sta_eval
+            sta_eval(paths["survey_file"], group_conditions, excluded_questions, model_dir=settings["model_dir"],
+                     max_workers=max_workers, output_file=output_file, incremental=settings["incremental"],
+                     num_runs=settings["num_runs"], **response_dirs)
+        elif metric == "sub_obj":
+            from sub_obj_eval import evaluate_responses
+            evaluate_responses(model_dir=settings["model_dir"], max_workers=max_workers,
+                               incremental=settings["incremental"], survey_file=paths["survey_file"],
+                               group_conditions=group_conditions, excluded_questions=excluded_questions,
+                               output_file=output_file, num_runs=settings["num_runs"], **response_dirs)
+        elif metric == "bootstrap":
+            from bootstrap import bootstrap_groups
+            bootstrap_groups(paths["survey_file"], group_conditions, excluded_questions,
+                             model_dir=settings["model_dir"], num_runs=settings["num_runs"], n_boot=settings["n_boot"],
+                             confidence=settings.get("confidence", 0.95), seed=settings.get("seed", 0),
+                             output_file=output_file, max_workers=max_workers, **response_dirs)
+        elif metric == "compare":
+            from model_comparison import compare_models
+            compare_models(settings["compare_model_dirs"], paths["survey_file"], group_conditions,
+                           excluded_questions, output_file=output_file, max_workers=max_workers,
+                           num_runs=settings["num_runs"], **response_dirs)
+
+
+def run_plot(config, shard):
+    from plot_pipeline import render_all
+
+    paths, settings = config["paths"], config["plot"]
+    render_all(settings.get("types") or None, select_groups(config, shard), num_runs=settings["num_runs"],
+               model_dir=settings["model_dir"], specific_questions=settings["specific_questions"],
+               max_workers=settings.get("max_workers") or None, survey_file=paths["survey_file"],
+               excluded_questions=config["groups"]["excluded_questions"], stats_dir=paths["stats_dir"],
+               plots_dir=paths.get("plots_dir", "docs/plots"), **response_paths(config))
+
+
+COMMANDS = {
+    "generate": (run_generate, "Generate persona responses with the LLM"),
+    "evaluate": (run_evaluate, "Evaluate the responses against the survey"),
+    "plot": (run_plot, "Render all plots below [paths] plots_dir"),
+}
+
+
+def main(argv=None):
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--config", default=DEFAULT_CONFIG,
+                        help="TOML config file; relative paths in it are resolved from its directory")
+    common.add_argument("--set", action="append", default=[], metavar="SECTION.KEY=VALUE",
+                        help="Override a config value, e.g. --set evaluate.max_workers=4 (repeatable)")
+    common.add_argument("--shard", type=parse_shard, metavar="INDEX/COUNT",
+                        help="Only process every COUNT-th persona or group, starting at INDEX (from 0)")
+
+    parser = argparse.ArgumentParser(description="Generate, evaluate and plot persona responses without prompts.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name, (_, help_text) in COMMANDS.items():
+        subparsers.add_parser(name, parents=[common], help=help_text)
+
+    args = parser.parse_args(argv)
+    try:
+        config = load_config(args.config, args.set)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    os.chdir(os.path.dirname(os.path.abspath(args.config)))
+    COMMANDS[args.command][0](config, args.shard)
+
+
+if __name__ == "__main__":
+    main()
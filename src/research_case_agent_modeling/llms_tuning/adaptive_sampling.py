@@ -0,0 +1,76 @@
+import math
+from collections import Counter, defaultdict
+
+# Two-sided normal quantiles for the supported confidence levels
+Z_VALUES = {0.80: 1.2816, 0.90: 1.6449, 0.95: 1.9600, 0.99: 2.5758}
+
+
+class AdaptiveSampler:
+    """
+    Decides per (persona, question) how many runs are needed.
+
+    Every answer is parsed to its option number and counted. A question stops being
+    sampled once it has at least `min_runs` runs and the confidence interval of every
+    option share in its answer distribution is narrower than `margin` on each side, or
+    once it reached `max_runs`. The share of an option is estimated as
+    (k + 1) / (n + 2), so a question that always gets the same answer still needs a
+    handful of runs before its interval is narrow enough.
+
+    Answers that cannot be parsed (0, e.g. error messages) use up a run but are not counted.
+    """
+
+    def __init__(self, parse_answer, min_runs: int = 10, max_runs: int = 50, step: int = 5,
+                 margin: float = 0.1, confidence: float = 0.95):
+        if confidence not in Z_VALUES:
+            raise ValueError(f"confidence must be one of {sorted(Z_VALUES)}")
+        if not 1 <= min_runs <= max_runs:
+            raise ValueError("min_runs must be between 1 and max_runs")
+        self.parse_answer = parse_answer
+        self.min_runs = min_runs
+        self.max_runs = max_runs
+        self.step = step
+        self.margin = margin
+        self.z = Z_VALUES[confidence]
+        self.counts = defaultdict(Counter)
+
+    def add(self, persona_name: str, variable_name: str, response: str):
+        value = self.parse_answer(response)
+        if value:
+            self.counts[(persona_name, variable_name)][value] += 1
+
+    def half_width(self, persona_name: str, variable_name: str) -> float:
+        """
+        Largest confidence interval half-width of the option shares of a question.
+        """
+        counts = self.counts.get((persona_name, variable_name))
+        if not counts:
+            return math.inf
+        n = sum(counts.values())
+        return max(self.z * math.sqrt(share * (1 - share) / (n + 2))
+                   for share in ((k + 1) / (n + 2) for k in counts.values()))
+
+    def needs_more(self, persona_name: str, variable_name: str, runs_used: int) -> bool:
+        """
+        Whether a question that already used `runs_used` runs should be asked again.
+        """
+        if runs_used >= self.max_runs:
+            return False
+        if runs_used < self.min_runs:
+            return True
+        return self.half_width(persona_name, variable_name) > self.margin
+
+    def next_runs(self, persona_name: str, variable_name: str, runs_used: int) -> int:
+        """
+        How many runs to schedule for a question in the next wave.
+        """
+        if not self.needs_more(persona_name, variable_name, runs_used):
+            return 0
+        wanted = self.min_runs - runs_used if runs_used < self.min_runs else self.step
+        return min(wanted, self.max_runs - runs_used)
+
+    def summary(self, persona_name: str, runs_used: dict) -> str:
+        calls = sum(runs_used.values())
+        full = self.max_runs * len(runs_used)
+        stopped = sum(1 for runs in runs_used.values() if runs < self.max_runs)
+        return (f"{calls} of {full} calls ({calls / full:.0%}), "
+                f"{stopped} of {len(runs_used)} questions stopped before {self.max_runs} runs")
@@ -0,0 +1,266 @@
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+from llms_tuning.llm_workflow import CustomLLM, CircuitBreaker
+
+
+class Endpoint:
+    """
+    One inference server with its own client, concurrency limit and health state.
+    """
+
+    def __init__(self, llm: CustomLLM, max_concurrency: int = 4, health_url: str = None):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.llm = llm
+        self.max_concurrency = max_concurrency
+        self.health_url = health_url or llm.api_url
+        self.name = llm.api_url
+        self.queue = deque()
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.completed = 0
+        self.failed = 0
+        self.stolen = 0
+        self.busy_seconds = 0.0
+
+    def summary(self) -> str:
+        mean = self.busy_seconds / self.completed if self.completed else 0.0
+        state = "healthy" if self.healthy else "unhealthy"
+        return (f"{self.name}: {self.completed} jobs ({self.stolen} stolen), {self.failed} failures, "
+                f"{mean:.2f}s per job, {state}")
+
+
+def build_endpoints(llm: CustomLLM, endpoint_settings: list, max_attempts: int = 2) -> list:
+    """
+    Creates one client per endpoint with the model, options, generation caps, prompts, cache and
+    telemetry of `llm`.
+
+    Args:
+        llm (CustomLLM): Client whose settings are copied.
+        endpoint_settings (list): Dicts with "url" and optionally "max_concurrency",
+            "model" (if a host serves the model under another name) and "health_url".
+        max_attempts (int): Attempts per request on the same endpoint before the job is
+            handed to another endpoint.
+    """
+    endpoints = []
+    for settings in endpoint_settings:
+        client = CustomLLM(model=settings.get("model", llm.model), api_url=settings["url"],
+                           timeout=llm.timeout, max_attempts=max_attempts,
+                           backoff_base=llm.backoff_base, backoff_max=llm.backoff_max,
+                           pool_size=settings.get("max_concurrency", 4) + 1, circuit_breaker=CircuitBreaker(),
+                           options=llm.options, cache=llm.cache, cache_per_sample=llm.cache_per_sample,
+                           telemetry=llm.telemetry, stream=llm.stream, max_tokens=llm.max_tokens, stop=llm.stop)
+        client.prompt_data = llm.prompt_data
+        endpoints.append(Endpoint(client, settings.get("max_concurrency", 4), settings.get("health_url")))
+    return endpoints
+
+
+class _Job:
+    def __init__(self, fn, args, prefix_key=None):
+        self.fn = fn
+        self.args = args
+        self.prefix_key = prefix_key
+        self.future = Future()
+        self.tried = set()
+
+
+class EndpointScheduler:
+    """
+    Spreads jobs over several inference endpoints.
+
+    Every endpoint has `max_concurrency` worker threads and its own queue. New jobs go to
+    the healthy endpoint with the fewest queued and running jobs per worker; a worker whose
+    queue is empty steals the newest job of the longest other queue, so faster hosts take
+    over the backlog of slower ones.
+
+    Jobs submitted with a `prefix_key` (e.g. the persona, whose system prompt starts every
+    request) stick to the endpoint that ran the last job with that key, as long as it is
+    at most `affinity_slack` jobs per worker busier than the least loaded endpoint. The
+    shared prompt prefix then stays in that server's prefix cache instead of being
+    evaluated again on every host. With `affinity_slack=None` prefix keys are ignored.
+
+    An endpoint is taken out of rotation after `failure_threshold` failed jobs in a row;
+    its queued jobs are then stolen by the others and the job that failed is handed to an
+    endpoint it has not failed on yet. A background thread probes every endpoint each
+    `health_check_interval` seconds (any HTTP answer below 500 counts as alive) and puts
+    it back into rotation once it answers again.
+
+    `submit(fn, *args)` returns a Future like `ThreadPoolExecutor.submit`; the job runs
+    as `fn(llm, *args)` with the client of the endpoint that picked it up.
+    """
+
+    def __init__(self, endpoints: list, failure_threshold: int = 3, health_check_interval: float = 30.0,
+                 health_check_timeout: float = 5.0, prefetch: int = 2, affinity_slack: float = 1.0):
+        if not endpoints:
+            raise ValueError("At least one endpoint is required")
+        self.endpoints = endpoints
+        self.failure_threshold = failure_threshold
+        self.health_check_interval = health_check_interval
+        self.health_check_timeout = health_check_timeout
+        self.affinity_slack = affinity_slack
+        # Prefix key -> endpoint that ran its last job
+        self._affinity = {}
+        # Jobs kept in flight per worker, so that idle workers find something to steal
+        self.max_in_flight = sum(endpoint.max_concurrency for endpoint in endpoints) * prefetch
+        self.running = {id(endpoint): 0 for endpoint in endpoints}
+        self._condition = threading.Condition()
+        self._closed = False
+
+        self._threads = []
+        for endpoint in endpoints:
+            for i in range(endpoint.max_concurrency):
+                thread = threading.Thread(target=self._worker, args=(endpoint,), daemon=True,
+                                          name=f"endpoint-{endpoint.name}-{i}")
+                thread.start()
+                self._threads.append(thread)
+        self._health_thread = threading.Thread(target=self._health_loop, daemon=True, name="endpoint-health")
+        self._health_thread.start()
+
+    def submit(self, fn, *args, prefix_key=None) -> Future:
+        job = _Job(fn, args, prefix_key)
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("The scheduler is closed")
+            self._assign(job)
+        return job.future
+
+    def _load(self, endpoint):
+        return (len(endpoint.queue) + self.running[id(endpoint)]) / endpoint.max_concurrency
+
+    def _assign(self, job):
+        """
+        Queues a job on the least loaded healthy endpoint it has not failed on, or on the
+        endpoint of its prefix key if that is not much busier. Caller holds the lock.
+        """
+        candidates = [e for e in self.endpoints if e.healthy and id(e) not in job.tried]
+        if not candidates:
+            candidates = [e for e in self.endpoints if id(e) not in job.tried] or self.endpoints
+        target = min(candidates, key=self._load)
+        preferred = self._affinity.get(job.prefix_key) if self.affinity_slack is not None else None
+        if (preferred is not None and any(e is preferred for e in candidates)
+                and self._load(preferred) <= self._load(target) + self.affinity_slack):
+            target = preferred
+        target.queue.append(job)
+        self._condition.notify_all()
+
+    def _take(self, endpoint):
+        """
+        Next job for a worker of `endpoint`: its own oldest job, else the newest job of the
+        longest other queue. Caller holds the lock.
+        """
+        if endpoint.queue:
+            return endpoint.queue.popleft()
+        victims = [e for e in self.endpoints if e is not endpoint and e.queue]
+        if not victims:
+            return None
+        victim = max(victims, key=lambda e: len(e.queue))
+        # A job that already failed here waits for another endpoint
+        for job in reversed(victim.queue):
+            if id(endpoint) not in job.tried:
+                victim.queue.remove(job)
+                endpoint.stolen += 1
+                return job
+        return None
+
+    def _worker(self, endpoint):
+        while True:
+            with self._condition:
+                job = None
+                while not self._closed:
+                    if endpoint.healthy:
+                        job = self._take(endpoint)
+                        if job is not None:
+                            break
+                    self._condition.wait()
+                if job is None:
+                    return
+                self.running[id(endpoint)] += 1
+                if job.prefix_key is not None:
+                    self._affinity[job.prefix_key] = endpoint
+
+            start = time.monotonic()
+            try:
+                result = job.fn(endpoint.llm, *job.args)
+                error = None
+            except Exception as e:
+                error = e
+            elapsed = time.monotonic() - start
+
+            with self._condition:
+                self.running[id(endpoint)] -= 1
+                if error is None:
+                    endpoint.completed += 1
+                    endpoint.busy_seconds += elapsed
+                    endpoint.consecutive_failures = 0
+                else:
+                    self._failed(endpoint, job, error)
+                self._condition.notify_all()
+            if error is None:
+                job.future.set_result(result)
+
+    def _failed(self, endpoint, job, error):
+        """
+        Counts a failure and retries the job elsewhere if possible. Caller holds the lock.
+        """
+        endpoint.failed += 1
+        endpoint.consecutive_failures += 1
+        if endpoint.healthy and endpoint.consecutive_failures >= self.failure_threshold:
+            endpoint.healthy = False
+            logging.warning(f"Endpoint {endpoint.name} failed {endpoint.consecutive_failures} jobs in a row; "
+                            f"taking it out of rotation until its health check succeeds.")
+
+        job.tried.add(id(endpoint))
+        if len(job.tried) < len(self.endpoints) and not self._closed:
+            logging.warning(f"Job failed on {endpoint.name}: {error}. Retrying on another endpoint.")
+            self._assign(job)
+        else:
+            job.future.set_exception(error)
+
+    def check_health(self, endpoint) -> bool:
+        try:
+            response = endpoint.llm.session.get(endpoint.health_url, timeout=self.health_check_timeout)
+            return response.status_code < 500
+        except Exception:
+            return False
+
+    def _health_loop(self):
+        while True:
+            with self._condition:
+                if self._condition.wait_for(lambda: self._closed, timeout=self.health_check_interval):
+                    return
+            for endpoint in self.endpoints:
+                alive = self.check_health(endpoint)
+                with self._condition:
+                    if alive and not endpoint.healthy:
+                        logging.warning(f"Endpoint {endpoint.name} is healthy again.")
+                        endpoint.consecutive_failures = 0
+                    elif not alive and endpoint.healthy:
+                        logging.warning(f"Endpoint {endpoint.name} failed its health check.")
+                    endpoint.healthy = alive
+                    self._condition.notify_all()
+
+    def summary(self) -> str:
+        with self._condition:
+            return "\n".join(endpoint.summary() for endpoint in self.endpoints)
+
+    def close(self):
+        """
+        Stops the workers once they finished their current job; queued jobs are cancelled.
+        """
+        with self._condition:
+            self._closed = True
+            for endpoint in self.endpoints:
+                while endpoint.queue:
+                    endpoint.queue.popleft().future.cancel()
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,459 @@
+import os
+import json
+from contextlib import nullcontext
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from llms_tuning.save_generated_response import (
+    ResponseLog, response_log_path, load_response_log, compact_response_log
+)
+
+# Yielded by the job generator when the next jobs depend on the answers still in flight
+WAIT = object()
+
+# Run key under which option scoring stores the distributions of a persona
+SCORES_RUN = "Scores"
+
+# Waves in a row without a single stored answer after which adaptive sampling gives up on a persona
+MAX_IDLE_WAVES = 3
+
+# Prefix of the error texts that earlier versions stored in place of failed answers
+ERROR_PREFIX = "Error: "
+
+
+def persona_output_file(responses_file_dir, persona_name, num_runs):
+    """
+    Builds the path of the JSON file holding all runs of a persona.
+    """
+    return f"{responses_file_dir}{persona_name.replace(' ', '_')}_{num_runs}_LLM_Output.json"
+
+
+def persona_distribution_file(responses_file_dir, persona_name, num_runs):
+    """
+    Builds the path of the JSON file holding the scored answer distributions of a persona,
+    standing in for `num_runs` sampled runs.
+    """
+    return f"{responses_file_dir}{persona_name.replace(' ', '_')}_{num_runs}_LLM_Distribution.json"
+
+
+def drop_failed_responses(all_run_responses):
+    """
+    Removes stored error texts of failed requests, so that their questions are asked again.
+
+    Returns:
+        int: Number of removed answers.
+    """
+    removed = 0
+    for run_responses in all_run_responses.values():
+        for variable_name in [variable_name for variable_name, response in run_responses.items()
+                              if isinstance(response, str) and response.startswith(ERROR_PREFIX)]:
+            del run_responses[variable_name]
+            removed += 1
+    return removed
+
+
+def ordered_responses(all_run_responses, variable_names):
+    """
+    The responses with the runs in numeric order and the answers of a run in question order.
+
+    Answers arrive in completion order, which differs from the order they were asked in
+    when requests run concurrently or all runs of a question are asked together.
+    """
+    def run_number(run_key):
+        suffix = run_key.rpartition("_")[2]
+        return (0, int(suffix), run_key) if suffix.isdigit() else (1, 0, run_key)
+
+    position = {variable_name: i for i, variable_name in enumerate(variable_names)}
+    return {
+        run_key: dict(sorted(all_run_responses[run_key].items(),
+                             key=lambda item: position.get(item[0], len(position))))
+        for run_key in sorted(all_run_responses, key=run_number)
+    }
+
+
+class PersonaState:
+    """
+    Bookkeeping for one persona while its jobs are in flight.
+
+    Only the thread driving the engine touches this object, so it needs no locking.
+    """
+
+    def __init__(self, persona_name, persona, run_file_name, all_run_responses, num_runs, log):
+        self.persona_name = persona_name
+        self.persona = persona
+        self.run_file_name = run_file_name
+        self.all_run_responses = all_run_responses
+        self.num_runs = num_runs
+        self.log = log
+        self.pending = 0
+        self.submitted_all = False
+
+
+class GenerationEngine:
+    """
+    Fans independent (persona, run, variable) jobs out to a thread pool.
+
+    The worker threads only perform the LLM calls; every result is written back by the
+    calling thread. Answers are appended to a per-persona JSONL log as they arrive and the
+    log is compacted into the usual `{Group}_{N}_LLM_Output.json` file once the persona is
+    done, so the output layout and the resume behaviour (skip completed runs and already
+    answered variables) stay the same as the sequential loop. Failed requests leave their
+    variable unanswered, so resuming asks it again.
+
+    With `batch_size` > 1, each job packs that many variables of one run into a single
+    request (see `CustomLLM.generate_batch_response`).
+
+    `on_answer(persona_name, run_key, variable_name, response)` is called for every stored
+    answer, e.g. to evaluate while generating. If `stop_persona(persona_name)` returns True,
+    no further jobs of that persona are submitted; the answers so far are saved as usual.
+
+    With a `sampler` (see `AdaptiveSampler`), questions are asked in waves of runs and
+    each question is only asked again while its answer distribution is not yet stable.
+
+    With a `scheduler` (see `EndpointScheduler`), the jobs are spread over several
+    inference endpoints instead of a thread pool calling `llm`; `llm` still provides the
+    questions. `max_in_flight` then defaults to the scheduler's own limit.
+
+    With `prefix_order`, the jobs of a persona are ordered by question instead of by run:
+    all runs of one question (or one batch of questions) are sent back to back, so the
+    server finds the persona's system prompt and the question prompt in its prefix (KV)
+    cache and only has to evaluate the new tokens. With a scheduler, the jobs of a persona
+    then also prefer the endpoint that served it before. The output files are the same.
+
+    With `telemetry` (see `Telemetry`), the stored answers are counted per persona and
+    the requests of each job are labelled with its persona; its summary is printed at
+    the end of `run`.
+
+    With `scoring`, every question is asked once and the probabilities of the options are
+    read from the model (see `CustomLLM.score_options`) instead of sampling `num_runs`
+    answers. The distributions are written to `{Group}_{N}_LLM_Distribution.json` as
+    {variable_name: {option: probability}}, which the evaluations use in place of the
+    sampled runs. Resuming skips the questions that are already scored.
+    """
+
+    def __init__(self, llm, max_in_flight: int = 8, fsync: bool = True, batch_size: int = 1,
+                 on_answer=None, stop_persona=None, sampler=None, scheduler=None, telemetry=None,
+                 prefix_order: bool = False, scoring: bool = False):
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        if scoring and (sampler is not None or on_answer is not None or stop_persona is not None):
+            raise ValueError("Option scoring asks every question once and cannot be combined with "
+                             "adaptive sampling or early stopping")
+        self.llm = llm
+        self.max_in_flight = max_in_flight
+        self.fsync = fsync
+        self.batch_size = batch_size
+        self.on_answer = on_answer
+        self.stop_persona = stop_persona
+        self.sampler = sampler
+        self.scheduler = scheduler
+        self.telemetry = telemetry
+        self.prefix_order = prefix_order
+        self.scoring = scoring
+        if scheduler is not None:
+            self.max_in_flight = scheduler.max_in_flight
+
+    def load_persona(self, persona_data, num_runs, responses_file_dir):
+        """
+        Creates the state of a persona, loading previous responses and replaying its log.
+        """
+        persona_name = persona_data.get("Group", "Unnamed Persona")
+        persona = persona_data.get("Persona Prompt", "No prompt available")
+
+        if self.scoring:
+            run_file_name = persona_distribution_file(responses_file_dir, persona_name, num_runs)
+        else:
+            run_file_name = persona_output_file(responses_file_dir, persona_name, num_runs)
+        all_run_responses = {}
+        if os.path.exists(run_file_name):
+            print(f"Loading existing responses from {run_file_name}...")
+            with open(run_file_name, "r") as json_file:
+                all_run_responses = json.load(json_file)
+            if self.scoring:
+                all_run_responses = {SCORES_RUN: all_run_responses}
+
+        log_file = response_log_path(run_file_name)
+        if os.path.exists(log_file):
+            print(f"Replaying checkpoint log {log_file}...")
+            all_run_responses = load_response_log(log_file, all_run_responses)
+
+        failed = drop_failed_responses(all_run_responses)
+        if failed:
+            print(f"Retrying {failed} failed answers of {persona_name}")
+
+        log = ResponseLog(log_file, group=persona_name, fsync=self.fsync)
+        return PersonaState(persona_name, persona, run_file_name, all_run_responses, num_runs, log)
+
+    def persona_jobs(self, state):
+        """
+        Yields (run_key, variable_names) chunks of a persona that still need an answer.
+        """
+        if self.sampler is not None:
+            yield from self.adaptive_persona_jobs(state)
+            return
+
+        variable_names = list(self.llm.prompt_data.keys())
+
+        if self.scoring:
+            # One request per question replaces all of its runs
+            scores = state.all_run_responses.get(SCORES_RUN, {})
+            for variable_name in variable_names:
+                if variable_name not in scores:
+                    yield SCORES_RUN, [variable_name]
+            return
+
+        open_runs = []
+        for run_number in range(1, state.num_runs + 1):
+            run_key = f"Run_{run_number}"
+            run_responses = state.all_run_responses.get(run_key, {})
+            if len(run_responses) == len(variable_names):
+                print(f"Skipping completed run {run_number} for Persona: {state.persona_name}")
+                continue
+            open_runs.append((run_key, [variable_name for variable_name in variable_names
+                                        if variable_name not in run_responses]))
+
+        if not self.prefix_order:
+            for run_key, missing in open_runs:
+                for start in range(0, len(missing), self.batch_size):
+                    yield run_key, missing[start:start + self.batch_size]
+            return
+
+        # The same chunks of questions in every run, so that identical prompts follow each other
+        for start in range(0, len(variable_names), self.batch_size):
+            chunk = set(variable_names[start:start + self.batch_size])
+            for run_key, missing in open_runs:
+                variables = [variable_name for variable_name in missing if variable_name in chunk]
+                if variables:
+                    yield run_key, variables
+
+    def adaptive_persona_jobs(self, state):
+        """
+        Yields the jobs of a persona in waves, followed by WAIT after each wave.
+
+        A wave asks every question that still needs runs for its next runs (the first
+        `min_runs`, then `step` at a time). Questions use the lowest run numbers they have
+        not answered yet, so their runs stay contiguous and resuming works as before.
+
+        Only stored answers count towards a question's runs, so failed requests are asked
+        again in the next wave. After MAX_IDLE_WAVES waves in a row without any stored
+        answer the persona stops; its remaining runs are asked when the sweep is resumed.
+        """
+        variable_names = list(self.llm.prompt_data.keys())
+        for run_responses in state.all_run_responses.values():
+            for variable_name, response in run_responses.items():
+                if variable_name in self.llm.prompt_data:
+                    self.sampler.add(state.persona_name, variable_name, response)
+
+        answered_before, idle_waves = None, 0
+        while True:
+            used_runs = {variable_name: set() for variable_name in variable_names}
+            for run_key, run_responses in state.all_run_responses.items():
+                for variable_name in run_responses:
+                    if variable_name in used_runs:
+                        used_runs[variable_name].add(run_key)
+            answered = sum(len(used) for used in used_runs.values())
+
+            wave = defaultdict(list)
+            for variable_name in variable_names:
+                used = used_runs[variable_name]
+                new_runs = self.sampler.next_runs(state.persona_name, variable_name, len(used))
+                run_number = 0
+                while new_runs > 0:
+                    run_number += 1
+                    run_key = f"Run_{run_number}"
+                    if run_key not in used:
+                        used.add(run_key)
+                        wave[run_number].append(variable_name)
+                        new_runs -= 1
+
+            if not wave:
+                break
+            idle_waves = idle_waves + 1 if answered == answered_before else 0
+            if idle_waves >= MAX_IDLE_WAVES:
+                print(f"No answers in the last {idle_waves} waves for Persona: {state.persona_name}, "
+                      f"its remaining runs are asked when the sweep is resumed")
+                break
+            answered_before = answered
+            for run_number in sorted(wave):
+                missing = wave[run_number]
+                for start in range(0, len(missing), self.batch_size):
+                    yield f"Run_{run_number}", missing[start:start + self.batch_size]
+            yield WAIT
+
+    def iter_jobs(self, personas, num_runs, responses_file_dir):
+        """
+        Lazily yields (state, run_key, variable_names) jobs for all personas in order.
+        """
+        for persona_data in personas:
+            state = self.load_persona(persona_data, num_runs, responses_file_dir)
+            print(f"\nRunning for Persona: {state.persona_name}...\n")
+            for job in self.persona_jobs(state):
+                if job is WAIT:
+                    yield WAIT
+                    continue
+                run_key, variable_names = job
+                if self.stop_persona is not None and self.stop_persona(state.persona_name):
+                    print(f"Stopping Persona early: {state.persona_name}")
+                    break
+                state.pending += len(variable_names)
+                yield state, run_key, variable_names
+            state.submitted_all = True
+            if state.pending == 0:
+                self.finish_persona(state)
+
+    def call_llm(self, persona, run_key, variable_names, llm=None, persona_name=None):
+        """
+        Runs inside a worker thread; returns (variable_name, answer or None, error) triples.
+        """
+        if self.telemetry is not None:
+            with self.telemetry.context(persona=persona_name):
+                return self._call_llm(persona, run_key, variable_names, llm or self.llm)
+        return self._call_llm(persona, run_key, variable_names, llm or self.llm)
+
+    def _call_llm(self, persona, run_key, variable_names, llm):
+        if self.scoring:
+            return [self._score(persona, variable_name, llm) for variable_name in variable_names]
+
+        answers = {}
+        if len(variable_names) > 1:
+            try:
+                answers = llm.generate_batch_response(persona, variable_names, sample_key=run_key, fallback=False)
+            except Exception as e:
+                print(f"Batched request failed for {run_key}: {e}. Falling back to single questions.")
+
+        results = []
+        for variable_name in variable_names:
+            if variable_name in answers:
+                results.append((variable_name, answers[variable_name], None))
+                continue
+            try:
+                results.append((variable_name, llm.generate_response(persona, variable_name, sample_key=run_key), None))
+            except Exception as e:
+                results.append((variable_name, None, e))
+        return results
+
+    def _score(self, persona, variable_name, llm):
+        try:
+            distribution = llm.score_options(persona, variable_name)
+        except Exception as e:
+            return variable_name, None, e
+        return variable_name, {str(option): round(probability, 6) for option, probability in distribution.items()}, None
+
+    def call_endpoint(self, llm, persona, run_key, variable_names, persona_name=None):
+        """
+        Runs on an endpoint of the scheduler; raises if no question could be answered, so
+        that the scheduler hands the job to another endpoint.
+        """
+        results = self.call_llm(persona, run_key, variable_names, llm, persona_name)
+        errors = [error for _, _, error in results if error is not None]
+        if len(errors) == len(results):
+            raise errors[0]
+        return results
+
+    def submit(self, executor, state, run_key, variable_names):
+        if self.scheduler is not None:
+            return executor.submit(self.call_endpoint, state.persona, run_key, variable_names, state.persona_name,
+                                   prefix_key=state.persona_name if self.prefix_order else None)
+        return executor.submit(self.call_llm, state.persona, run_key, variable_names, None, state.persona_name)
+
+    def record(self, state, run_key, variable_name, response, error):
+        """
+        Stores one answer and appends it to the persona's checkpoint log.
+
+        Failed requests are not stored, so the question stays unanswered and is asked again
+        when the sweep is resumed.
+        """
+        if error is None:
+            state.all_run_responses.setdefault(run_key, {})[variable_name] = response
+            state.log.append(run_key, variable_name, response)
+        if self.telemetry is not None:
+            self.telemetry.increment("generation_answers_total", persona=state.persona_name,
+                                     status="ok" if error is None else "error")
+        if error is None:
+            print(f"Generated response for {state.persona_name}, {run_key}, {variable_name}: {response}")
+        else:
+            print(f"Error generating response for {state.persona_name}, {run_key}, {variable_name}: {error}")
+
+        state.pending -= 1
+        if error is None and self.sampler is not None:
+            self.sampler.add(state.persona_name, variable_name, response)
+        if error is None and self.on_answer is not None:
+            self.on_answer(state.persona_name, run_key, variable_name, response)
+
+        if len(state.all_run_responses.get(run_key, {})) == len(self.llm.prompt_data):
+            print(f"Completed {run_key} for Persona: {state.persona_name}")
+
+        if state.submitted_all and state.pending == 0:
+            self.finish_persona(state)
+
+    def finish_persona(self, state):
+        """
+        Compacts the log of a persona into its JSON file once all of its jobs are done.
+        """
+        state.log.close()
+        state.all_run_responses = ordered_responses(state.all_run_responses, list(self.llm.prompt_data))
+        if self.scoring:
+            compact_response_log(state.all_run_responses.get(SCORES_RUN, {}), state.run_file_name, state.log.log_file)
+        else:
+            compact_response_log(state.all_run_responses, state.run_file_name, state.log.log_file)
+        print(f"Finished Persona: {state.persona_name}, responses saved to {state.run_file_name}")
+        if self.sampler is not None:
+            runs_used = {variable_name: sum(variable_name in run_responses for run_responses in state.all_run_responses.values())
+                         for variable_name in self.llm.prompt_data}
+            print(f"Adaptive sampling for {state.persona_name}: {self.sampler.summary(state.persona_name, runs_used)}")
+
+    def run(self, personas, num_runs, responses_file_dir):
+        """
+        Generates all missing responses for the given personas.
+
+        At most `max_in_flight` requests are outstanding at any time; new jobs are only
+        pulled from the (lazy) job generator when a slot frees up.
+        """
+        jobs = self.iter_jobs(personas, num_runs, responses_file_dir)
+        in_flight = {}
+
+        if self.scheduler is not None:
+            executor_context = nullcontext(self.scheduler)
+        else:
+            executor_context = ThreadPoolExecutor(max_workers=self.max_in_flight)
+
+        with executor_context as executor:
+            exhausted = False
+            waiting = False
+            while True:
+                while not exhausted and not waiting and len(in_flight) < self.max_in_flight:
+                    job = next(jobs, None)
+                    if job is None:
+                        exhausted = True
+                        break
+                    if job is WAIT:
+                        waiting = True
+                        break
+                    state, run_key, variable_names = job
+                    future = self.submit(executor, state, run_key, variable_names)
+                    in_flight[future] = job
+
+                if not in_flight:
+                    if waiting:
+                        waiting = False
+                        continue
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    state, run_key, variable_names = in_flight.pop(future)
+                    try:
+                        results = future.result()
+                    except Exception as e:
+                        # Every endpoint failed on this job
+                        results = [(variable_name, None, e) for variable_name in variable_names]
+                    for variable_name, response, error in results:
+                        self.record(state, run_key, variable_name, response, error)
+
+        if self.scheduler is not None:
+            print(f"Endpoints:\n{self.scheduler.summary()}")
+        if getattr(self.llm, "cache", None) is not None:
+            print(f"Response cache: {self.llm.cache.stats()}")
+        if self.telemetry is not None:
+            print(f"Requests:\n{self.telemetry.summary()}")
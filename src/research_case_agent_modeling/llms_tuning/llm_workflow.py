@@ -1,12 +1,99 @@
+import json
+import time
+import random
+import threading
 import requests
 import logging
-from llms_tuning.prompts_generation import prepare_prompt_data, generate_prompt
+from requests.adapters import HTTPAdapter
+from llms_tuning.prompts_generation import (
+    prepare_prompt_data, generate_prompt, generate_batch_prompt, parse_batch_response, answered_option,
+    generate_scoring_prompt, option_distribution
+)
+from llms_tuning.response_cache import ResponseCache, cache_key
+from llms_tuning.telemetry import Telemetry
+
+
+class CircuitBreaker:
+    """
+    Pauses every caller once the endpoint has failed too many times in a row.
+
+    After `failure_threshold` consecutive failures the breaker opens and all threads
+    wait `cooldown` seconds before the next attempt, instead of each of them
+    hammering an endpoint that is down.
+    """
+
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self._lock = threading.Lock()
+
+    def wait_until_closed(self):
+        """
+        Blocks while the breaker is open.
+        """
+        while True:
+            with self._lock:
+                remaining = self.open_until - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(remaining)
+
+    def record_success(self):
+        with self._lock:
+            self.consecutive_failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= self.failure_threshold:
+                self.open_until = time.monotonic() + self.cooldown
+                self.consecutive_failures = 0
+                logging.warning(f"Endpoint failed {self.failure_threshold} times in a row. Pausing for {self.cooldown}s.")
+
 
 class CustomLLM:
-    def __init__(self, model: str, api_url: str):
+    def __init__(self, model: str, api_url: str,
+                 timeout: float = 120.0,
+                 max_attempts: int = 5,
+                 backoff_base: float = 1.0,
+                 backoff_max: float = 60.0,
+                 pool_size: int = 16,
+                 circuit_breaker: CircuitBreaker = None,
+                 options: dict = None,
+                 cache: ResponseCache = None,
+                 cache_per_sample: bool = True,
+                 telemetry: Telemetry = None,
+                 stream: bool = False,
+                 max_tokens: int = None,
+                 stop: list = None):
         self.model = model
         self.api_url = api_url
         self.prompt_data = None  # Placeholder for prompt mappings
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.options = options  # Sampling settings forwarded to the endpoint, e.g. {'temperature': 0}
+        self.cache = cache
+        # With sampling, every run is an independent draw and is cached under its own key;
+        # deterministic settings can share one cached answer across runs.
+        self.cache_per_sample = cache_per_sample
+        # Request latency, errors, retries and reply sizes labelled by model and endpoint
+        self.telemetry = telemetry
+        # Read replies token by token and hang up once the answer is known (see `read_stream`)
+        self.stream = stream
+        # Generation caps sent as the `num_predict` and `stop` options of the endpoint
+        self.max_tokens = max_tokens
+        self.stop = stop
+
+        # Keep-alive connections shared by all threads calling this client
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
 
     def load_prompt_data(self, file_path: str):
         """
@@ -22,26 +109,232 @@ class CustomLLM:
             raise ValueError("Prompt data has not been loaded. Call `load_prompt_data` first.")
         return generate_prompt(variable_name, self.prompt_data)
 
-    def generate_response(self, persona: str, variable_name: str) -> str:
+    def backoff_delay(self, attempt: int) -> float:
         """
-        Generates a response from the LLM using a specific variable's prompt.
+        Exponential backoff with full jitter for the given (1-based) attempt.
         """
-        while True:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+    def record_request(self, start: float, status: str):
+        """
+        Records the duration and status of a finished request started at `start`.
+        """
+        if self.telemetry is None:
+            return
+        labels = {"model": self.model, "endpoint": self.api_url}
+        self.telemetry.observe("llm_request_seconds", time.perf_counter() - start, **labels)
+        self.telemetry.increment("llm_requests_total", status=status, **labels)
+        self.telemetry.add_gauge("llm_in_flight", -1, **labels)
+
+    def request_options(self) -> dict:
+        """
+        Sampling options of a request, including the generation caps.
+        """
+        options = dict(self.options or {})
+        if self.max_tokens:
+            options['num_predict'] = self.max_tokens
+        if self.stop:
+            options['stop'] = list(self.stop)
+        return options
+
+    def read_stream(self, payload: dict, until=None) -> dict:
+        """
+        Requests a streamed reply and reads it chunk by chunk (newline delimited JSON).
+
+        As soon as `until(text so far)` is true the connection is closed, which makes the
+        server stop generating; the reply then has `done_reason` "early_stop" and the number
+        of chunks read as `eval_count`.
+
+        Returns:
+            dict: The last chunk with the whole text as `response`.
+        """
+        parts = []
+        last = {}
+        with self.session.post(self.api_url, json=dict(payload, stream=True), timeout=self.timeout,
+                               stream=True) as response:
+            response.raise_for_status()
+            # Lines as soon as their chunk arrives instead of waiting for 512 bytes
+            for line in response.iter_lines(chunk_size=None):
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if 'error' in chunk:
+                    raise RuntimeError(chunk['error'])
+                parts.append(chunk.get('response', ''))
+                last = chunk
+                if chunk.get('done'):
+                    break
+                if until is not None and until(''.join(parts)):
+                    last = dict(chunk, done=True, done_reason='early_stop', eval_count=len(parts))
+                    break
+            else:
+                raise RuntimeError("Stream ended before the reply was done")
+        return dict(last, response=''.join(parts))
+
+    def post(self, payload: dict, until=None, stream: bool = None) -> dict:
+        """
+        Sends a payload to the endpoint, retrying with backoff up to `max_attempts` times.
+
+        With `stream` (the client's setting unless given), the reply is streamed and
+        reading stops once `until(text)` is true.
+        """
+        stream = self.stream if stream is None else stream
+        for attempt in range(1, self.max_attempts + 1):
+            self.circuit_breaker.wait_until_closed()
+            start = time.perf_counter()
+            if self.telemetry is not None:
+                self.telemetry.add_gauge("llm_in_flight", 1, model=self.model, endpoint=self.api_url)
             try:
-                # Generate the prompt
-                prompt = self.generate_prompt(variable_name)
-                
-                # Make the API call
-                response = requests.post(
-                    self.api_url,
-                    json={
-                        'model': self.model,
-                        'prompt': prompt,
-                        'system': persona
-                    }
-                )
-                response.raise_for_status()
-                result = response.json().get('response', '').strip()
+                if stream:
+                    result = self.read_stream(payload, until)
+                else:
+                    response = self.session.post(self.api_url, json=payload, timeout=self.timeout)
+                    response.raise_for_status()
+                    result = response.json()
+                self.circuit_breaker.record_success()
+                self.record_request(start, "ok")
                 return result
             except Exception as e:
-                logging.warning(f"Error occurred during LLM call: {e}. Retrying....")
+                self.circuit_breaker.record_failure()
+                self.record_request(start, "error")
+                if attempt == self.max_attempts:
+                    logging.warning(f"Error occurred during LLM call: {e}. Giving up after {attempt} attempts.")
+                    raise
+                if self.telemetry is not None:
+                    self.telemetry.increment("llm_retries_total", model=self.model, endpoint=self.api_url)
+                delay = self.backoff_delay(attempt)
+                logging.warning(f"Error occurred during LLM call: {e}. Retrying in {delay:.1f}s ({attempt}/{self.max_attempts})....")
+                time.sleep(delay)
+
+    def complete(self, persona: str, prompt: str, sample_key: str = None, until=None) -> str:
+        """
+        Sends a prompt with a persona as system prompt and returns the stripped reply.
+
+        If a cache is configured, identical calls (same model, persona, prompt, options and
+        `sample_key`) are answered from it without touching the network. With `stream`,
+        generation stops once `until(reply so far)` is true; such replies may end right
+        after the answer, so they are cached apart from complete ones.
+        """
+        options = self.request_options()
+        key = None
+        if self.cache is not None:
+            key_options = dict(options, early_stop=True) if self.stream and until is not None else options
+            key = cache_key(self.model, persona, prompt, key_options or None,
+                            sample_key if self.cache_per_sample else None)
+            cached = self.cache.get(key)
+            if cached is not None:
+                if self.telemetry is not None:
+                    self.telemetry.increment("llm_cache_hits_total", model=self.model, endpoint=self.api_url)
+                return cached
+
+        payload = {
+            'model': self.model,
+            'prompt': prompt,
+            'system': persona
+        }
+        if options:
+            payload['options'] = options
+
+        # Make the API call
+        reply = self.post(payload, until)
+        result = reply.get('response', '').strip()
+        if self.telemetry is not None:
+            # Generated tokens, i.e. the GPU time spent on the reply
+            if 'eval_count' in reply:
+                self.telemetry.observe("llm_eval_tokens", reply['eval_count'], model=self.model, endpoint=self.api_url)
+            if reply.get('done_reason') == 'early_stop':
+                self.telemetry.increment("llm_early_stops_total", model=self.model, endpoint=self.api_url)
+            self.telemetry.observe("llm_response_chars", len(result), model=self.model, endpoint=self.api_url)
+            # Prompt tokens the server evaluated, i.e. not found in its prefix cache (Ollama)
+            if 'prompt_eval_count' in reply:
+                self.telemetry.observe("llm_prompt_eval_tokens", reply['prompt_eval_count'],
+                                       model=self.model, endpoint=self.api_url)
+        if key is not None:
+            self.cache.put(key, result)
+        return result
+
+    def generate_response(self, persona: str, variable_name: str, sample_key: str = None) -> str:
+        """
+        Generates a response from the LLM using a specific variable's prompt.
+
+        When streaming, generation stops once a complete line names a valid option.
+        """
+        # Generate the prompt
+        prompt = self.generate_prompt(variable_name)
+        char_to_label = self.prompt_data[variable_name]['char_to_label']
+        return self.complete(persona, prompt, sample_key,
+                             until=lambda text: answered_option(text, char_to_label) is not None)
+
+    def score_options(self, persona: str, variable_name: str, top_logprobs: int = 20) -> dict:
+        """
+        Estimates the answer distribution of a question from a single request.
+
+        The model generates one token with its `top_logprobs` most likely alternatives
+        (`logprobs` of the generate endpoint, Ollama 0.12 or newer); their probabilities are
+        mapped to the option numbers with `option_distribution`. Options that are not among
+        the top tokens get no probability, and multi-digit options need a tokenizer that
+        keeps numbers in one token (like Llama 3).
+
+        Returns:
+            dict: Probability per option number, summing to 1.
+
+        Raises:
+            ValueError: If no option number is among the top tokens.
+        """
+        if self.prompt_data is None:
+            raise ValueError("Prompt data has not been loaded. Call `load_prompt_data` first.")
+        payload = {
+            'model': self.model,
+            'prompt': generate_scoring_prompt(variable_name, self.prompt_data),
+            'system': persona,
+            'options': dict(self.request_options(), num_predict=1),
+            'logprobs': True,
+            'top_logprobs': top_logprobs,
+        }
+        reply = self.post(payload, stream=False)
+        if self.telemetry is not None and 'prompt_eval_count' in reply:
+            self.telemetry.observe("llm_prompt_eval_tokens", reply['prompt_eval_count'],
+                                   model=self.model, endpoint=self.api_url)
+        tokens = reply.get('logprobs') or []
+        if not tokens:
+            raise ValueError("The endpoint returned no logprobs")
+        distribution = option_distribution(tokens[0].get('top_logprobs') or [tokens[0]],
+                                           self.prompt_data[variable_name]['char_to_label'])
+        if not distribution:
+            raise ValueError(f"No response option among the top {top_logprobs} tokens of {variable_name}")
+        return distribution
+
+    def generate_batch_response(self, persona: str, variable_names: list, sample_key: str = None,
+                                fallback: bool = True) -> dict:
+        """
+        Answers several variables with one request.
+
+        The questions are packed into one prompt with a JSON answer format. Variables whose
+        answer is missing or cannot be parsed are asked again one by one, unless `fallback`
+        is False, in which case they are simply left out of the result.
+
+        Returns:
+            dict: Mapping of variable name to response.
+        """
+        if self.prompt_data is None:
+            raise ValueError("Prompt data has not been loaded. Call `load_prompt_data` first.")
+
+        responses = {}
+        if len(variable_names) > 1:
+            prompt = generate_batch_prompt(variable_names, self.prompt_data)
+            try:
+                # When streaming, stop once the JSON object holds a valid answer for every question
+                reply = self.complete(persona, prompt, sample_key,
+                                      until=lambda text: text.rstrip().endswith("}") and len(
+                                          parse_batch_response(text, variable_names, self.prompt_data)) == len(variable_names))
+                responses = parse_batch_response(reply, variable_names, self.prompt_data)
+            except Exception as e:
+                logging.warning(f"Batched LLM call failed: {e}. Falling back to single questions.")
+
+        if not fallback:
+            return responses
+
+        for variable_name in variable_names:
+            if variable_name not in responses:
+                responses[variable_name] = self.generate_response(persona, variable_name, sample_key)
+        return responses
@@ -44,6 +44,23 @@ def get_persona_by_group(personas, start_group=None, end_group=None):
 
     return personas[start_index:end_index]
 
+def get_persona_shard(personas, index, count):
+    """
+    Retrieves every `count`-th persona starting at `index`, so that `count` machines
+    can each generate a disjoint share of the personas.
+
+    Args:
+        personas (list): List of persona dictionaries.
+        index (int): Shard number, from 0 to count - 1.
+        count (int): Total number of shards.
+
+    Returns:
+        list: The personas of the shard.
+    """
+    if not 0 <= index < count:
+        raise ValueError(f"Shard index must be between 0 and {count - 1}, got {index}.")
+    return personas[index::count]
+
 if __name__ == "__main__":
     json_file_path = 'data/2_personas/LLM_persona_prompts.json'
     personas = load_personas(json_file_path)
@@ -1,10 +1,15 @@
-import pandas as pd
+import re
+import math
+import json
 
 def prepare_prompt_data(file_path):
     """
     Reads a CSV file and prepares a dictionary mapping custom variable names
     to their respective prompts and value labels.
     """
+    # Only needed here, so that importing the LLM client does not load pandas
+    import pandas as pd
+
     data = pd.read_csv(file_path)
     required_columns = ['Custom_variable_name', 'Text', 'Characteristic', 'Value_labels']
     if not all(col in data.columns for col in required_columns):
@@ -35,3 +40,128 @@ def generate_prompt(variable_name, prompt_data):
     mappings = "\n".join([f"{num}: {label}" for num, label in char_to_label.items()])
     return f"{text}\n\nResponse Options:\n{mappings}"
 
+
+def generate_scoring_prompt(variable_name, prompt_data):
+    """
+    Generates a prompt whose reply starts with the option number, for scoring the options
+    by the probabilities of the first token.
+    """
+    return f"{generate_prompt(variable_name, prompt_data)}\n\nReply only with the number of the chosen response option."
+
+
+def option_distribution(top_logprobs, char_to_label):
+    """
+    Turns the most likely first tokens of a reply into a distribution over the options.
+
+    The probabilities of the tokens that are a valid option number (ignoring surrounding
+    whitespace) are summed per option and normalised; other tokens, e.g. the start of an
+    explanation, are left out.
+
+    Args:
+        top_logprobs (list): Dicts with "token" and "logprob", as in the `top_logprobs`
+            of the endpoint's reply.
+        char_to_label (dict): Valid option numbers of the question and their labels.
+
+    Returns:
+        dict: Probability per option number in the order of `char_to_label`; empty if no
+        token is a valid option.
+    """
+    scores = {}
+    for entry in top_logprobs:
+        token = entry.get("token", "").strip()
+        if token.isdigit() and int(token) in char_to_label:
+            scores[int(token)] = scores.get(int(token), 0.0) + math.exp(entry["logprob"])
+    total = sum(scores.values())
+    if not total:
+        return {}
+    return {option: scores[option] / total for option in char_to_label if option in scores}
+
+
+# Option patterns of `extract_numerical_value` in the order it applies them
+ANSWER_PATTERNS = [
+    re.compile(r'\b(\d+):'),
+    re.compile(r'Category\s+(\d+)'),
+    re.compile(r'Option\s+(\d+)'),
+    re.compile(r'(?m)^\s*(\d+)\s*$'),
+]
+
+
+def answered_option(text, char_to_label):
+    """
+    Returns the option chosen in a partial reply once the line naming it is complete.
+
+    Only lines followed by a newline are looked at, so "1" is not taken for the start of
+    "10". Used to stop streaming a reply as soon as its answer is known.
+
+    Args:
+        text (str): Reply received so far.
+        char_to_label (dict): Valid option numbers of the question and their labels.
+
+    Returns:
+        int: The first valid option number, or None while no complete line names one.
+    """
+    complete = text[:text.rfind("\n") + 1]
+    if not complete:
+        return None
+    for pattern in ANSWER_PATTERNS:
+        for match in pattern.finditer(complete):
+            option = int(match.group(1))
+            if option in char_to_label:
+                return option
+    return None
+
+
+def generate_batch_prompt(variable_names, prompt_data):
+    """
+    Generates one prompt that asks several questions at once.
+
+    The model is asked to reply with a JSON object mapping each question id to the number
+    of the chosen response option, so the answers can be split back per variable.
+    """
+    questions = "\n\n".join(
+        f"Question id: {variable_name}\n{generate_prompt(variable_name, prompt_data)}"
+        for variable_name in variable_names
+    )
+    example = ", ".join(f'"{variable_name}": <number>' for variable_name in variable_names)
+    return (
+        f"Answer each of the following {len(variable_names)} questions.\n\n"
+        f"{questions}\n\n"
+        f"Reply only with a JSON object that maps every question id to the number of the chosen response option, "
+        f"e.g. {{{example}}}."
+    )
+
+
+def parse_batch_response(response, variable_names, prompt_data):
+    """
+    Splits a batched reply back into per-variable answers.
+
+    Args:
+        response (str): Raw reply of the model.
+        variable_names (list): Question ids that were asked.
+        prompt_data (dict): Prepared prompt data, used to validate the chosen options.
+
+    Returns:
+        dict: Answers in the same "<number>: <label>" form as single-question replies, only
+        for the variables whose answer could be parsed and is a valid option.
+    """
+    start, end = response.find("{"), response.rfind("}")
+    if start == -1 or end <= start:
+        return {}
+    try:
+        answers = json.loads(response[start:end + 1])
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(answers, dict):
+        return {}
+
+    parsed = {}
+    for variable_name in variable_names:
+        value = answers.get(variable_name)
+        match = re.match(r'^\s*(\d+)', str(value)) if value is not None else None
+        if not match:
+            continue
+        option = int(match.group(1))
+        char_to_label = prompt_data[variable_name]['char_to_label']
+        if option in char_to_label:
+            parsed[variable_name] = f"{option}: {char_to_label[option]}"
+    return parsed
@@ -0,0 +1,116 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+
+def cache_key(model: str, system: str, prompt: str, options: dict = None, sample_key: str = None) -> str:
+    """
+    Builds a content address for one LLM call.
+
+    Args:
+        model (str): Model name sent to the endpoint.
+        system (str): Persona (system) prompt.
+        prompt (str): Generated question prompt.
+        options (dict, optional): Sampling settings sent to the endpoint.
+        sample_key (str, optional): Distinguishes independent samples of the same input
+            (e.g. the run key), so sampled runs are not collapsed into one cached answer.
+
+    Returns:
+        str: Hex SHA-256 digest of the canonical JSON encoding of the inputs.
+    """
+    payload = json.dumps(
+        {"model": model, "system": system, "prompt": prompt, "options": options or {}, "sample": sample_key},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Persistent SQLite cache of LLM responses with size based LRU eviction.
+
+    The cache is safe to share between the worker threads of the generation engine.
+    """
+
+    def __init__(self, db_path: str, max_bytes: int = 512 * 1024 * 1024):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON responses (last_access)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, key: str):
+        """
+        Returns the cached response for a key, or None on a miss.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, response: str):
+        """
+        Stores a response and evicts the least recently used entries above `max_bytes`.
+        """
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, response, size, time.time()),
+            )
+            self._total_bytes += size - (old[0] if old else 0)
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM responses ORDER BY last_access LIMIT 100"
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if self._total_bytes <= self.max_bytes:
+                    break
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._total_bytes -= size
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        """
+        Returns hit/miss counters and the current size of the cache.
+        """
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": self._total_bytes,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,5 +1,7 @@
+import os
 import csv
 import json
+import tempfile
 
 def save_responses_to_csv(responses, output_file):
     """
@@ -12,12 +14,111 @@ def save_responses_to_csv(responses, output_file):
             writer.writerow([tag, response])
 
 
+def _atomic_write_json(data, output_file):
+    """
+    Writes JSON to a temporary file and atomically renames it over `output_file`,
+    so a crash while saving never leaves a truncated file behind.
+    """
+    directory = os.path.dirname(os.path.abspath(output_file))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            json.dump(data, file, indent=4, ensure_ascii=False)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, output_file)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
 def save_responses_to_json(responses, output_file):
     """
     Saves LLM responses to a JSON file.
     """
     try:
-        with open(output_file, 'w', encoding='utf-8') as file:
-            json.dump(responses, file, indent=4, ensure_ascii=False)
+        _atomic_write_json(responses, output_file)
     except Exception as e:
-        print(f"Error saving responses to JSON: {e}")
\ No newline at end of file
+        print(f"Error saving responses to JSON: {e}")
+
+
+def response_log_path(output_file):
+    """
+    Returns the path of the append-only log that belongs to a JSON output file.
+    """
+    base, ext = os.path.splitext(output_file)
+    return f"{base}.jsonl" if ext == ".json" else f"{output_file}.jsonl"
+
+
+class ResponseLog:
+    """
+    Append-only JSONL checkpoint of generated answers.
+
+    Every answer is written as one line {"group", "run", "variable", "response"}, so the
+    cost of a checkpoint is independent of how many runs are already done.
+    """
+
+    def __init__(self, log_file, group=None, fsync=True):
+        self.log_file = log_file
+        self.group = group
+        self.fsync = fsync
+        self._file = None
+
+    def append(self, run_key, variable_name, response):
+        """
+        Appends one answer to the log and flushes it to disk.
+        """
+        if self._file is None:
+            self._file = open(self.log_file, 'a', encoding='utf-8')
+            if self._file.tell() > 0:
+                # Terminate a torn last line so the next record starts on its own line
+                with open(self.log_file, 'rb') as existing:
+                    existing.seek(-1, os.SEEK_END)
+                    if existing.read(1) != b"\n":
+                        self._file.write("\n")
+        record = {"group": self.group, "run": run_key, "variable": variable_name, "response": response}
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def load_response_log(log_file, responses=None):
+    """
+    Replays a JSONL log on top of already loaded responses.
+
+    Args:
+        log_file (str): Path of the JSONL log.
+        responses (dict, optional): Responses loaded from the JSON output file.
+
+    Returns:
+        dict: The responses as {run_key: {variable_name: response}}.
+    """
+    responses = responses if responses is not None else {}
+    if not os.path.exists(log_file):
+        return responses
+
+    with open(log_file, 'r', encoding='utf-8') as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A torn last line from a crash mid-write; everything before it is intact
+                continue
+            responses.setdefault(record["run"], {})[record["variable"]] = record["response"]
+    return responses
+
+
+def compact_response_log(responses, output_file, log_file=None):
+    """
+    Atomically writes the complete responses to the JSON output file and removes the log.
+    """
+    log_file = log_file or response_log_path(output_file)
+    _atomic_write_json(responses, output_file)
+    if os.path.exists(log_file):
+        os.remove(log_file)
\ No newline at end of file
@@ -0,0 +1,236 @@
+import re
+import math
+import zlib
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Answers like the generate endpoint of the inference server, without a model.
+
+    POST requests get `{"response": "<answer>"}` after `delay` seconds, where the answer is
+    a random option number taken from the "1: ..." value labels of the prompt (1 to 5 if
+    the prompt has none). With probability `fail_rate` the request fails with HTTP 500.
+    GET requests (health checks) get HTTP 200 while the server is `up`, with the prefix
+    cache statistics in the body.
+
+    The prefix (KV) cache of a server is simulated with `cache_slots` slots that each hold
+    the tokens (words) of one earlier system prompt + prompt. A request reuses the slot
+    with the longest common prefix and only the remaining tokens are evaluated, which
+    takes `prefill_delay` seconds per token; like Ollama, the reply reports them as
+    `prompt_eval_count`. `prompt_tokens` and `cached_tokens` count all prompt tokens and
+    those found in the cache.
+
+    With `chatter`, the reply is "<option>: <label>" followed by that many words of
+    explanation, like a verbose model. Generating takes `token_delay` seconds per token
+    (word); the `num_predict` and `stop` options cap the reply. Requests with
+    `"stream": true` get one JSON line per token, and a client that hangs up stops the
+    generation. `tokens_generated` counts the tokens generated for all replies.
+
+    Requests with `"logprobs": true` are answered with the most likely option and the
+    `top_logprobs` of that first token: every option gets a probability that is fixed per
+    system prompt and prompt, and a little of the mass goes to tokens that are no option.
+    """
+
+    # Keep-alive connections and chunked streams like the real server
+    protocol_version = "HTTP/1.1"
+    delay = 0.05
+    fail_rate = 0.0
+    prefill_delay = 0.0
+    cache_slots = 4
+    chatter = 0
+    token_delay = 0.0
+    up = True
+    requests_served = 0
+    prompt_tokens = 0
+    cached_tokens = 0
+    tokens_generated = 0
+    slots = []
+    lock = threading.Lock()
+
+    def do_GET(self):
+        self.reply(200 if self.up else 503, {"status": "ok" if self.up else "down",
+                                             "prompt_tokens": self.prompt_tokens, "cached_tokens": self.cached_tokens,
+                                             "tokens_generated": self.tokens_generated})
+
+    def prefill(self, payload):
+        """
+        Looks the prompt up in the simulated prefix cache; returns the number of evaluated tokens.
+        """
+        tokens = payload.get("system", "").split() + ["<prompt>"] + payload.get("prompt", "").split()
+        handler = type(self)
+        with self.lock:
+            best, cached = None, 0
+            for i, slot in enumerate(handler.slots):
+                common = 0
+                for a, b in zip(slot, tokens):
+                    if a != b:
+                        break
+                    common += 1
+                if common > cached:
+                    best, cached = i, common
+            if best is not None:
+                handler.slots.pop(best)
+            elif len(handler.slots) >= self.cache_slots:
+                handler.slots.pop(0)
+            # Most recently used slot last
+            handler.slots.append(tokens)
+            handler.prompt_tokens += len(tokens)
+            handler.cached_tokens += cached
+        return len(tokens) - cached
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.up or random.random() < self.fail_rate:
+            time.sleep(self.delay)
+            self.reply(500, {"error": "stub failure"})
+            return
+        evaluated = self.prefill(payload)
+        time.sleep(self.delay + self.prefill_delay * evaluated)
+
+        options = re.findall(r'(?m)^\s*(\d+):\s*(.*)$', payload.get("prompt", ""))
+        answer, label = random.choice(options or [(str(number), "") for number in range(1, 6)])
+        top_logprobs = None
+        if payload.get("logprobs"):
+            top_logprobs = self.top_logprobs(payload, options)
+            answer, label = top_logprobs[0]["token"], dict(options).get(top_logprobs[0]["token"], "")
+        text = str(answer)
+        if self.chatter:
+            text = f"{answer}: {label}\n\n" + " ".join(random.choice(["because", "my", "community", "values", "this"])
+                                                      for _ in range(self.chatter))
+        tokens = self.cap(re.findall(r'\S+\s*', text), payload.get("options") or {})
+
+        with self.lock:
+            type(self).requests_served += 1
+        body = {"model": payload.get("model"), "done": True, "prompt_eval_count": evaluated}
+        if top_logprobs is not None:
+            body["logprobs"] = [dict(top_logprobs[0], top_logprobs=top_logprobs)]
+        if payload.get("stream"):
+            self.stream(tokens, body)
+            return
+        time.sleep(self.token_delay * len(tokens))
+        self.count_tokens(len(tokens))
+        self.reply(200, dict(body, response="".join(tokens), eval_count=len(tokens)))
+
+    def top_logprobs(self, payload, options):
+        """
+        The `top_logprobs` most likely first tokens of the reply, most likely first.
+        """
+        rng = random.Random(zlib.crc32((payload.get("system", "") + payload.get("prompt", "")).encode("utf-8")))
+        weights = {number: rng.random() ** 2 for number, _ in options or [(str(number), "") for number in range(1, 6)]}
+        weights.update({"The": 0.02, "I": 0.01})
+        total = sum(weights.values())
+        top = sorted(({"token": token, "logprob": math.log(weight / total)} for token, weight in weights.items()),
+                     key=lambda entry: -entry["logprob"])
+        return top[:payload.get("top_logprobs") or 1]
+
+    def cap(self, tokens, options):
+        """
+        Applies the `num_predict` and `stop` options to the tokens of a reply.
+        """
+        text = "".join(tokens)
+        cut = min((text.index(sequence) for sequence in options.get("stop") or [] if sequence in text), default=None)
+        if cut is not None:
+            tokens = re.findall(r'\S+\s*', text[:cut])
+        if options.get("num_predict"):
+            tokens = tokens[:options["num_predict"]]
+        return tokens
+
+    def count_tokens(self, count):
+        with self.lock:
+            type(self).tokens_generated += count
+
+    def stream(self, tokens, body):
+        """
+        Sends one JSON line per token as a chunk; stops generating once the client hangs up.
+        """
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        generated = 0
+        try:
+            for token in tokens:
+                time.sleep(self.token_delay)
+                generated += 1
+                self.write_chunk({"model": body["model"], "response": token, "done": False})
+            self.write_chunk(dict(body, response="", eval_count=generated))
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+        finally:
+            self.count_tokens(generated)
+
+    def write_chunk(self, message):
+        data = json.dumps(message).encode("utf-8") + b"\n"
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def reply(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def stub_handler(**settings):
+    """
+    A handler class with its own settings (see StubHandler), counters and prefix cache.
+    """
+    state = {"up": True, "requests_served": 0, "prompt_tokens": 0, "cached_tokens": 0, "tokens_generated": 0, "slots": [],
+             "lock": threading.Lock()}
+    return type("StubHandler", (StubHandler,), dict(state, **settings))
+
+
+def start_stub_server(port: int = 0, delay: float = 0.05, fail_rate: float = 0.0, prefill_delay: float = 0.0,
+                      cache_slots: int = 4, chatter: int = 0, token_delay: float = 0.0):
+    """
+    Starts a stub endpoint in a background thread.
+
+    Every server gets its own handler class, so `delay`, `fail_rate` and `up` can be
+    changed and the counters read per server while it runs (`server.RequestHandlerClass.up = False`).
+
+    Returns:
+        ThreadingHTTPServer: The running server; its URL is
+        f"http://127.0.0.1:{server.server_port}/api/generate". Stop it with `shutdown()`.
+    """
+    handler = stub_handler(delay=delay, fail_rate=fail_rate, prefill_delay=prefill_delay, cache_slots=cache_slots,
+                           chatter=chatter, token_delay=token_delay)
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    # Usage: python -m llms_tuning.stub_server --port 8001 --delay 0.2
+    parser = argparse.ArgumentParser(description="Stub inference endpoint for local tests of the generation.")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--delay", type=float, default=0.05, help="Seconds per request")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Share of requests answered with HTTP 500")
+    parser.add_argument("--prefill-delay", type=float, default=0.0, help="Seconds per prompt token not in the prefix cache")
+    parser.add_argument("--cache-slots", type=int, default=4, help="Prompts kept in the simulated prefix cache")
+    parser.add_argument("--chatter", type=int, default=0, help="Words of explanation after the answer")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="Seconds per generated token")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port),
+                                 stub_handler(delay=args.delay, fail_rate=args.fail_rate,
+                                              prefill_delay=args.prefill_delay, cache_slots=args.cache_slots,
+                                              chatter=args.chatter, token_delay=args.token_delay))
+    print(f"Stub endpoint listening on http://127.0.0.1:{args.port}/api/generate")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
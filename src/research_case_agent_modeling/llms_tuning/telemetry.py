@@ -0,0 +1,296 @@
+import os
+import json
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from collections import defaultdict
+
+# Upper bounds of the histogram buckets; the last bucket (+Inf) takes everything above
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.075, 0.1, 0.15, 0.2, 0.3, 0.4, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 4.0,
+                   5.0, 7.5, 10.0, 15.0, 20.0, 30.0, 45.0, 60.0, 90.0, 120.0, 180.0, 300.0)
+SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000)
+
+# Name -> (type, help, histogram buckets) of the metrics recorded by the generation
+METRICS = {
+    "llm_request_seconds": ("histogram", "Duration of one HTTP request to the inference endpoint.", LATENCY_BUCKETS),
+    "llm_requests_total": ("counter", "HTTP requests to the inference endpoint by status (ok, error).", None),
+    "llm_retries_total": ("counter", "Requests that were retried after an error.", None),
+    "llm_response_chars": ("histogram", "Length of the stripped model replies in characters.", SIZE_BUCKETS),
+    "llm_prompt_eval_tokens": ("histogram", "Prompt tokens evaluated by the server, without those found in its prefix cache.",
+                               SIZE_BUCKETS),
+    "llm_eval_tokens": ("histogram", "Tokens generated per reply (chunks read for streamed replies stopped early).",
+                        SIZE_BUCKETS),
+    "llm_early_stops_total": ("counter", "Streamed replies closed as soon as their answer was complete.", None),
+    "llm_cache_hits_total": ("counter", "Calls answered from the response cache without a request.", None),
+    "llm_in_flight": ("gauge", "Requests currently waiting for the inference endpoint.", None),
+    "generation_answers_total": ("counter", "Answers stored by the generation engine by status (ok, error).", None),
+}
+
+
+class Histogram:
+    """
+    Bucketed distribution of observed values with count, sum, minimum and maximum.
+
+    Quantiles are interpolated linearly within the bucket that contains them, like
+    `histogram_quantile` of Prometheus, so their precision is the bucket width.
+    """
+
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if count and cumulative + count >= rank:
+                low = self.bounds[i - 1] if i > 0 else min(self.min, self.bounds[0])
+                high = self.bounds[i] if i < len(self.bounds) else self.max
+                low, high = max(low, self.min), min(high, self.max)
+                return low + (high - low) * (rank - cumulative) / count
+            cumulative += count
+        return self.max
+
+    def to_dict(self) -> dict:
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(list(self.bounds) + ["+Inf"], self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "buckets": buckets,
+        }
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels, extra=()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Telemetry:
+    """
+    Thread-safe counters, gauges and histograms of the generation.
+
+    Every series is identified by a metric name (see METRICS) and its labels, e.g.
+    `llm_request_seconds{model=..., endpoint=..., persona=...}`. Labels set with
+    `context(...)` in a thread are added to everything that thread records, which is how
+    the generation engine attaches the persona to the requests of `CustomLLM`.
+
+    With a `path`, `start()` writes all metrics to that file every `interval` seconds and
+    `close()` writes them a last time. Files ending in .json get JSON, any other file the
+    Prometheus text format (e.g. for the textfile collector of node_exporter). The file
+    is replaced atomically, so readers never see a partial write.
+    """
+
+    def __init__(self, path: str = None, interval: float = 15.0):
+        self.path = path
+        self.interval = interval
+        self.started = time.time()
+        self.counters = defaultdict(float)
+        self.gauges = defaultdict(float)
+        self.histograms = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @contextmanager
+    def context(self, **labels):
+        """
+        Adds labels to every metric recorded by the current thread inside the block.
+        """
+        previous = getattr(self._local, "labels", {})
+        self._local.labels = dict(previous, **labels)
+        try:
+            yield
+        finally:
+            self._local.labels = previous
+
+    def _series(self, name, labels):
+        return name, _label_key(dict(getattr(self._local, "labels", {}), **labels))
+
+    def increment(self, name: str, value: float = 1, **labels):
+        series = self._series(name, labels)
+        with self._lock:
+            self.counters[series] += value
+
+    def add_gauge(self, name: str, value: float, **labels):
+        # Gauges describe the current state, so they do not take the thread's context labels
+        series = name, _label_key(labels)
+        with self._lock:
+            self.gauges[series] += value
+
+    def observe(self, name: str, value: float, **labels):
+        series = self._series(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(series)
+            if histogram is None:
+                histogram = self.histograms[series] = Histogram(METRICS.get(name, (None, None, LATENCY_BUCKETS))[2])
+            histogram.observe(value)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            def entries(series_values, convert):
+                return [{"name": name, "labels": dict(labels), **convert(value)}
+                        for (name, labels), value in sorted(series_values.items())]
+
+            return {
+                "timestamp": time.time(),
+                "uptime_seconds": time.time() - self.started,
+                "counters": entries(self.counters, lambda value: {"value": value}),
+                "gauges": entries(self.gauges, lambda value: {"value": value}),
+                "histograms": entries(self.histograms, Histogram.to_dict),
+            }
+
+    def to_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            series = [(name, labels, value) for (name, labels), value in self.counters.items()]
+            series += [(name, labels, value) for (name, labels), value in self.gauges.items()]
+            series += [(name, labels, value.to_dict()) for (name, labels), value in self.histograms.items()]
+
+        described = set()
+        for name, labels, value in sorted(series, key=lambda entry: (entry[0], entry[1])):
+            if name not in described:
+                metric_type, help_text, _ = METRICS.get(name, ("untyped", name, None))
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+                described.add(name)
+            if not isinstance(value, dict):
+                lines.append(f"{name}{_format_labels(labels)} {value:g}")
+                continue
+            for bound, count in value["buckets"].items():
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {value['sum']:g}")
+            lines.append(f"{name}_count{_format_labels(labels)} {value['count']}")
+        return "\n".join(lines) + "\n"
+
+    def flush(self):
+        """
+        Writes all metrics to `path`, if one is set.
+        """
+        if not self.path:
+            return
+        if self.path.endswith(".json"):
+            content = json.dumps(self.to_dict(), indent=4)
+        else:
+            content = self.to_prometheus()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w") as f:
+            f.write(content)
+        os.replace(temporary, self.path)
+
+    def start(self):
+        """
+        Flushes the metrics every `interval` seconds in a background thread.
+        """
+        if not self.path or self._thread is not None:
+            return self
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._flush_loop, daemon=True, name="telemetry-flush")
+        self._thread.start()
+        return self
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def close(self):
+        """
+        Stops the periodic flushing and writes the metrics a last time.
+        """
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def summary(self) -> str:
+        """
+        Requests, throughput, errors, retries, latency and reply size per model and endpoint.
+        """
+        elapsed = max(time.time() - self.started, 1e-9)
+        totals = defaultdict(lambda: {"ok": 0, "error": 0, "retries": 0, "cache_hits": 0,
+                                      "early_stops": 0, "latency": None, "chars": None, "prompt": None,
+                                      "generated": None})
+        with self._lock:
+            for (name, labels), value in self.counters.items():
+                key = {"llm_requests_total": None, "llm_retries_total": "retries",
+                       "llm_cache_hits_total": "cache_hits", "llm_early_stops_total": "early_stops"}.get(name, "")
+                if key == "":
+                    continue
+                labels = dict(labels)
+                entry = totals[(labels.get("model", ""), labels.get("endpoint", ""))]
+                entry[key or labels.get("status", "ok")] += value
+            for (name, labels), histogram in self.histograms.items():
+                key = {"llm_request_seconds": "latency", "llm_response_chars": "chars",
+                       "llm_prompt_eval_tokens": "prompt", "llm_eval_tokens": "generated"}.get(name)
+                if key is None:
+                    continue
+                labels = dict(labels)
+                entry = totals[(labels.get("model", ""), labels.get("endpoint", ""))]
+                if entry[key] is None:
+                    entry[key] = Histogram(histogram.bounds)
+                merged = entry[key]
+                merged.counts = [a + b for a, b in zip(merged.counts, histogram.counts)]
+                merged.count += histogram.count
+                merged.sum += histogram.sum
+                merged.min = min(merged.min, histogram.min)
+                merged.max = max(merged.max, histogram.max)
+
+        lines = []
+        for (model, endpoint), entry in sorted(totals.items()):
+            requests = entry["ok"] + entry["error"]
+            line = (f"{endpoint or 'unknown endpoint'} ({model or 'unknown model'}): {requests:.0f} requests, "
+                    f"{requests / elapsed:.2f} req/s, {entry['error']:.0f} errors, {entry['retries']:.0f} retries, "
+                    f"{entry['cache_hits']:.0f} cache hits")
+            latency = entry["latency"]
+            if latency is not None and latency.count:
+                line += (f", latency p50 {latency.quantile(0.5):.2f}s p90 {latency.quantile(0.9):.2f}s "
+                         f"p99 {latency.quantile(0.99):.2f}s max {latency.max:.2f}s")
+            chars = entry["chars"]
+            if chars is not None and chars.count:
+                line += f", {chars.sum / chars.count:.0f} chars per reply"
+            prompt = entry["prompt"]
+            if prompt is not None and prompt.count:
+                line += f", {prompt.sum / prompt.count:.0f} prompt tokens evaluated per request"
+            generated = entry["generated"]
+            if generated is not None and generated.count:
+                line += f", {generated.sum / generated.count:.0f} tokens generated per reply"
+            if entry["early_stops"]:
+                line += f", {entry['early_stops']:.0f} streams stopped early"
+            lines.append(line)
+        return "\n".join(lines) if lines else "No requests recorded."
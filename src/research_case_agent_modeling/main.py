@@ -1,98 +1,170 @@
 import sys
 import os
-import pandas as pd
-import json
 from llms_tuning.llm_workflow import CustomLLM
-from llms_tuning.save_generated_response import save_responses_to_json
-from llms_tuning.load_personas import load_personas, get_persona_by_group
+from llms_tuning.generation_engine import GenerationEngine
+from llms_tuning.response_cache import ResponseCache
+from llms_tuning.telemetry import Telemetry
+from llms_tuning.adaptive_sampling import AdaptiveSampler
+from llms_tuning.endpoint_scheduler import EndpointScheduler, build_endpoints
+from llms_tuning.load_personas import load_personas, get_persona_by_group, get_persona_shard
 
 questions_file_path = "data/0_Reformated_SOSEC_Code-book_US_November_Reformulated_Questions_For_Dict.csv"
 persona_file_path = "data/2_personas/LLM_persona_prompts.json"
 
-llm = CustomLLM(model="llama3.1:70b-instruct-q6_K", api_url="https://inf.cl.uni-trier.de/")
-llm.load_prompt_data(questions_file_path)
+# Responses are cached on disk per (model, persona, prompt, sampling options, run)
+response_cache_path = "data/llm_response_cache.sqlite"
 
-personas = load_personas(persona_file_path)
-
-# Get starting and ending group from the user
-start_group = input("Enter the starting persona group (or press Enter to start from the first): ").strip()
-end_group = input("Enter the ending persona group (or press Enter to include all remaining): ").strip()
-
-try:
-    filtered_personas = get_persona_by_group(personas, start_group, end_group)
-except ValueError as e:
-    print(e)
-    sys.exit(1)
+model = "llama3.1:70b-instruct-q6_K"
+api_url = "https://inf.cl.uni-trier.de/"
 
 # Set the number of runs
-num_runs = 50 
+num_runs = 50
+
+# Number of concurrent requests sent to the inference server
+max_in_flight = 8
+
+# Number of questions packed into one request (1 sends every question on its own)
+batch_size = 1
+
+# Send all runs of a question back to back instead of run after run, so that the server can
+# answer them from its prefix cache of the persona and question prompt. Off by default, as it
+# changes the order in which the requests of a sweep are sent
+prefix_order = False
+
+# Cap the reply length: at most `max_tokens` generated tokens (None for no cap), and stop at
+# any of `stop_sequences`, e.g. ["\n\n"] as the answer line is complete at the first blank line
+max_tokens = None
+stop_sequences = []
+# Stream the replies and close the connection as soon as they contain a valid answer,
+# so that the server stops generating the explanation that usually follows
+stream = False
+
+# Ask every question at least `min_runs` times and then only until its answer distribution
+# is stable, at most `num_runs` times (see llms_tuning/adaptive_sampling.py)
+adaptive_sampling = False
+min_runs = 10
+
+# Evaluate the answers against the survey while generating and stop a persona once its
+# metrics have converged (see Evaluations/streaming_eval.py)
+early_stopping = False
+
+# Read the probabilities of the response options from one request per question instead of
+# sampling `num_runs` answers (needs an endpoint that returns logprobs). The distributions
+# are written to {Group}_{num_runs}_LLM_Distribution.json, which the evaluations use in
+# place of the sampled runs (see llms_tuning/generation_engine.py)
+score_options = False
+survey_file_path = "data/1_combined_preprocess/9_processed_data_for_personas_Format_1.csv"
 
 responses_file_dir = "data/3_responces/"
-os.makedirs(responses_file_dir, exist_ok=True)
-
-# Test cases and validation
-print("Starting Test Cases...")
-if not os.path.exists(questions_file_path):
-    print("Error: CSV file not found at path:", questions_file_path)
-    sys.exit(1)
-
-if not os.path.exists(persona_file_path):
-    print("Error: JSON file not found at path:", persona_file_path)
-    sys.exit(1)
-
-if not personas:
-    print("Error: No personas loaded from JSON file.")
-    sys.exit(1)
-
-print("All test cases passed. Beginning response generation...")
-
-# Iterate over all personas
-for persona_data in filtered_personas:
-    persona_name = persona_data.get("Group", "Unnamed Persona")
-    persona = persona_data.get("Persona Prompt", "No prompt available")
-
-    all_run_responses = {}
-
-    print(f"\nRunning for Persona: {persona_name}...\n")
-
-    # Check if a previous file exists and load it
-    run_file_name = f"{responses_file_dir}{persona_name.replace(' ', '_')}_{num_runs}_LLM_Output.json"
-    if os.path.exists(run_file_name):
-        print(f"Loading existing responses from {run_file_name}...")
-        with open(run_file_name, "r") as json_file:
-            all_run_responses = json.load(json_file)
-
-    for run_number in range(1, num_runs + 1):
-        run_key = f"Run_{run_number}"
-        if run_key in all_run_responses and len(all_run_responses[run_key]) == len(llm.prompt_data):
-            print(f"Skipping completed run {run_number} for Persona: {persona_name}")
-            continue
-
-        run_responses = all_run_responses.get(run_key, {})
-        print(f"Running for Persona: {persona_name}, Run {run_number}...")
-
-        for idx, variable_name in enumerate(llm.prompt_data.keys(), start=1):
-            if variable_name in run_responses:
-                print(f"Skipping {variable_name} (already processed in Run {run_number})")
-                continue
-
-            try:
-                response = llm.generate_response(persona, variable_name)
-                run_responses[variable_name] = response
-                print(f"Generated response for {variable_name}: {response}")
-            except Exception as e:
-                run_responses[variable_name] = f"Error: {e}"
-                print(f"Error generating response for {variable_name}: {e}")
-
-            # Save responses to JSON every 10 iterations
-            if idx % 10 == 0 or idx == len(llm.prompt_data):
-                all_run_responses[run_key] = run_responses
-                save_responses_to_json(all_run_responses, run_file_name)
-                print(f"Responses saved incrementally to {run_file_name} (Processed {idx}/{len(llm.prompt_data)}, {run_number}/{num_runs})")
-
-        # Store the responses for the current run
-        all_run_responses[run_key] = run_responses
-
-        # Save responses to JSON after each run
-        save_responses_to_json(all_run_responses, run_file_name)
-        print(f"Responses saved to {run_file_name} after Run {run_number}")
+
+# Spread the requests over several inference servers instead of `api_url`, e.g.
+# [{"url": "http://gpu-1:11434/api/generate", "max_concurrency": 8}, ...]
+# (see llms_tuning/endpoint_scheduler.py)
+endpoints = []
+
+# Request latency, throughput, error and retry metrics, rewritten every `metrics_interval`
+# seconds; Prometheus text format, or JSON if the file ends in .json (empty to disable)
+metrics_file = "data/generation_metrics.prom"
+metrics_interval = 15
+
+
+def generate(start_group=None, end_group=None, shard=None, model=model, api_url=api_url,
+             questions_file_path=questions_file_path, persona_file_path=persona_file_path,
+             response_cache_path=response_cache_path, responses_file_dir=responses_file_dir,
+             num_runs=num_runs, max_in_flight=max_in_flight, batch_size=batch_size, prefix_order=prefix_order,
+             max_tokens=max_tokens, stop_sequences=stop_sequences, stream=stream,
+             adaptive_sampling=adaptive_sampling, min_runs=min_runs,
+             early_stopping=early_stopping, score_options=score_options, survey_file_path=survey_file_path,
+             endpoints=endpoints,
+             metrics_file=metrics_file, metrics_interval=metrics_interval):
+    """
+    Generates the responses of the personas from `start_group` to `end_group`.
+
+    Args:
+        start_group (str, optional): First persona group; the first persona if empty.
+        end_group (str, optional): Last persona group; all remaining personas if empty.
+        shard (tuple, optional): (index, count) to only generate every count-th of the
+            selected personas, starting at index, e.g. on one of several machines.
+
+    The remaining arguments default to the settings at the top of this file.
+    """
+    # Test cases and validation
+    print("Starting Test Cases...")
+    if not os.path.exists(questions_file_path):
+        print("Error: CSV file not found at path:", questions_file_path)
+        sys.exit(1)
+
+    if not os.path.exists(persona_file_path):
+        print("Error: JSON file not found at path:", persona_file_path)
+        sys.exit(1)
+
+    if score_options and (adaptive_sampling or early_stopping):
+        print("Error: score_options cannot be combined with adaptive_sampling or early_stopping.")
+        sys.exit(1)
+
+    personas = load_personas(persona_file_path)
+    if not personas:
+        print("Error: No personas loaded from JSON file.")
+        sys.exit(1)
+
+    try:
+        filtered_personas = get_persona_by_group(personas, start_group, end_group)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+    if shard:
+        filtered_personas = get_persona_shard(filtered_personas, *shard)
+
+    response_cache = ResponseCache(response_cache_path)
+    telemetry = Telemetry(metrics_file or None, metrics_interval)
+    llm = CustomLLM(model=model, api_url=api_url, cache=response_cache, telemetry=telemetry,
+                    stream=stream, max_tokens=max_tokens, stop=stop_sequences)
+    llm.load_prompt_data(questions_file_path)
+
+    os.makedirs(responses_file_dir, exist_ok=True)
+
+    print("All test cases passed. Beginning response generation...")
+
+    # Generate responses for all personas, keeping up to `max_in_flight` requests in flight
+    # The answer parsing and evaluation code lives in Evaluations/
+    evaluations_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Evaluations")
+    if evaluations_dir not in sys.path:
+        sys.path.append(evaluations_dir)
+
+    sampler = None
+    if adaptive_sampling:
+        from eval_main import extract_numerical_value
+        sampler = AdaptiveSampler(extract_numerical_value, min_runs=min_runs, max_runs=num_runs)
+
+    streaming_evaluator = None
+    if early_stopping:
+        import pandas as pd
+        from streaming_eval import StreamingEvaluator
+        streaming_evaluator = StreamingEvaluator(pd.read_csv(survey_file_path))
+
+    scheduler = None
+    if endpoints:
+        scheduler = EndpointScheduler(build_endpoints(llm, endpoints))
+
+    engine = GenerationEngine(llm, max_in_flight=max_in_flight, batch_size=batch_size,
+                              on_answer=streaming_evaluator.on_answer if streaming_evaluator else None,
+                              stop_persona=streaming_evaluator.converged if streaming_evaluator else None,
+                              sampler=sampler, scheduler=scheduler, telemetry=telemetry,
+                              prefix_order=prefix_order, scoring=score_options)
+    telemetry.start()
+    try:
+        engine.run(filtered_personas, num_runs, responses_file_dir)
+    finally:
+        if scheduler is not None:
+            scheduler.close()
+        telemetry.close()
+    if streaming_evaluator:
+        streaming_evaluator.flush()
+
+
+if __name__ == "__main__":
+    # Get starting and ending group from the user (see cli.py to run without prompts)
+    start_group = input("Enter the starting persona group (or press Enter to start from the first): ").strip()
+    end_group = input("Enter the ending persona group (or press Enter to include all remaining): ").strip()
+
+    generate(start_group, end_group)
@@ -0,0 +1,42 @@
+import os
+import sys
+
+import pytest
+
+REPOSITORY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(os.path.join(REPOSITORY_DIR, "src", "research_case_agent_modeling", "Evaluations"))
+sys.path.append(os.path.join(REPOSITORY_DIR, "benchmarks"))
+
+from synthetic_data import generate_dataset, RESPONSES_DIR
+
+
+@pytest.fixture
+def dataset(tmp_path, monkeypatch):
+    """
+    Synthetic survey and responses with a run count other than the default of 50.
+    """
+    dataset = generate_dataset(str(tmp_path), respondents=200, groups=2, runs=10, questions=6)
+    monkeypatch.chdir(dataset["project_dir"])
+    dataset["dirs"] = {"responses_dir": RESPONSES_DIR, "cache_dir": str(tmp_path / "parsed")}
+    return dataset
+
+
+def test_bootstrap_reads_the_given_number_of_runs(dataset):
+    from bootstrap import bootstrap_groups
+
+    results = bootstrap_groups(dataset["survey_file"], dataset["group_conditions"], [], model_dir=dataset["model_dir"],
+                               num_runs=dataset["num_runs"], n_boot=20, output_file=None, max_workers=1,
+                               **dataset["dirs"])
+
+    assert set(results["Group"]) == set(dataset["group_conditions"])
+    assert (results["CI Low"] <= results["CI High"]).all()
+
+
+def test_model_comparison_reads_the_given_number_of_runs(dataset):
+    from model_comparison import compare_models
+
+    results = compare_models([dataset["model_dir"]], dataset["survey_file"], dataset["group_conditions"], [],
+                             output_file=None, max_workers=1, num_runs=dataset["num_runs"], **dataset["dirs"])
+
+    assert set(results["Group"]) == set(dataset["group_conditions"])
+    assert "Accuracy" in set(results["Metric"])
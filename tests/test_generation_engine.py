@@ -0,0 +1,99 @@
+import os
+import sys
+import json
+import time
+import threading
+
+import pytest
+
+REPOSITORY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(os.path.join(REPOSITORY_DIR, "src", "research_case_agent_modeling"))
+
+pytest.importorskip("requests")
+
+from llms_tuning.stub_server import start_stub_server
+from llms_tuning.llm_workflow import CustomLLM, CircuitBreaker
+from llms_tuning.generation_engine import GenerationEngine, persona_output_file
+from llms_tuning.adaptive_sampling import AdaptiveSampler
+
+QUESTIONS = [f"Q{i}" for i in range(8)]
+PERSONAS = [{"Group": f"Group {i}", "Persona Prompt": f"You are persona {i}."} for i in range(3)]
+
+
+@pytest.fixture
+def stub_llm(tmp_path):
+    """
+    A client of a stub server whose requests fail 40% of the time and are not retried
+    more than once, so that the engine sees failed answers.
+    """
+    server = start_stub_server(delay=0.001, fail_rate=0.4)
+    questions_file = tmp_path / "questions.csv"
+    with open(questions_file, "w") as f:
+        f.write("Custom_variable_name,Text,Characteristic,Value_labels\n")
+        for question in QUESTIONS:
+            f.write(f'{question},Question {question}?,"1,2,3,4","a,b,c,d"\n')
+    llm = CustomLLM(model="stub", api_url=f"http://127.0.0.1:{server.server_port}/api/generate",
+                    max_attempts=2, backoff_base=0.001, circuit_breaker=CircuitBreaker(failure_threshold=10 ** 6))
+    llm.load_prompt_data(str(questions_file))
+    yield llm
+    server.shutdown()
+
+
+def read_output(responses_dir, persona, num_runs):
+    with open(persona_output_file(responses_dir, persona["Group"], num_runs)) as f:
+        return json.load(f)
+
+
+def test_adaptive_sampling_retries_failed_runs(stub_llm, tmp_path):
+    responses_dir = f"{tmp_path}/responses/"
+    os.makedirs(responses_dir)
+    sampler = AdaptiveSampler(lambda response: int(response) if str(response).isdigit() else 0,
+                              min_runs=6, max_runs=6)
+
+    GenerationEngine(stub_llm, max_in_flight=4, fsync=False, sampler=sampler).run(PERSONAS[:1], 6, responses_dir)
+
+    # Failed requests do not use up the budget of a question, so every question gets all its runs
+    output = read_output(responses_dir, PERSONAS[0], 6)
+    assert list(output) == [f"Run_{run}" for run in range(1, 7)]
+    assert all(list(answers) == QUESTIONS for answers in output.values())
+
+
+def test_resumes_until_complete_with_bounded_requests(stub_llm, tmp_path):
+    responses_dir = f"{tmp_path}/responses/"
+    os.makedirs(responses_dir)
+
+    # Track the requests running at the same time
+    in_flight, peak, lock = [0], [0], threading.Lock()
+    generate_response = stub_llm.generate_response
+
+    def counting_generate_response(*args, **kwargs):
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+        try:
+            time.sleep(0.002)
+            return generate_response(*args, **kwargs)
+        finally:
+            with lock:
+                in_flight[0] -= 1
+    stub_llm.generate_response = counting_generate_response
+
+    answered = []
+    for _ in range(10):
+        GenerationEngine(stub_llm, max_in_flight=3, fsync=False).run(PERSONAS, 4, responses_dir)
+        outputs = [read_output(responses_dir, persona, 4) for persona in PERSONAS]
+        for earlier, output in zip(answered[-1] if answered else [], outputs):
+            # Resuming keeps every stored answer and only asks the missing ones
+            assert all(output[run_key][variable_name] == response
+                       for run_key, run_responses in earlier.items() for variable_name, response in run_responses.items())
+        answered.append(outputs)
+        if all(sum(map(len, output.values())) == 4 * len(QUESTIONS) for output in outputs):
+            break
+
+    assert len(answered) > 1, "the failing requests should have needed a resume"
+    assert 1 < peak[0] <= 3
+    for output in answered[-1]:
+        # Runs in numeric order and answers in question order, whatever order they arrived in
+        assert list(output) == [f"Run_{run}" for run in range(1, 5)]
+        assert all(list(run_responses) == QUESTIONS for run_responses in output.values())
+    assert not [name for name in os.listdir(responses_dir) if name.endswith(".jsonl")]
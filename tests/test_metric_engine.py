@@ -0,0 +1,124 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.stats import chisquare, kendalltau, spearmanr
+
+REPOSITORY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(os.path.join(REPOSITORY_DIR, "src", "research_case_agent_modeling", "Evaluations"))
+
+from metric_engine import group_metrics, kendall_tau_b_rows
+from sub_obj_eval import calculate_rank_correlation
+
+QUESTIONS = [f"F{i}" for i in range(1, 7)]
+
+
+def small_group():
+    """
+    Survey answers 1-5 and model answers 1-4 plus a category the survey never used,
+    with tied counts and questions that share only one answer.
+    """
+    rng = np.random.default_rng(0)
+    survey = pd.DataFrame({"Question": np.repeat(QUESTIONS, 40),
+                           "Survey_Response": rng.integers(1, 6, 40 * len(QUESTIONS)).astype(float)})
+    llm = pd.DataFrame({"Question": np.repeat(QUESTIONS, 12),
+                        "Response": rng.choice([1, 2, 3, 4, 6], 12 * len(QUESTIONS)).astype(float)})
+    llm.loc[llm["Question"] == "F5", "Response"] = [2.0] * 6 + [3.0] * 6
+    llm.loc[llm["Question"] == "F6", "Response"] = 6.0
+    llm.loc[(llm["Question"] == "F6").idxmax(), "Response"] = 1.0
+    return llm, survey
+
+
+# The per-question loops the vectorized metrics replaced
+def js_divergence(p, q):
+    p = np.array(p) + 1e-10
+    q = np.array(q) + 1e-10
+    m = 0.5 * (p + q)
+    kl = lambda a, b: np.sum(a * np.log(a / b))
+    return 0.5 * kl(p, m) + 0.5 * kl(q, m)
+
+
+def loop_group_metrics(llm_df_filtered_numeric, filtered_survey_df):
+    llm_freq = llm_df_filtered_numeric.groupby(["Question", "Response"]).size().unstack(fill_value=0)
+    llm_dist = llm_freq.div(llm_freq.sum(axis=1), axis=0)
+    survey_freq = filtered_survey_df.groupby(["Question", "Survey_Response"]).size().unstack(fill_value=0).fillna(0)
+    survey_dist = survey_freq.div(survey_freq.sum(axis=1), axis=0)
+
+    results = {}
+    for question in survey_dist.index:
+        observed = llm_dist.loc[question].fillna(0)
+        expected = survey_dist.loc[question].fillna(0)
+        all_indices = observed.index.union(expected.index)
+        observed = observed.reindex(all_indices, fill_value=0)
+        expected = expected.reindex(all_indices, fill_value=0)
+        expected[expected == 0] = 1e-10
+        chi_stat, p_value = chisquare(f_obs=observed, f_exp=expected)
+
+        p = llm_df_filtered_numeric[llm_df_filtered_numeric["Question"] == question].groupby(
+            "Response").size().reindex(survey_dist.columns, fill_value=0).values
+        q = survey_dist.loc[question].fillna(0).values
+        results[question] = {"Chi-Square": chi_stat, "chi p-value": p_value, "JS Divergence": js_divergence(p, q)}
+
+    llm_weighted = llm_df_filtered_numeric.groupby("Question")["Response"].mean()
+    survey_weighted = filtered_survey_df.groupby("Question")["Survey_Response"].mean()
+    common_questions = llm_weighted.index.intersection(survey_weighted.index)
+    correlation, p_value = spearmanr(llm_weighted.loc[common_questions].fillna(0),
+                                     survey_weighted.loc[common_questions].fillna(0))
+    return pd.DataFrame.from_dict(results, orient="index"), correlation, p_value
+
+
+def loop_rank_correlations(survey_data, llm_responses, matching_questions):
+    tau_scores = []
+    for question in matching_questions:
+        participant_response_counts = survey_data[survey_data["Question"] == question]["Survey_Response"].value_counts(
+            normalize=True)
+        participant_ranks = participant_response_counts.rank(ascending=False)
+        model_response_counts = llm_responses[llm_responses["Question"] == question]["Response"].value_counts(
+            normalize=True)
+        shared_responses = set(participant_response_counts.index).intersection(set(model_response_counts.index))
+        if shared_responses:
+            participant_rank_values = [participant_ranks[response] for response in shared_responses]
+            model_rank_values = [model_response_counts.rank(ascending=False)[response] for response in shared_responses]
+            tau, _ = kendalltau(participant_rank_values, model_rank_values)
+            tau_scores.append(tau)
+    return tau_scores
+
+
+def test_group_metrics_match_the_per_question_loop():
+    llm, survey = small_group()
+
+    per_question, correlation, p_value = group_metrics(llm, survey)
+    expected, expected_correlation, expected_p_value = loop_group_metrics(llm, survey)
+
+    pd.testing.assert_frame_equal(per_question, expected.loc[per_question.index], check_names=False, rtol=1e-9)
+    assert list(per_question.index) == QUESTIONS
+    assert np.isclose(correlation, expected_correlation)
+    assert np.isclose(p_value, expected_p_value)
+
+
+def test_kendall_tau_b_rows_match_scipy():
+    rng = np.random.default_rng(1)
+    x = rng.integers(1, 4, (50, 6)).astype(float)
+    y = rng.integers(1, 4, (50, 6)).astype(float)
+    mask = rng.random((50, 6)) > 0.3
+
+    taus = kendall_tau_b_rows(x, y, mask)
+
+    expected = [kendalltau(row_x[row_mask], row_y[row_mask])[0] if row_mask.sum() > 1 else np.nan
+                for row_x, row_y, row_mask in zip(x, y, mask)]
+    np.testing.assert_allclose(taus, expected, equal_nan=True)
+
+
+@pytest.mark.filterwarnings("ignore:One or more sample arguments is too small")
+def test_rank_correlation_matches_the_per_question_loop():
+    llm, survey = small_group()
+    questions = QUESTIONS[:4]
+
+    expected = loop_rank_correlations(survey, llm, questions)
+
+    assert np.isclose(calculate_rank_correlation(survey, llm, set(questions)), np.mean(expected))
+    # F6 shares a single answer with the survey, which has no tau in either version
+    assert np.isnan(calculate_rank_correlation(survey, llm, set(QUESTIONS)))
+    assert np.isnan(loop_rank_correlations(survey, llm, ["F6"])[0])
@@ -0,0 +1,84 @@
+import os
+import sys
+import json
+
+import pandas as pd
+import pytest
+
+REPOSITORY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(os.path.join(REPOSITORY_DIR, "src", "research_case_agent_modeling", "Evaluations"))
+sys.path.append(os.path.join(REPOSITORY_DIR, "benchmarks"))
+
+pytest.importorskip("matplotlib")
+pytest.importorskip("seaborn")
+
+import response_store
+from plot_pipeline import render_all
+from synthetic_data import generate_dataset, RESPONSES_DIR
+
+
+def test_cold_store_is_ingested_once(tmp_path, monkeypatch, capfd):
+    dataset = generate_dataset(str(tmp_path), respondents=200, groups=4, runs=5, questions=6)
+    monkeypatch.chdir(dataset["project_dir"])
+    response_store._loaded_stores.clear()
+
+    written = render_all(["box_model"], dataset["group_conditions"], num_runs=dataset["num_runs"],
+                         model_dir=dataset["model_dir"], specific_questions=[], max_workers=4,
+                         survey_file=dataset["survey_file"], excluded_questions=[],
+                         responses_dir=RESPONSES_DIR, cache_dir=str(tmp_path / "parsed"),
+                         stats_dir=str(tmp_path / "stats"), plots_dir=str(tmp_path / "plots"))
+
+    assert written == {"box_model": len(dataset["group_conditions"])}
+    ingested = [line for line in capfd.readouterr().out.splitlines() if line.startswith("Ingesting")]
+    assert len(ingested) == len(dataset["group_conditions"])
+    assert len(os.listdir(tmp_path / "plots" / "Box_plot_model")) == len(dataset["group_conditions"])
+
+
+def test_std_plot_model_leaves_out_unasked_runs(tmp_path):
+    from eval_main import std_plot_model
+
+    model_dir = tmp_path / "responses" / "model"
+    model_dir.mkdir(parents=True)
+    # Q2 stopped after two of four runs, like adaptive sampling does for stable questions
+    responses = {f"Run_{run}": {"Q1": str(run), **({"Q2": "3"} if run <= 2 else {})} for run in range(1, 5)}
+    with open(model_dir / "Group_4_LLM_Output.json", "w") as f:
+        json.dump(responses, f)
+    questions_file = tmp_path / "survey.csv"
+    questions_file.write_text("Q1,Q2\n1,2\n")
+    response_store._loaded_stores.clear()
+
+    std_plot_model(str(questions_file), ["F2"], 4, {"Group": {}}, "model", incremental=False,
+                   responses_dir=str(tmp_path / "responses"), cache_dir=str(tmp_path / "cache"),
+                   stats_dir=str(tmp_path / "stats"), plots_dir=str(tmp_path))
+
+    stats = pd.read_csv(tmp_path / "stats" / "std_model" / "model" / "standard_deviation_mean_Group_model_4.csv",
+                        index_col="Variable")
+    assert stats.loc["Q1", "Mean"] == 2.5
+    assert stats.loc["Q2", "Mean"] == 3
+    assert stats.loc["Q2", "Standard_Deviation"] == 0
+
+
+def test_std_plot_model_keeps_models_apart(tmp_path):
+    from eval_main import std_plot_model
+
+    questions_file = tmp_path / "survey.csv"
+    questions_file.write_text("Q1\n1\n")
+    for model, answer in [("model_a", "1"), ("model_b", "4")]:
+        (tmp_path / "responses" / model).mkdir(parents=True)
+        with open(tmp_path / "responses" / model / "Group_2_LLM_Output.json", "w") as f:
+            json.dump({f"Run_{run}": {"Q1": answer} for run in range(1, 3)}, f)
+    response_store._loaded_stores.clear()
+    dirs = dict(responses_dir=str(tmp_path / "responses"), cache_dir=str(tmp_path / "cache"),
+                stats_dir=str(tmp_path / "stats"), plots_dir=str(tmp_path / "plots"))
+
+    for model in ["model_a", "model_b"]:
+        std_plot_model(str(questions_file), [], 2, {"Group": {}}, model, **dirs)
+    plots = {model: tmp_path / "plots" / "std_model" / model / "standard_deviation_and_mean_Group_model_2.png"
+             for model in ["model_a", "model_b"]}
+    written = {model: plot.stat().st_mtime_ns for model, plot in plots.items()}
+    std_plot_model(str(questions_file), [], 2, {"Group": {}}, "model_a", **dirs)
+
+    # Each model has its own manifest, so the unchanged model_a is not plotted again
+    assert {model: plot.stat().st_mtime_ns for model, plot in plots.items()} == written
+    assert all((tmp_path / "stats" / "std_model" / model / "std_plot_model_2.manifest.json").exists()
+               for model in ["model_a", "model_b"])
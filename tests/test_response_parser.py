@@ -0,0 +1,54 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+REPOSITORY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(os.path.join(REPOSITORY_DIR, "src", "research_case_agent_modeling", "Evaluations"))
+
+from eval_main import extract_numerical_value
+from response_parser import check_parity, parse_response_series, parse_responses
+
+RESPONSES_DIR = os.path.join(REPOSITORY_DIR, "data", "3_responces")
+
+EDGE_CASES = [
+    ("3: Agree to some extent", 3),
+    ("1: Agree completely, 4: Disagree", 2),
+    ("0: Not at all", 0),
+    ("13: out of range, then 2: in range", 2),
+    ("Category 5", 5),
+    ("Category 15, Option 4", 4),
+    ("Option 12", 12),
+    ("  7  ", 7),
+    ("13", 0),
+    ("I would say 3 or 4", 4),
+    ("I don't know", 0),
+    ("", 0),
+    ("nan", 0),
+    ("١٢", 12),
+]
+
+
+@pytest.mark.skipif(not os.path.isdir(RESPONSES_DIR), reason="no stored responses")
+def test_parity_on_stored_responses():
+    assert check_parity(RESPONSES_DIR) == []
+
+
+@pytest.mark.parametrize("response, expected", EDGE_CASES)
+def test_edge_cases_match_extract_numerical_value(response, expected):
+    assert extract_numerical_value(response) == expected
+    assert parse_response_series(pd.Series([response])).tolist() == [expected]
+
+
+def test_missing_and_non_string_cells():
+    data = pd.DataFrame({"Run_1": ["2: Agree", np.nan, None], "Run_2": [4, 3.0, "Option 20"]},
+                        index=["F1", "F2", "F3"])
+    expected = data.map(extract_numerical_value)
+
+    parsed = parse_responses(data)
+
+    assert parsed.equals(expected.astype(int))
+    assert parsed.loc["F2", "Run_1"] == 0
+    assert parsed.loc["F3", "Run_1"] == 0
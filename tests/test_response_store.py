@@ -0,0 +1,89 @@
+import os
+import sys
+import json
+
+import pandas as pd
+import pytest
+
+REPOSITORY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(os.path.join(REPOSITORY_DIR, "src", "research_case_agent_modeling", "Evaluations"))
+
+import response_store
+
+
+@pytest.fixture(params=["pickle", "feather"])
+def store_format(request, monkeypatch):
+    if request.param == "feather":
+        pytest.importorskip("pyarrow")
+    monkeypatch.setattr(response_store, "STORE_FORMAT", request.param)
+    response_store._loaded_stores.clear()
+    return request.param
+
+
+def test_missing_cells_count_as_zero(tmp_path, store_format):
+    model_dir = tmp_path / "responses" / "model"
+    model_dir.mkdir(parents=True)
+    responses = {"Run_1": {"F1": "2: Agree", "F2": "4: Disagree"}, "Run_2": {"F1": "3: Neither"}}
+    with open(model_dir / "Group_2_LLM_Output.json", "w") as f:
+        json.dump(responses, f)
+
+    kwargs = {"responses_dir": str(tmp_path / "responses"), "cache_dir": str(tmp_path / "cache")}
+    for _ in range(2):
+        # Ingested, then read back from the store on disk
+        response_store._loaded_stores.clear()
+        values = response_store.load_group_frame("model", "Group", 2, **kwargs)
+        raw = response_store.load_group_frame("model", "Group", 2, values="raw", **kwargs)
+
+        assert values.loc["F2", "Run_2"] == 0
+        assert values.loc["F1"].tolist() == [2, 3]
+        assert pd.isna(raw.loc["F2", "Run_2"])
+    assert any(name.endswith(f".{store_format}") for name in os.listdir(tmp_path / "cache"))
+
+
+def test_interrupted_write_keeps_previous_store(tmp_path, store_format, monkeypatch):
+    model_dir = tmp_path / "responses" / "model"
+    model_dir.mkdir(parents=True)
+    with open(model_dir / "Group_1_LLM_Output.json", "w") as f:
+        json.dump({"Run_1": {"F1": "2: Agree"}}, f)
+    kwargs = {"responses_dir": str(tmp_path / "responses"), "cache_dir": str(tmp_path / "cache")}
+    response_store.load_model_store("model", **kwargs)
+    _, store_path, manifest_path = response_store._store_paths("model", kwargs["responses_dir"], kwargs["cache_dir"])
+    with open(store_path, "rb") as f:
+        stored = f.read()
+    with open(manifest_path) as f:
+        manifest = f.read()
+
+    with open(model_dir / "Other_1_LLM_Output.json", "w") as f:
+        json.dump({"Run_1": {"F1": "3: Neither"}}, f)
+
+    def interrupted(store, path, **kwargs):
+        # Killed halfway through writing the file
+        with open(path, "wb") as f:
+            f.write(stored[:len(stored) // 2])
+        raise KeyboardInterrupt
+    monkeypatch.setattr(pd.DataFrame, "to_feather" if store_format == "feather" else "to_pickle", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        response_store.load_model_store("model", **kwargs)
+
+    with open(store_path, "rb") as f:
+        assert f.read() == stored
+    with open(manifest_path) as f:
+        assert f.read() == manifest
+    assert not [name for name in os.listdir(tmp_path / "cache") if name.endswith(".tmp")]
+
+
+def test_skip_missing_leaves_out_unasked_runs(tmp_path, store_format):
+    model_dir = tmp_path / "responses" / "model"
+    model_dir.mkdir(parents=True)
+    # F2 was only asked in the first run, e.g. by adaptive sampling
+    responses = {"Run_1": {"F1": "2: Agree", "F2": "4: Disagree"}, "Run_2": {"F1": "no idea"}}
+    with open(model_dir / "Group_2_LLM_Output.json", "w") as f:
+        json.dump(responses, f)
+
+    values = response_store.load_group_frame("model", "Group", 2, responses_dir=str(tmp_path / "responses"),
+                                             cache_dir=str(tmp_path / "cache"), skip_missing=True)
+
+    assert pd.isna(values.loc["F2", "Run_2"])
+    # Unparseable answers are still 0
+    assert values.loc["F1"].tolist() == [2, 0]
+    assert values.loc["F2"].mean() == 4
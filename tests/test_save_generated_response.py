@@ -0,0 +1,124 @@
+import os
+import sys
+import json
+import time
+import signal
+import subprocess
+
+import pytest
+
+REPOSITORY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SOURCE_DIR = os.path.join(REPOSITORY_DIR, "src", "research_case_agent_modeling")
+sys.path.append(SOURCE_DIR)
+
+from llms_tuning.save_generated_response import (
+    ResponseLog, load_response_log, compact_response_log, response_log_path
+)
+
+QUESTIONS = [f"Q{i}" for i in range(6)]
+NUM_RUNS = 5
+
+# Generates one persona against the endpoint given as first argument
+GENERATE = """
+import sys
+sys.path.insert(0, {source_dir!r})
+from llms_tuning.llm_workflow import CustomLLM
+from llms_tuning.generation_engine import GenerationEngine
+
+llm = CustomLLM(model="stub", api_url=sys.argv[1])
+llm.load_prompt_data({questions_file!r})
+GenerationEngine(llm, max_in_flight=2).run([{{"Group": "Group A", "Persona Prompt": "You are A."}}], {num_runs}, {responses_dir!r})
+"""
+
+
+def test_torn_last_line_is_skipped_and_terminated(tmp_path):
+    log_file = str(tmp_path / "Group_2_LLM_Output.jsonl")
+    log = ResponseLog(log_file, group="Group", fsync=False)
+    log.append("Run_1", "F1", "2: Agree")
+    log.close()
+    with open(log_file, "a") as f:
+        f.write('{"group": "Group", "run": "Run_1", "variable": "F2", "resp')
+
+    assert load_response_log(log_file) == {"Run_1": {"F1": "2: Agree"}}
+
+    log = ResponseLog(log_file, group="Group", fsync=False)
+    log.append("Run_2", "F1", "3: Neither")
+    log.close()
+    assert load_response_log(log_file) == {"Run_1": {"F1": "2: Agree"}, "Run_2": {"F1": "3: Neither"}}
+
+
+def test_killed_run_resumes_from_its_log(tmp_path):
+    pytest.importorskip("requests")
+    from llms_tuning.stub_server import start_stub_server
+    from llms_tuning.llm_workflow import CustomLLM
+    from llms_tuning.generation_engine import GenerationEngine, persona_output_file
+
+    server = start_stub_server(delay=0.02)
+    api_url = f"http://127.0.0.1:{server.server_port}/api/generate"
+    questions_file = str(tmp_path / "questions.csv")
+    with open(questions_file, "w") as f:
+        f.write("Custom_variable_name,Text,Characteristic,Value_labels\n")
+        for question in QUESTIONS:
+            f.write(f'{question},Question {question}?,"1,2,3,4","a,b,c,d"\n')
+    responses_dir = f"{tmp_path}/responses/"
+    os.makedirs(responses_dir)
+    output_file = persona_output_file(responses_dir, "Group A", NUM_RUNS)
+    log_file = response_log_path(output_file)
+
+    script = GENERATE.format(source_dir=SOURCE_DIR, questions_file=questions_file, num_runs=NUM_RUNS,
+                             responses_dir=responses_dir)
+    process = subprocess.Popen([sys.executable, "-c", script, api_url], stdout=subprocess.DEVNULL)
+    try:
+        # Kill the run once it has checkpointed some, but not all, answers
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline and process.poll() is None:
+            if sum(map(len, load_response_log(log_file).values())) >= 8:
+                break
+            time.sleep(0.01)
+        assert process.poll() is None, "the run finished before it could be killed"
+        process.send_signal(signal.SIGKILL)
+        process.wait()
+    finally:
+        if process.poll() is None:
+            process.kill()
+
+    assert not os.path.exists(output_file)
+    checkpointed = load_response_log(log_file)
+    assert 8 <= sum(map(len, checkpointed.values())) < NUM_RUNS * len(QUESTIONS)
+
+    llm = CustomLLM(model="stub", api_url=api_url)
+    llm.load_prompt_data(questions_file)
+    # Requests of the killed run that the server was still answering
+    time.sleep(0.2)
+    served = server.RequestHandlerClass.requests_served
+    GenerationEngine(llm, max_in_flight=2, fsync=False).run([{"Group": "Group A", "Persona Prompt": "You are A."}],
+                                                            NUM_RUNS, responses_dir)
+    server.shutdown()
+
+    with open(output_file) as f:
+        output = json.load(f)
+    # Every checkpointed answer is kept and only the missing ones were asked again
+    assert all(output[run_key][variable_name] == response
+               for run_key, run_responses in checkpointed.items() for variable_name, response in run_responses.items())
+    assert sum(map(len, output.values())) == NUM_RUNS * len(QUESTIONS)
+    assert server.RequestHandlerClass.requests_served - served == NUM_RUNS * len(QUESTIONS) - sum(
+        map(len, checkpointed.values()))
+    assert not os.path.exists(log_file)
+
+
+def test_compaction_keeps_every_answer(tmp_path):
+    output_file = str(tmp_path / "Group_2_LLM_Output.json")
+    with open(output_file, "w") as f:
+        json.dump({"Run_1": {"F1": "1: Yes", "F2": "2: No"}}, f)
+    log = ResponseLog(response_log_path(output_file), group="Group", fsync=False)
+    log.append("Run_1", "F3", "3: Maybe")
+    log.append("Run_2", "F1", "4: Never")
+    log.close()
+
+    with open(output_file) as f:
+        responses = load_response_log(response_log_path(output_file), json.load(f))
+    compact_response_log(responses, output_file)
+
+    with open(output_file) as f:
+        assert json.load(f) == {"Run_1": {"F1": "1: Yes", "F2": "2: No", "F3": "3: Maybe"}, "Run_2": {"F1": "4: Never"}}
+    assert not os.path.exists(response_log_path(output_file))